@@ -30,6 +30,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pcb_tracker.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +58,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'pcb_tracker.context_processors.roles',
             ],
         },
     },
@@ -119,4 +121,25 @@ STATIC_URL = '/static/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# Columnar measurement snapshots read by analytics through numpy.memmap
+# (written by the refresh_snapshots management command)
+MEASUREMENT_SNAPSHOT_DIR = os.environ.get('MEASUREMENT_SNAPSHOT_DIR', BASE_DIR / 'snapshots')
+
+# List pages: 'cursor' pages by key (no OFFSET or COUNT(*)), 'offset' keeps numbered pages
+LIST_PAGINATION = os.environ.get('LIST_PAGINATION', 'cursor')
+# With cursor pages, show PostgreSQL's row estimate as the list size
+LIST_PAGINATION_ESTIMATE_COUNT = True
+
+# Attachment downloads: unset streams through Django; 'x-accel-redirect' (nginx)
+# or 'x-sendfile' (Apache mod_xsendfile) lets the web server send the file
+ATTACHMENT_SENDFILE = os.environ.get('ATTACHMENT_SENDFILE') or None
+# nginx 'internal' location aliased to the media directory
+ATTACHMENT_ACCEL_PREFIX = os.environ.get('ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+
+# Request metrics served at /metrics: with several worker processes they need a
+# directory to share their figures through (gunicorn.conf.py sets one)
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+# Bearer token that lets a scraper read /metrics without a staff login; unset
+# leaves it to staff users
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
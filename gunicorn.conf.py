@@ -0,0 +1,36 @@
+# Production server: gunicorn supervising uvicorn workers that run MilQual.asgi.
+# Start with: gunicorn -c gunicorn.conf.py MilQual.asgi:application
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# One event loop per core; async views keep serving while their queries
+# wait, so more workers than cores only adds memory
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+# Long report downloads and dossier exports stream for a while (through
+# async iterators, see downloads.stream_response)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+# Each worker writes its request metrics here and /metrics adds them up
+os.environ.setdefault('METRICS_DIR', '/tmp/milqual-metrics')
+
+
+def on_starting(server):
+    # Figures left by a previous run would be added to this one's
+    directory = os.environ['METRICS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith('metrics-'):
+            os.unlink(os.path.join(directory, name))
@@ -26,7 +26,7 @@ class TestMeasurementAdmin(admin.ModelAdmin):
 
 @admin.register(FileAttachment)
 class FileAttachmentAdmin(admin.ModelAdmin):
-    list_display = ['file_type', 'pcb', 'uploaded_by', 'upload_date']
+    list_display = ['original_name', 'file_type', 'pcb', 'uploaded_by', 'upload_date']
     list_filter = ['file_type', 'upload_date', 'uploaded_by']
     search_fields = ['pcb__serial_number', 'description']
 
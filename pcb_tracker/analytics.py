@@ -0,0 +1,175 @@
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .models import PCB, Batch, TestMeasurement
+
+
+# Every board is grouped by its PCB's batch and type and by the test config
+# and tester of its first test run
+DIMENSIONS = {
+    'batch': 'batch_id',
+    'pcb_type': 'pcb_type_id',
+    'test_config': 'test_config_id',
+    'tester': 'tester_id',
+}
+
+YIELD_CACHE_TIMEOUT = getattr(settings, 'YIELD_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _stats(boards, first_pass, final_pass, retested, tests):
+    """Turn raw per-group counts into the yield figures shown to users"""
+    return {
+        'boards': boards,
+        'tests': tests,
+        'first_pass': first_pass,
+        'final_pass': final_pass,
+        'retested': retested,
+        'first_pass_yield': first_pass / boards if boards else None,
+        'final_yield': final_pass / boards if boards else None,
+        'retest_rate': retested / boards if boards else None,
+    }
+
+
+def _yields_sql(dimension, batch_ids):
+    """
+    Compute yields with window functions in one statement.
+
+    ROW_NUMBER() picks each board's first and latest run and COUNT() OVER
+    its number of runs; the boards are then aggregated per group.
+    """
+    column = DIMENSIONS[dimension]
+    where = ''
+    params = []
+    if batch_ids is not None:
+        where = 'WHERE p.batch_id = ANY(%s)'
+        params.append(list(batch_ids))
+    sql = f'''
+        WITH runs AS (
+            SELECT m.pcb_id, p.batch_id, b.pcb_type_id, m.test_config_id, m.tester_id, m.verdict,
+                   ROW_NUMBER() OVER (PARTITION BY m.pcb_id ORDER BY m.test_date, m.id) AS attempt,
+                   ROW_NUMBER() OVER (PARTITION BY m.pcb_id ORDER BY m.test_date DESC, m.id DESC) AS latest,
+                   COUNT(*) OVER (PARTITION BY m.pcb_id) AS attempts
+            FROM {TestMeasurement._meta.db_table} m
+            JOIN {PCB._meta.db_table} p ON p.id = m.pcb_id
+            JOIN {Batch._meta.db_table} b ON b.id = p.batch_id
+            {where}
+        ), boards AS (
+            SELECT pcb_id,
+                   MAX(batch_id) AS batch_id,
+                   MAX(pcb_type_id) AS pcb_type_id,
+                   MAX(CASE WHEN attempt = 1 THEN test_config_id END) AS test_config_id,
+                   MAX(CASE WHEN attempt = 1 THEN tester_id END) AS tester_id,
+                   BOOL_OR(attempt = 1 AND verdict = 'pass') AS first_pass,
+                   BOOL_OR(latest = 1 AND verdict = 'pass') AS final_pass,
+                   MAX(attempts) AS attempts
+            FROM runs
+            GROUP BY pcb_id
+        )
+        SELECT {column}, COUNT(*), SUM(first_pass::int), SUM(final_pass::int),
+               SUM((attempts > 1)::int), SUM(attempts)::bigint
+        FROM boards
+        GROUP BY {column}
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {
+            key: _stats(boards, first_pass, final_pass, retested, tests)
+            for key, boards, first_pass, final_pass, retested, tests in cursor.fetchall()
+        }
+
+
+def _yields_numpy(dimension, batch_ids):
+    """
+    Same figures for backends without the PostgreSQL path (SQLite in
+    development): runs are read in board order and grouped with NumPy.
+    """
+    runs = TestMeasurement.objects.all()
+    if batch_ids is not None:
+        runs = runs.filter(pcb__batch_id__in=batch_ids)
+    rows = list(
+        runs.order_by('pcb_id', 'test_date', 'id')
+        .values_list('pcb_id', 'pcb__batch_id', 'pcb__batch__pcb_type_id', 'test_config_id', 'tester_id', 'verdict')
+    )
+    if not rows:
+        return {}
+
+    columns = list(zip(*rows))
+    pcb_ids = np.array(columns[0], dtype=np.int64)
+    passed = np.array(columns[5], dtype=object) == 'pass'
+    first = np.flatnonzero(np.r_[True, pcb_ids[1:] != pcb_ids[:-1]])
+    last = np.r_[first[1:] - 1, len(pcb_ids) - 1]
+    attempts = last - first + 1
+
+    index = list(DIMENSIONS).index(dimension) + 1
+    # Missing keys (no PCB type, no test config) are grouped under -1
+    keys = np.array([-1 if value is None else value for value in columns[index]], dtype=np.int64)[first]
+    groups, inverse = np.unique(keys, return_inverse=True)
+    size = len(groups)
+    boards = np.bincount(inverse, minlength=size)
+    first_pass = np.bincount(inverse, weights=passed[first], minlength=size)
+    final_pass = np.bincount(inverse, weights=passed[last], minlength=size)
+    retested = np.bincount(inverse, weights=attempts > 1, minlength=size)
+    tests = np.bincount(inverse, weights=attempts, minlength=size)
+
+    return {
+        (None if key == -1 else int(key)): _stats(int(boards[i]), int(first_pass[i]), int(final_pass[i]), int(retested[i]), int(tests[i]))
+        for i, key in enumerate(groups.tolist())
+    }
+
+
+def yield_stats(dimension, batch_ids=None):
+    """
+    Return {group id: figures} of first-pass yield, final yield and retest
+    rate for one of DIMENSIONS, optionally limited to some batches.
+
+    First-pass yield is the share of boards whose first run passed, final
+    yield the share whose latest run passed and retest rate the share that
+    was tested more than once.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f'Unknown dimension "{dimension}"')
+    if connection.vendor == 'postgresql':
+        return _yields_sql(dimension, batch_ids)
+    return _yields_numpy(dimension, batch_ids)
+
+
+def _cache_key(batch):
+    version = batch.results_updated_at.timestamp() if batch.results_updated_at else 0
+    return f'pcb_tracker:batch_yield:{batch.id}:{version}'
+
+
+def batch_yields(batches):
+    """
+    Return {batch id: figures} for Batch instances, from the cache where
+    possible. Keys carry each batch's results_updated_at, so new results in
+    a batch make its entry a miss in every process. All misses are computed
+    together with a single yield_stats call.
+    """
+    keys = {batch.id: _cache_key(batch) for batch in batches}
+    cached = cache.get_many(keys.values())
+    yields = {batch_id: cached[key] for batch_id, key in keys.items() if key in cached}
+    missing = [batch_id for batch_id in keys if batch_id not in yields]
+    if missing:
+        computed = yield_stats('batch', missing)
+        fresh = {}
+        for batch_id in missing:
+            yields[batch_id] = fresh[keys[batch_id]] = computed.get(batch_id, _stats(0, 0, 0, 0, 0))
+        cache.set_many(fresh, YIELD_CACHE_TIMEOUT)
+    return yields
+
+
+def touch_batches(batches):
+    """
+    Mark the results of a Batch queryset (or batch ids) as changed, once the
+    current transaction commits. The batch rows are written outside it, so
+    stations submitting boards of the same batch do not queue on them while
+    they hold their PCB row locks.
+    """
+    # Resolved now: the rows a queryset matches may be deleted by then
+    batch_ids = list(batches.values_list('id', flat=True)) if isinstance(batches, QuerySet) else list(batches)
+    if batch_ids:
+        transaction.on_commit(lambda: Batch.objects.filter(id__in=batch_ids).update(results_updated_at=timezone.now()))
@@ -7,4 +7,5 @@ class PcbTrackerConfig(AppConfig):
     
     def ready(self):
         import pcb_tracker.signals  # Import signals if we have any
-        from . import signals  # Import the signals module
\ No newline at end of file
+        from . import signals  # Import the signals module
+        from . import metrics  # Counts queries on every new database connection
\ No newline at end of file
@@ -0,0 +1,148 @@
+import re
+
+from django.db import transaction
+
+from .models import PCB, Module
+from .counters import adjust_counters
+from .workflow import pcb_workflow
+
+
+# Upper bound on the number of modules assembled from one CSV upload
+MAX_MODULES_PER_UPLOAD = 1000
+
+MODULE_HEADERS = {'module_serial_number', 'module serial number', 'module'}
+PCB_HEADERS = {'pcb_serial_number', 'pcb serial number', 'pcb_serial', 'pcb'}
+NOTES_HEADERS = {'notes'}
+
+
+def parse_serials(text):
+    """Split serial numbers separated by newlines, commas or semicolons"""
+    return [serial.strip() for serial in re.split(r'[\n,;]', text) if serial.strip()]
+
+
+def assemble_modules(requests, assembler):
+    """
+    Assemble many modules from QA verified PCBs in one transaction.
+
+    Each request is a dict with "module_serial_number", "pcb_serials" and
+    optional "notes". Every PCB of every request is checked and locked with a
+    single serial_number__in query, modules and their M2M rows are written
+    with one bulk insert each and all PCB statuses are flipped with one
+    conditional UPDATE. Returns one report dict per request, in order.
+    """
+    report = [
+        {'module_serial_number': request['module_serial_number'], 'status': 'error', 'errors': []}
+        for request in requests
+    ]
+    all_serials = {serial for request in requests for serial in request['pcb_serials']}
+
+    with transaction.atomic():
+        pcbs = {
+            pcb.serial_number: pcb
+            for pcb in PCB.objects.select_for_update().filter(serial_number__in=all_serials).only('id', 'serial_number', 'status')
+        }
+        existing_modules = set(
+            Module.objects.filter(
+                module_serial_number__in=[request['module_serial_number'] for request in requests]
+            ).values_list('module_serial_number', flat=True)
+        )
+
+        accepted = []
+        claimed_modules = set()
+        claimed_pcbs = set()
+        for request, result in zip(requests, report):
+            errors = result['errors']
+            module_serial = request['module_serial_number']
+            serials = request['pcb_serials']
+
+            if module_serial in existing_modules or module_serial in claimed_modules:
+                errors.append(f'Module {module_serial} already exists.')
+            if not serials:
+                errors.append('At least one PCB serial number is required.')
+            if len(set(serials)) != len(serials):
+                errors.append('The same PCB is listed more than once.')
+            for serial in serials:
+                pcb = pcbs.get(serial)
+                if pcb is None:
+                    errors.append(f'PCB with serial number {serial} does not exist.')
+                elif pcb.status != 'qa_verified':
+                    errors.append(f'PCB {serial} is not ready for assembly. Status: {pcb.status}')
+                elif serial in claimed_pcbs:
+                    errors.append(f'PCB {serial} is already used by another module in this submission.')
+            if errors:
+                continue
+
+            claimed_modules.add(module_serial)
+            claimed_pcbs.update(serials)
+            accepted.append((result, request))
+
+        if not accepted:
+            return report
+
+        modules = Module.objects.bulk_create([
+            Module(
+                module_serial_number=request['module_serial_number'],
+                assembler=assembler,
+                notes=request.get('notes') or ''
+            )
+            for result, request in accepted
+        ])
+        adjust_counters('module', {(None, 'assembled'): len(modules)})
+
+        Through = Module.pcbs.through
+        Through.objects.bulk_create([
+            Through(module_id=module.id, pcb_id=pcbs[serial].id)
+            for module, (result, request) in zip(modules, accepted)
+            for serial in request['pcb_serials']
+        ])
+
+        pcb_ids = [pcbs[serial].id for result, request in accepted for serial in request['pcb_serials']]
+        # The rows are locked, so the conditional update must hit every one of them
+        updated = pcb_workflow.bulk_transition(pcb_ids, 'qa_verified', 'assembled')
+        if updated != len(pcb_ids):
+            raise RuntimeError('PCB status changed while the rows were locked')
+
+        for module, (result, request) in zip(modules, accepted):
+            result['status'] = 'ok'
+            result['module'] = module
+            del result['errors']
+
+    return report
+
+
+def read_assembly_csv(rows):
+    """
+    Group rows of (module serial, PCB serial[, notes]) into assembly requests.
+
+    The first row is the header. Rows for the same module do not need to be
+    adjacent; the notes of the first row that has any are used.
+    """
+    rows = iter(rows)
+    header = [str(label or '').strip().lower() for label in next(rows, [])]
+    try:
+        module_column = next(i for i, label in enumerate(header) if label in MODULE_HEADERS)
+        pcb_column = next(i for i, label in enumerate(header) if label in PCB_HEADERS)
+    except StopIteration:
+        raise ValueError('The header row needs "module_serial_number" and "pcb_serial_number" columns.')
+    notes_column = next((i for i, label in enumerate(header) if label in NOTES_HEADERS), None)
+
+    requests = {}
+    for row in rows:
+        row = list(row) + [None] * (len(header) - len(row))
+        module_serial = str(row[module_column] or '').strip()
+        pcb_serial = str(row[pcb_column] or '').strip()
+        if not module_serial and not pcb_serial:
+            continue
+        if not module_serial:
+            raise ValueError(f'PCB {pcb_serial} has no module serial number.')
+        request = requests.get(module_serial)
+        if request is None:
+            if len(requests) >= MAX_MODULES_PER_UPLOAD:
+                raise ValueError(f'At most {MAX_MODULES_PER_UPLOAD} modules can be assembled from one file.')
+            request = requests[module_serial] = {'module_serial_number': module_serial, 'pcb_serials': [], 'notes': ''}
+        if pcb_serial:
+            request['pcb_serials'].append(pcb_serial)
+        if notes_column is not None and not request['notes']:
+            request['notes'] = str(row[notes_column] or '').strip()
+
+    return list(requests.values())
@@ -0,0 +1,169 @@
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from . import urls
+from .models import PCB, FileAttachment, Module, ParameterMeasurement, TestMeasurement, TestParameter
+
+
+# Groups of the benchmark user, so every view renders its full page
+BENCHMARK_GROUPS = [
+    'pcb_testing', 'Environmental_tester_lvl1', 'production_summary', 'pcb_manager', 'batch_manager',
+    'test_config_manager', 'manage_pcb_type', 'Manager_lvl1', 'Manager_lvl2',
+]
+
+# Views left out by default: they only accept writes or report on the benchmark itself
+BENCHMARK_EXCLUDED = {'upload_start', 'upload_session', 'upload_complete', 'metrics'}
+
+# A slower median only counts as a regression above this many milliseconds
+BENCHMARK_NOISE_MS = 5.0
+
+
+def benchmark_user(username='benchmark'):
+    """A staff user in every group the permission checks look at"""
+    user, created = User.objects.get_or_create(username=username, defaults={'is_staff': True})
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+    user.groups.add(*[Group.objects.get_or_create(name=name)[0] for name in BENCHMARK_GROUPS])
+    return user
+
+
+def sample_arguments():
+    """
+    Values for the URL parameters: a recently tested board (the most
+    complete page) and the objects around it. A parameter without a
+    sample is left out, and so are the URLs that need it.
+    """
+    pcb = PCB.objects.filter(measurements__isnull=False).order_by('-id').first() or PCB.objects.order_by('-id').first()
+    arguments = {}
+    if pcb is not None:
+        arguments['pcb_id'] = pcb.id
+        arguments['kind'] = 'batch'
+        arguments['object_id'] = pcb.batch_id
+        if pcb.test_config_id:
+            arguments['test_config_id'] = pcb.test_config_id
+            parameter = TestParameter.objects.filter(test_config_id=pcb.test_config_id).order_by('order', 'id').first()
+            if parameter is not None:
+                arguments['parameter_id'] = parameter.id
+    attachment = FileAttachment.objects.order_by('-id').first()
+    if attachment is not None:
+        arguments['attachment_id'] = attachment.id
+    return arguments
+
+
+def benchmark_targets(arguments, excluded=BENCHMARK_EXCLUDED):
+    """[(url name, url or None, reason)] for every named pattern of pcb_tracker/urls.py"""
+    targets = []
+    for pattern in urls.urlpatterns:
+        name = pattern.name
+        if not name or name in excluded:
+            continue
+        needed = list(pattern.pattern.converters)
+        missing = [argument for argument in needed if argument not in arguments]
+        if missing:
+            targets.append((name, None, f'no sample for {", ".join(missing)}'))
+            continue
+        try:
+            targets.append((name, reverse(name, kwargs={argument: arguments[argument] for argument in needed}), None))
+        except NoReverseMatch as e:
+            targets.append((name, None, str(e)))
+    return targets
+
+
+def _count_queries(counter):
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def time_url(client, url, repeat=5, warmup=1):
+    """
+    GET url warmup + repeat times and return the timings of the last
+    repeat requests (milliseconds), their largest query count, the status
+    code and the body size. Streamed bodies are read in full and timed.
+    """
+    timings = []
+    queries = 0
+    for attempt in range(warmup + repeat):
+        counter = [0]
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_count_queries(counter)))
+            start = time.perf_counter()
+            response = client.get(url)
+            size = sum(len(chunk) for chunk in response.streaming_content) if response.streaming else len(response.content)
+            elapsed = (time.perf_counter() - start) * 1000
+        if attempt >= warmup:
+            timings.append(elapsed)
+            queries = max(queries, counter[0])
+    timings.sort()
+    return {
+        'url': url,
+        'status': response.status_code,
+        'bytes': size,
+        'queries': queries,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def run_benchmark(user, repeat=5, warmup=1, excluded=BENCHMARK_EXCLUDED, progress=None):
+    """
+    Time every view of pcb_tracker/urls.py through the test client, logged
+    in as user, and return a JSON-serializable report. progress is called
+    with (name, result) after each view.
+    """
+    client = Client()
+    client.force_login(user)
+    results = {}
+    # The test client's host name may not be allowed by the real settings
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name, url, reason in benchmark_targets(sample_arguments(), excluded):
+            results[name] = {'skipped': reason} if url is None else time_url(client, url, repeat, warmup)
+            if progress:
+                progress(name, results[name])
+    return {
+        'created_at': timezone.now().isoformat(),
+        'database': connections['default'].vendor,
+        'debug': settings.DEBUG,
+        'repeat': repeat,
+        'rows': {
+            'pcbs': PCB.objects.count(),
+            'test_measurements': TestMeasurement.objects.count(),
+            'parameter_measurements': ParameterMeasurement.objects.count(),
+            'modules': Module.objects.count(),
+        },
+        'views': results,
+    }
+
+
+def compare_reports(baseline, current, tolerance=0.2, noise_ms=BENCHMARK_NOISE_MS):
+    """
+    Regressions of current against baseline, as (view, message): more
+    queries, or a median slower by more than tolerance and noise_ms.
+    Views missing from either report are not compared.
+    """
+    regressions = []
+    for name, result in sorted(current['views'].items()):
+        before = baseline.get('views', {}).get(name)
+        if not before or 'skipped' in before or 'skipped' in result:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append((name, f'{before["queries"]} -> {result["queries"]} queries'))
+        slower = result['median_ms'] - before['median_ms']
+        if slower > noise_ms and result['median_ms'] > before['median_ms'] * (1 + tolerance):
+            regressions.append((name, f'median {before["median_ms"]:.1f} -> {result["median_ms"]:.1f} ms'))
+        if result['status'] != before['status']:
+            regressions.append((name, f'status {before["status"]} -> {result["status"]}'))
+    return regressions
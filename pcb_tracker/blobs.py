@@ -0,0 +1,150 @@
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Blob, FileAttachment
+from .storage import BLOB_PREFIX, blob_digest, blob_name
+
+
+# Unreferenced blobs (and stray files) younger than this are kept, so an
+# upload that has just reused a blob is never swept before it commits
+DEFAULT_GRACE = timedelta(hours=24)
+
+
+def adjust_blob_refs(deltas):
+    """
+    Apply {digest: delta} to the blob reference counts.
+
+    Called from the FileAttachment signals inside the transaction that
+    saves or deletes the attachment. A missing Blob row is created on first
+    use, with the size of the stored file.
+    """
+    storage = FileAttachment._meta.get_field('file').storage
+    for digest, delta in sorted((digest, delta) for digest, delta in deltas.items() if digest is not None):
+        if not delta:
+            continue
+        rows = Blob.objects.filter(digest=digest)
+        if rows.update(ref_count=F('ref_count') + delta):
+            continue
+        name = blob_name(digest)
+        size = storage.size(name) if storage.exists(name) else 0
+        try:
+            with transaction.atomic():
+                Blob.objects.create(digest=digest, size=size, ref_count=delta)
+        except IntegrityError:
+            # Another transaction created the row first
+            rows.update(ref_count=F('ref_count') + delta)
+
+
+def actual_refs():
+    """Count the attachments pointing at each blob"""
+    counts = Counter()
+    for name in FileAttachment.objects.filter(file__startswith=f'{BLOB_PREFIX}/').values_list('file', flat=True).iterator():
+        counts[blob_digest(name)] += 1
+    return counts
+
+
+def reconcile_blob_refs():
+    """
+    Rebuild every reference count from the attachments table and return the
+    corrections as (digest, stored, actual). The Blob rows are locked first,
+    so attachments committed meanwhile apply their delta on top.
+    """
+    corrections = []
+    with transaction.atomic():
+        stored = {row.digest: row for row in Blob.objects.select_for_update()}
+        actual = actual_refs()
+        for digest in set(stored) | set(actual):
+            row = stored.get(digest)
+            count = actual.get(digest, 0)
+            if row is None:
+                adjust_blob_refs({digest: count})
+                corrections.append((digest, 0, count))
+            elif row.ref_count != count:
+                Blob.objects.filter(id=row.id).update(ref_count=count)
+                corrections.append((digest, row.ref_count, count))
+    return corrections
+
+
+def _older_than(path, cutoff):
+    try:
+        return os.path.getmtime(path) < cutoff
+    except FileNotFoundError:
+        return True
+
+
+def collect_blobs(grace=DEFAULT_GRACE, dry_run=False):
+    """
+    Delete blobs nothing references any more, and files under the blob
+    directory that no Blob row knows (left by uploads whose transaction
+    rolled back). Files touched within the grace period are kept.
+    Returns (blobs removed, stray files removed, bytes freed).
+    """
+    storage = FileAttachment._meta.get_field('file').storage
+    cutoff = time.time() - grace.total_seconds()
+    removed = freed = 0
+    for blob_id in list(Blob.objects.filter(ref_count__lte=0).values_list('id', flat=True)):
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(id=blob_id, ref_count__lte=0).first()
+            if blob is None:
+                continue
+            if not _older_than(storage.path(blob_name(blob.digest)), cutoff):
+                continue
+            # An upload may reuse the file without taking the row lock, so
+            # the age is checked again once the file has been moved aside
+            if not dry_run:
+                if not storage.remove_blob(blob_name(blob.digest), cutoff):
+                    continue
+                blob.delete()
+            removed += 1
+            freed += blob.size
+
+    stray = 0
+    root = storage.path(BLOB_PREFIX)
+    known = None
+    for directory, subdirectories, files in os.walk(root):
+        for file_name in files:
+            path = os.path.join(directory, file_name)
+            if not _older_than(path, cutoff):
+                continue
+            if known is None:
+                known = set(Blob.objects.values_list('digest', flat=True))
+            # Temporary files of interrupted uploads never match a digest
+            if file_name in known and os.path.dirname(path) == os.path.dirname(storage.path(blob_name(file_name))):
+                continue
+            size = os.path.getsize(path)
+            if not dry_run and not storage.remove_blob(os.path.relpath(path, storage.location), cutoff):
+                continue
+            stray += 1
+            freed += size
+    return removed, stray, freed
+
+
+def adopt_legacy_attachments(dry_run=False):
+    """
+    Move attachments stored before content addressing into the blob store,
+    one attachment per transaction, and delete the old copies. Returns
+    (attachments moved, files missing).
+    """
+    storage = FileAttachment._meta.get_field('file').storage
+    moved = missing = 0
+    legacy = FileAttachment.objects.exclude(file__startswith=f'{BLOB_PREFIX}/').exclude(file='').order_by('id')
+    for attachment in legacy.iterator():
+        old_name = attachment.file.name
+        if not storage.exists(old_name):
+            missing += 1
+            continue
+        moved += 1
+        if dry_run:
+            continue
+        with transaction.atomic(), storage.open(old_name, 'rb') as source:
+            attachment.original_name = attachment.original_name or os.path.basename(old_name)
+            attachment.file = File(source, name=os.path.basename(old_name))
+            attachment.save(update_fields=['file', 'original_name'])
+        storage.delete(old_name)
+    return moved, missing
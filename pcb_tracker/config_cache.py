@@ -0,0 +1,142 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from django import forms
+from django.conf import settings
+
+from .models import TestConfig, TestParameter, TestQuestion
+
+
+ParameterSpec = namedtuple('ParameterSpec', ['id', 'name', 'parameter_type', 'min_value', 'max_value', 'unit', 'required', 'order'])
+QuestionSpec = namedtuple('QuestionSpec', ['id', 'question_text', 'required', 'order'])
+ConfigSpec = namedtuple('ConfigSpec', ['id', 'updated_at', 'parameters', 'questions', 'form_class'])
+
+# Decimal places offered by the test form for each parameter type
+PARAMETER_DECIMAL_PLACES = {
+    'voltage': 4,
+    'current': 4,
+}
+DEFAULT_DECIMAL_PLACES = 2
+
+
+def build_config_form_class(config_id, parameters, questions):
+    """Build a form class with one field per test parameter and test question"""
+    fields = {}
+    for parameter in parameters:
+        fields[f'param_{parameter.id}'] = forms.DecimalField(
+            label=f'{parameter.name} ({parameter.unit})',
+            required=parameter.required,
+            decimal_places=PARAMETER_DECIMAL_PLACES.get(parameter.parameter_type, DEFAULT_DECIMAL_PLACES),
+            max_digits=15,
+            widget=forms.NumberInput(attrs={'class': 'form-control', 'step': 'any'})
+        )
+    for question in questions:
+        fields[f'question_{question.id}'] = forms.BooleanField(
+            label=question.question_text,
+            required=question.required,
+            widget=forms.RadioSelect(choices=[(True, 'Yes'), (False, 'No')])
+        )
+    return type(f'TestConfig{config_id}Form', (forms.Form,), fields)
+
+
+class ConfigSpecCache:
+    """
+    Thread-safe, size-bounded LRU cache of compiled test config specs.
+
+    Entries are keyed by (test config id, updated_at), so a config edited by
+    another process is simply a cache miss here rather than a stale hit.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            spec = self._entries.get(key)
+            if spec is not None:
+                self._entries.move_to_end(key)
+            return spec
+
+    def put(self, key, spec):
+        with self._lock:
+            # Older versions of the same config can never be hit again
+            for old_key in [k for k in self._entries if k[0] == key[0] and k != key]:
+                del self._entries[old_key]
+            self._entries[key] = spec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, config_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == config_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+spec_cache = ConfigSpecCache(getattr(settings, 'TEST_CONFIG_SPEC_CACHE_SIZE', 256))
+
+
+def _compile_specs(versions):
+    """Compile specs for {config id: updated_at} with two queries and cache them"""
+    parameters = {config_id: [] for config_id in versions}
+    questions = {config_id: [] for config_id in versions}
+    for parameter in TestParameter.objects.filter(test_config_id__in=versions):
+        parameters[parameter.test_config_id].append(ParameterSpec(
+            parameter.id, parameter.name, parameter.parameter_type, parameter.min_value,
+            parameter.max_value, parameter.unit, parameter.required, parameter.order
+        ))
+    for question in TestQuestion.objects.filter(test_config_id__in=versions):
+        questions[question.test_config_id].append(QuestionSpec(
+            question.id, question.question_text, question.required, question.order
+        ))
+
+    specs = {}
+    for config_id, updated_at in versions.items():
+        config_parameters = tuple(parameters[config_id])
+        config_questions = tuple(questions[config_id])
+        spec = ConfigSpec(
+            config_id, updated_at, config_parameters, config_questions,
+            build_config_form_class(config_id, config_parameters, config_questions)
+        )
+        spec_cache.put((config_id, updated_at), spec)
+        specs[config_id] = spec
+    return specs
+
+
+def get_config_spec(test_config):
+    """Return the compiled spec for a TestConfig instance, compiling it on a miss"""
+    spec = spec_cache.get((test_config.id, test_config.updated_at))
+    if spec is None:
+        spec = _compile_specs({test_config.id: test_config.updated_at})[test_config.id]
+    return spec
+
+
+def get_config_specs(config_ids):
+    """
+    Return {config id: spec} for many test configs.
+
+    Costs one query to read the current versions, plus two more only if some
+    of them are not cached yet. Ids of configs that no longer exist are left out.
+    """
+    if not config_ids:
+        return {}
+    versions = dict(TestConfig.objects.filter(id__in=config_ids).values_list('id', 'updated_at'))
+    specs = {}
+    missing = {}
+    for config_id, updated_at in versions.items():
+        spec = spec_cache.get((config_id, updated_at))
+        if spec is None:
+            missing[config_id] = updated_at
+        else:
+            specs[config_id] = spec
+    if missing:
+        specs.update(_compile_specs(missing))
+    return specs
@@ -0,0 +1,6 @@
+from .roles import user_groups
+
+
+def roles(request):
+    """Group names of the current user for the navigation, without a query per template lookup"""
+    return {'user_group_names': sorted(user_groups(request.user)) if hasattr(request, 'user') else []}
@@ -0,0 +1,96 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import PCB, Module, PCBType, StatusCounter
+
+
+def adjust_counters(entity, deltas):
+    """
+    Apply {(pcb_type_id, status): delta} to the counters of an entity.
+
+    Callers run this inside the transaction that made the change, so the
+    counters commit or roll back together with it. Each non-zero delta costs
+    one UPDATE; a missing row is created on first use.
+    """
+    for (pcb_type_id, status), delta in deltas.items():
+        if not delta:
+            continue
+        rows = StatusCounter.objects.filter(entity=entity, pcb_type_id=pcb_type_id, status=status)
+        if rows.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                StatusCounter.objects.create(entity=entity, pcb_type_id=pcb_type_id, status=status, count=delta)
+        except IntegrityError:
+            # Another transaction created the row first
+            rows.update(count=F('count') + delta)
+
+
+def seed_counters(pcb_type_id):
+    """Create zero rows for every status of a PCB type so later updates never insert"""
+    StatusCounter.objects.bulk_create([
+        StatusCounter(entity='pcb', pcb_type_id=pcb_type_id, status=status)
+        for status, label in PCB.STATUS_CHOICES
+    ], ignore_conflicts=True)
+
+
+def actual_counts():
+    """Count PCBs and modules per (entity, pcb_type_id, status) from the source tables"""
+    counts = Counter()
+    for pcb_type_id, status, total in PCB.objects.order_by().values_list('batch__pcb_type', 'status').annotate(total=Count('id')):
+        counts[('pcb', pcb_type_id, status)] = total
+    for status, total in Module.objects.order_by().values_list('status').annotate(total=Count('id')):
+        counts[('module', None, status)] = total
+    return counts
+
+
+def reconcile_counters():
+    """
+    Rebuild every counter from the source tables and return the rows that
+    were wrong as (entity, pcb_type_id, status, stored, actual) tuples.
+
+    The counter rows are locked first, so status changes that commit while
+    the counts are taken wait and then apply their delta on top. Rows left
+    behind by deleted PCB types are removed.
+    """
+    corrections = []
+    with transaction.atomic():
+        stored = {
+            (row.entity, row.pcb_type_id, row.status): row
+            for row in StatusCounter.objects.select_for_update()
+        }
+        actual = actual_counts()
+        for key in set(stored) | set(actual):
+            row = stored.get(key)
+            count = actual.get(key, 0)
+            if row is None:
+                StatusCounter.objects.create(entity=key[0], pcb_type_id=key[1], status=key[2], count=count)
+                corrections.append(key + (0, count))
+            elif row.count != count:
+                StatusCounter.objects.filter(id=row.id).update(count=count)
+                corrections.append(key + (row.count, count))
+        StatusCounter.objects.exclude(pcb_type=None).exclude(pcb_type_id__in=PCBType.objects.values('id')).delete()
+    return corrections
+
+
+def status_totals():
+    """Return {entity: {status: count}} summed over PCB types, with one query"""
+    totals = {entity: {} for entity, label in StatusCounter.ENTITY_CHOICES}
+    for entity, status, total in StatusCounter.objects.order_by().values_list('entity', 'status').annotate(total=Sum('count')):
+        totals[entity][status] = total
+    return totals
+
+
+async def astatus_totals():
+    """status_totals() for async views"""
+    totals = {entity: {} for entity, label in StatusCounter.ENTITY_CHOICES}
+    async for entity, status, total in StatusCounter.objects.order_by().values_list('entity', 'status').annotate(total=Sum('count')):
+        totals[entity][status] = total
+    return totals
+
+
+def batch_status_counts(batch_id):
+    """Return {status: count} for the PCBs of one batch"""
+    return dict(PCB.objects.filter(batch_id=batch_id).order_by().values_list('status').annotate(total=Count('id')))
@@ -0,0 +1,176 @@
+import csv
+import io
+import zipfile
+
+from django.utils import timezone
+
+from .models import PCB, Batch, FileAttachment, Module, ModuleTestRecord, ParameterMeasurement, QuestionResponse, TestMeasurement
+
+
+# Rows fetched per database round trip while writing the CSV tables
+EXPORT_CHUNK_SIZE = 2000
+
+# Bytes read from an attachment at a time
+FILE_CHUNK_SIZE = 64 * 1024
+
+# CSV rows buffered before they are compressed into the archive
+CSV_ROWS_PER_WRITE = 500
+
+
+class _Sink:
+    """
+    Write-only, non-seekable file object for ZipFile. Whatever the archive
+    writes is collected until the streaming generator drains it, so only
+    the bytes of the current write are ever held in memory.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def dossier_pcbs(kind, object_id):
+    """
+    Return (label, PCB queryset, module queryset) for a module or batch.
+    Raises ValueError for another kind and DoesNotExist for a missing object.
+    """
+    if kind == 'module':
+        module = Module.objects.get(id=object_id)
+        return module.module_serial_number, PCB.objects.filter(modules=module), Module.objects.filter(id=module.id)
+    if kind == 'batch':
+        batch = Batch.objects.get(id=object_id)
+        pcbs = PCB.objects.filter(batch=batch)
+        return batch.batch_number, pcbs, Module.objects.filter(pcbs__batch=batch).distinct()
+    raise ValueError(f'Unknown dossier root "{kind}"')
+
+
+def _tables(pcbs, modules):
+    """(file name, header, row iterator) of every CSV table of the dossier"""
+    runs = TestMeasurement.objects.filter(pcb__in=pcbs)
+    return [
+        ('pcbs.csv',
+         ['pcb_id', 'serial_number', 'batch', 'pcb_type', 'test_config', 'status', 'created_at', 'notes'],
+         pcbs.order_by('id').values_list('id', 'serial_number', 'batch__batch_number', 'batch__pcb_type__name',
+                                         'test_config__name', 'status', 'created_at', 'notes')),
+        ('measurements.csv',
+         ['measurement_id', 'pcb_id', 'serial_number', 'test_config', 'tester', 'test_date', 'verdict', 'notes'],
+         runs.order_by('id').values_list('id', 'pcb_id', 'pcb__serial_number', 'test_config__name',
+                                         'tester__username', 'test_date', 'verdict', 'notes')),
+        ('parameter_values.csv',
+         ['measurement_id', 'serial_number', 'parameter', 'value', 'unit', 'min_value', 'max_value', 'verdict'],
+         ParameterMeasurement.objects.filter(test_measurement__in=runs).order_by('test_measurement_id', 'id')
+         .values_list('test_measurement_id', 'test_measurement__pcb__serial_number', 'test_parameter__name', 'value',
+                      'test_parameter__unit', 'test_parameter__min_value', 'test_parameter__max_value', 'verdict')),
+        ('question_responses.csv',
+         ['measurement_id', 'serial_number', 'question', 'response', 'notes'],
+         QuestionResponse.objects.filter(test_measurement__in=runs).order_by('test_measurement_id', 'id')
+         .values_list('test_measurement_id', 'test_measurement__pcb__serial_number', 'test_question__question_text',
+                      'response', 'notes')),
+        ('modules.csv',
+         ['module_id', 'serial_number', 'status', 'assembler', 'assembly_date', 'notes'],
+         modules.order_by('id').values_list('id', 'module_serial_number', 'status', 'assembler__username',
+                                            'assembly_date', 'notes')),
+        ('module_tests.csv',
+         ['module_id', 'module_serial_number', 'test_type', 'result', 'tester', 'test_date', 'notes'],
+         ModuleTestRecord.objects.filter(module__in=modules).order_by('id')
+         .values_list('module_id', 'module__module_serial_number', 'test_type', 'result', 'tester__username',
+                      'test_date', 'notes')),
+    ]
+
+
+def _attachment_name(attachment, serial_number):
+    return f'attachments/{serial_number}/{attachment.id}_{attachment.display_name}'
+
+
+def _write_csv(archive, sink, name, date_time, header, rows):
+    """Compress a CSV table into the archive, yielding the output as it is produced"""
+    info = zipfile.ZipInfo(name, date_time)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with archive.open(info, 'w', force_zip64=True) as entry:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if count % CSV_ROWS_PER_WRITE == 0:
+                entry.write(buffer.getvalue().encode())
+                buffer.seek(0)
+                buffer.truncate()
+                yield sink.drain()
+        entry.write(buffer.getvalue().encode())
+    yield sink.drain()
+
+
+def _attachment_rows(attachments):
+    for attachment in attachments.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        included = bool(attachment.file.name) and attachment.file.storage.exists(attachment.file.name)
+        yield [attachment.id, attachment.pcb.serial_number, attachment.file_type,
+               _attachment_name(attachment, attachment.pcb.serial_number) if included else '',
+               attachment.uploaded_by.username, attachment.upload_date, attachment.description,
+               'included' if included else 'missing']
+
+
+def stream_dossier(kind, object_id):
+    """
+    Yield a ZIP archive with every record and attached report of a module
+    or batch, chunk by chunk.
+
+    CSV tables are read with QuerySet.iterator() and attachments in
+    FILE_CHUNK_SIZE pieces, and each piece is compressed and yielded as
+    soon as it is written, so memory use does not depend on the size of
+    the dossier. Attachment files missing from storage are marked as such
+    in attachments.csv instead of failing the export half way.
+    """
+    label, pcbs, modules = dossier_pcbs(kind, object_id)
+    sink = _Sink()
+    now = timezone.now()
+    date_time = now.timetuple()[:6]
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        info = zipfile.ZipInfo('README.txt', date_time)
+        archive.writestr(info, f'Traceability dossier for {kind} {label}\nGenerated {now.isoformat()}\n')
+        yield sink.drain()
+
+        for name, header, rows in _tables(pcbs, modules):
+            yield from _write_csv(archive, sink, name, date_time, header, rows.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+        attachments = FileAttachment.objects.filter(pcb__in=pcbs).select_related('pcb', 'uploaded_by').order_by('id')
+        yield from _write_csv(
+            archive, sink, 'attachments.csv', date_time,
+            ['attachment_id', 'serial_number', 'file_type', 'archive_name', 'uploaded_by', 'upload_date', 'description', 'status'],
+            _attachment_rows(attachments)
+        )
+        for attachment in attachments.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            try:
+                source = attachment.file.open('rb')
+            except (FileNotFoundError, ValueError):
+                # Removed since it was listed
+                continue
+            info = zipfile.ZipInfo(_attachment_name(attachment, attachment.pcb.serial_number), date_time)
+            # Reports are mostly xlsx and pdf, which are compressed already
+            info.compress_type = zipfile.ZIP_STORED
+            with source, archive.open(info, 'w', force_zip64=True) as entry:
+                for chunk in source.chunks(FILE_CHUNK_SIZE):
+                    entry.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def dossier_filename(kind, label):
+    safe = ''.join(character if character.isalnum() or character in '-_.' else '_' for character in label)
+    return f'dossier_{kind}_{safe}.zip'
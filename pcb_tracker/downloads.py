@@ -0,0 +1,171 @@
+import mimetypes
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, parse_etags
+
+from .storage import blob_digest
+
+
+# None streams files through Django; 'x-accel-redirect' (nginx) or
+# 'x-sendfile' (Apache, lighttpd) hands the transfer to the web server
+ATTACHMENT_SENDFILE = getattr(settings, 'ATTACHMENT_SENDFILE', None)
+
+# Internal nginx location mapped onto the media directory, for X-Accel-Redirect
+ATTACHMENT_ACCEL_PREFIX = getattr(settings, 'ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+
+# Bytes sent per iteration when Django streams a file itself
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+async def _iterate_in_thread(iterator):
+    """
+    Hand a blocking iterator to the ASGI server one chunk at a time. Each
+    step runs on the request's sync thread, where its database connection
+    lives, so generators that query as they go keep working.
+    """
+    step = sync_to_async(next)
+    while True:
+        chunk = await step(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def stream_response(request, response):
+    """
+    Make a streaming response stream under ASGI too. Django reads a
+    synchronous iterator to the end before sending anything to an ASGI
+    server, which would hold a whole dossier or attachment in memory; it
+    iterates an asynchronous one as it goes. WSGI responses are unchanged.
+    """
+    if isinstance(request, ASGIRequest) and not response.is_async:
+        # Keeps the file closers of a FileResponse
+        response.streaming_content = _iterate_in_thread(iter(response.streaming_content))
+    return response
+
+
+class _RangeFile:
+    """File-like view of length bytes of a file starting at start, for FileResponse"""
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def attachment_etag(attachment, storage):
+    """Strong ETag from the content digest; files stored before content addressing use size and mtime"""
+    name = attachment.file.name
+    digest = blob_digest(name)
+    if digest:
+        return f'"{digest}"'
+    modified = storage.get_modified_time(name).timestamp()
+    return f'"{storage.size(name)}-{int(modified)}"'
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single byte range header, None to
+    send the whole file (no header, several ranges, or a syntax this view
+    does not handle) or False when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length or not size:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def serve_attachment(request, attachment):
+    """
+    Response that downloads an attachment the caller is allowed to read.
+
+    If-None-Match is answered with 304 from the ETag alone, without opening
+    the file. A single byte range (honoured only while If-Range, when
+    present, still matches) is answered with 206. In a sendfile mode the
+    body is left to the web server, which handles ranges itself, so no
+    worker is held for the transfer.
+    """
+    storage = attachment.file.storage
+    name = attachment.file.name
+    etag = attachment_etag(attachment, storage)
+    filename = attachment.display_name
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    if ATTACHMENT_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = ATTACHMENT_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)
+        return finish(response)
+    if ATTACHMENT_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = storage.path(name)
+        return finish(response)
+
+    size = storage.size(name)
+    requested = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if requested is not None and if_range and if_range.strip() != etag:
+        # The file changed since the client's partial copy; send all of it
+        requested = None
+    if requested is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+
+    source = storage.open(name, 'rb')
+    if requested is None:
+        response = FileResponse(_RangeFile(source, 0, size), content_type=content_type)
+        response.block_size = DOWNLOAD_BLOCK_SIZE
+        response['Content-Length'] = str(size)
+    else:
+        start, end = requested
+        response = FileResponse(_RangeFile(source, start, end - start + 1), status=206, content_type=content_type)
+        response.block_size = DOWNLOAD_BLOCK_SIZE
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return finish(stream_response(request, response))
@@ -0,0 +1,104 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .models import Batch, TestMeasurement, ParameterMeasurement
+from .analytics import touch_batches
+
+
+# Ids per UPDATE ... WHERE id IN (...) statement when writing verdicts back
+UPDATE_CHUNK_SIZE = 5000
+
+
+def to_float_array(values):
+    """Convert Decimals/floats to a float64 array, with missing values as NaN"""
+    return np.fromiter((np.nan if v is None else float(v) for v in values), dtype=np.float64, count=len(values))
+
+
+def compute_verdicts(values, min_values, max_values):
+    """
+    Check measured values against their limits in one vectorized pass.
+
+    All three arguments are float arrays of the same length; a NaN limit means
+    that side is unbounded (comparisons with NaN are always False).
+    Returns a boolean array that is True where the value is within limits.
+    """
+    return ~((values < min_values) | (values > max_values))
+
+
+def failed_groups(group_ids, passed):
+    """Return the distinct group ids that have at least one failed value"""
+    return np.unique(group_ids[~passed])
+
+
+def _update_in_chunks(model, ids, **fields):
+    """Write the same field values to many rows with a few UPDATE statements"""
+    updated = 0
+    ids = ids.tolist() if isinstance(ids, np.ndarray) else list(ids)
+    for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+        updated += model.objects.filter(id__in=ids[start:start + UPDATE_CHUNK_SIZE]).update(**fields)
+    return updated
+
+
+def evaluate_measurements(test_measurements):
+    """
+    Evaluate every ParameterMeasurement belonging to a TestMeasurement queryset
+    and store the per-value and per-TestMeasurement verdicts.
+
+    Values and limits are fetched as floats with one query and checked with
+    NumPy; only rows whose verdict actually changes are written back.
+    Returns a dict with the number of measurements evaluated and failed.
+    """
+    rows = list(
+        ParameterMeasurement.objects.filter(test_measurement__in=test_measurements)
+        .annotate(
+            value_f=Cast('value', FloatField()),
+            min_f=Cast('test_parameter__min_value', FloatField()),
+            max_f=Cast('test_parameter__max_value', FloatField()),
+        )
+        .values_list('id', 'test_measurement_id', 'value_f', 'min_f', 'max_f', 'verdict')
+    )
+    measurement_rows = list(test_measurements.values_list('id', 'verdict'))
+    measurement_ids = np.array([row[0] for row in measurement_rows], dtype=np.int64)
+    measurement_verdicts = np.array([row[1] for row in measurement_rows], dtype=object)
+
+    if rows:
+        ids, group_ids, values, min_values, max_values, current = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        group_ids = np.array(group_ids, dtype=np.int64)
+        current = np.array(current, dtype=object)
+        passed = compute_verdicts(to_float_array(values), to_float_array(min_values), to_float_array(max_values))
+    else:
+        ids = group_ids = np.empty(0, dtype=np.int64)
+        current = np.empty(0, dtype=object)
+        passed = np.empty(0, dtype=bool)
+
+    # A TestMeasurement passes when none of its values is out of limits
+    measurement_failed = np.isin(measurement_ids, failed_groups(group_ids, passed))
+
+    with transaction.atomic():
+        _update_in_chunks(ParameterMeasurement, ids[passed & (current != 'pass')], verdict='pass')
+        _update_in_chunks(ParameterMeasurement, ids[~passed & (current != 'fail')], verdict='fail')
+        changed = _update_in_chunks(TestMeasurement, measurement_ids[~measurement_failed & (measurement_verdicts != 'pass')], verdict='pass')
+        changed += _update_in_chunks(TestMeasurement, measurement_ids[measurement_failed & (measurement_verdicts != 'fail')], verdict='fail')
+        if changed:
+            # Yields are computed from the run verdicts, so their cache is stale now
+            touch_batches(Batch.objects.filter(id__in=test_measurements.values('pcb__batch_id')))
+
+    return {
+        'measurements': len(measurement_ids),
+        'failed': int(measurement_failed.sum()),
+        'values': len(ids),
+        'failed_values': int((~passed).sum()),
+    }
+
+
+def evaluate_batch(batch):
+    """Evaluate all test measurements of the PCBs in a batch"""
+    return evaluate_measurements(TestMeasurement.objects.filter(pcb__batch=batch))
+
+
+def evaluate_pcb(pcb):
+    """Evaluate all test measurements of a single PCB"""
+    return evaluate_measurements(TestMeasurement.objects.filter(pcb=pcb))
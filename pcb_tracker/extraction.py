@@ -0,0 +1,176 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .analytics import touch_batches
+from .config_cache import get_config_specs
+from .evaluation import compute_verdicts, to_float_array
+from .models import FileAttachment, ParameterMeasurement, TestMeasurement
+from .reports import normalize_label, parse_report
+from .results import ResultError, parse_value
+from .spc import add_values
+
+
+# Attachments claimed from the queue per round
+EXTRACT_BATCH_SIZE = getattr(settings, 'EXTRACT_BATCH_SIZE', 50)
+
+# Worker processes parsing spreadsheets
+EXTRACT_WORKERS = getattr(settings, 'EXTRACT_WORKERS', min(4, os.cpu_count() or 1))
+
+# A claim older than this is taken to belong to a runner that died
+EXTRACT_STALE_AFTER = timedelta(minutes=30)
+
+EXTRACTABLE_EXTENSIONS = ('.xlsx',)
+
+
+def claim_attachments(limit=EXTRACT_BATCH_SIZE):
+    """
+    Mark up to limit queued attachments as being parsed and return them.
+    Rows claimed by a concurrent runner are skipped rather than waited for.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            FileAttachment.objects.select_for_update(skip_locked=True)
+            .filter(Q(parse_status='pending') | Q(parse_status='parsing', parsed_at__lt=now - EXTRACT_STALE_AFTER))
+            .order_by('id')
+            .values_list('id', flat=True)[:limit]
+        )
+        FileAttachment.objects.filter(id__in=ids).update(parse_status='parsing', parsed_at=now)
+    return list(FileAttachment.objects.filter(id__in=ids).select_related('pcb').order_by('id'))
+
+
+def _finish(attachment, status, message, values=0):
+    FileAttachment.objects.filter(id=attachment.id).update(
+        parse_status=status, parse_message=message, parsed_values=values, parsed_at=timezone.now()
+    )
+    return status
+
+
+def _plan(attachments):
+    """
+    Decide what to look for in each claimed attachment. Returns a list of
+    (attachment, test run, {label: parameter}) and settles the attachments
+    that cannot be parsed, counting them in a Counter of statuses.
+    """
+    statuses = Counter()
+    runs = {}
+    for attachment in attachments:
+        run = None
+        if attachment.pcb_id is not None:
+            run = (TestMeasurement.objects.filter(pcb_id=attachment.pcb_id, test_date__lte=attachment.upload_date)
+                   .order_by('-test_date', '-id').first())
+        runs[attachment.id] = run
+    specs = get_config_specs({run.test_config_id for run in runs.values() if run and run.test_config_id})
+
+    tasks = []
+    for attachment in attachments:
+        run = runs[attachment.id]
+        # Blobs are named by digest, so the type comes from the uploaded name
+        if attachment.file_type != 'pcb_test' or not attachment.display_name.lower().endswith(EXTRACTABLE_EXTENSIONS):
+            statuses[_finish(attachment, 'skipped', 'Not a spreadsheet test report')] += 1
+            continue
+        if run is None:
+            statuses[_finish(attachment, 'skipped', 'No test run was recorded for this PCB before the upload')] += 1
+            continue
+        spec = specs.get(run.test_config_id)
+        labels = {}
+        for parameter in (spec.parameters if spec else ()):
+            label = normalize_label(parameter.name)
+            # Two parameters with the same label cannot be told apart in a sheet
+            labels[label] = None if label in labels else parameter
+        labels = {label: parameter for label, parameter in labels.items() if parameter is not None}
+        if not labels:
+            statuses[_finish(attachment, 'skipped', 'The test configuration has no parameters to look for')] += 1
+            continue
+        if not attachment.file.storage.exists(attachment.file.name):
+            statuses[_finish(attachment, 'failed', 'The file is missing from storage')] += 1
+            continue
+        tasks.append((attachment, run, labels))
+    return tasks, statuses
+
+
+def _store(attachment, run, labels, found, error):
+    """Insert the values found in one report into its test run and record the outcome"""
+    values = []
+    problems = [error] if error else []
+    for label, raw in found.items():
+        parameter = labels[label]
+        try:
+            values.append((parameter, parse_value(raw)))
+        except ResultError as e:
+            problems.append(f'{parameter.name}: {e}')
+    if not values:
+        return _finish(attachment, 'failed' if error else 'skipped', '; '.join(problems) or 'No parameter values found')
+
+    with transaction.atomic():
+        run = TestMeasurement.objects.select_for_update().get(id=run.id)
+        # Values typed in by the tester win over the ones read from the file
+        recorded = set(run.parameter_measurements.values_list('test_parameter_id', flat=True))
+        added = [(parameter, value) for parameter, value in values if parameter.id not in recorded]
+        passed = compute_verdicts(
+            to_float_array([value for parameter, value in added]),
+            to_float_array([parameter.min_value for parameter, value in added]),
+            to_float_array([parameter.max_value for parameter, value in added])
+        ).tolist()
+        ParameterMeasurement.objects.bulk_create([
+            ParameterMeasurement(
+                test_measurement=run,
+                test_parameter_id=parameter.id,
+                value=value,
+                unit=parameter.unit,
+                notes=f'Read from {attachment.display_name}',
+                verdict='pass' if ok else 'fail'
+            )
+            for (parameter, value), ok in zip(added, passed)
+        ])
+        if not all(passed) and run.verdict != 'fail':
+            run.verdict = 'fail'
+            run.save(update_fields=['verdict'])
+        if added:
+            batch_id = attachment.pcb.batch_id
+            touch_batches({batch_id})
+            add_values((parameter.id, batch_id, value) for parameter, value in added)
+        message = f'{len(added)} value(s) added, {len(values) - len(added)} already recorded'
+        return _finish(attachment, 'parsed', '; '.join([message] + problems), len(added))
+
+
+def extract_pending(executor, batch_size=EXTRACT_BATCH_SIZE):
+    """
+    Claim one round of queued attachments, parse them in the executor's
+    worker processes and store what they found. Returns a Counter of the
+    resulting parse statuses (empty when the queue is empty); raises
+    BrokenProcessPool once the round is settled if a worker died.
+    """
+    tasks, statuses = _plan(claim_attachments(batch_size))
+    futures = [
+        (attachment, run, labels, executor.submit(parse_report, attachment.file.path, list(labels)))
+        for attachment, run, labels in tasks
+    ]
+    broken = False
+    for attachment, run, labels, future in futures:
+        try:
+            found, error = future.result()
+        except Exception as e:
+            # A worker crashed (out of memory on a pathological file, for example)
+            broken = broken or isinstance(e, BrokenProcessPool)
+            statuses[_finish(attachment, 'failed', f'Parser crashed: {e}')] += 1
+            continue
+        statuses[_store(attachment, run, labels, found, error)] += 1
+    if broken:
+        # Every attachment of the round is settled; the caller needs a new pool
+        raise BrokenProcessPool('A parser process died during the round')
+    return statuses
+
+
+def extraction_pool(workers=EXTRACT_WORKERS):
+    """Process pool for extract_pending; open connections are closed so they are not shared with the workers"""
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers)
@@ -1,6 +1,13 @@
+import copy
+import re
 from django import forms
+from django.db import IntegrityError, transaction
 from .models import PCB, TestMeasurement, FileAttachment, Module, ModuleTestRecord, PCBType, TestConfig, TestParameter, TestQuestion, Batch
 from django.core.exceptions import ValidationError
+from .importers import SUPPORTED_EXTENSIONS, iter_csv_rows
+from .counters import adjust_counters
+from .assembly import assemble_modules, parse_serials, read_assembly_csv
+from .config_cache import get_config_spec
 
 
 class PCBTestForm(forms.Form):
@@ -50,6 +57,16 @@ class FileAttachmentForm(forms.ModelForm):
         }
 
 
+class TestResultImportForm(forms.Form):
+    file = forms.FileField(label='Tester Export (.csv or .xlsx)')
+    
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(SUPPORTED_EXTENSIONS):
+            raise forms.ValidationError('Only .csv and .xlsx files can be imported.')
+        return upload
+
+
 class ModuleAssemblyForm(forms.Form):
     module_serial_number = forms.CharField(max_length=100, label='Module Serial Number')
     pcb_serials = forms.CharField(widget=forms.Textarea(attrs={'rows': 4}), 
@@ -57,49 +74,40 @@ class ModuleAssemblyForm(forms.Form):
     notes = forms.CharField(widget=forms.Textarea(attrs={'rows': 3}), required=False)
     
     def clean_pcb_serials(self):
-        serials_text = self.cleaned_data['pcb_serials']
-        serials = [s.strip() for s in serials_text.split('\n') if s.strip()]
-        
-        # Validate that all PCBs exist and are in the correct status
-        pcbs = []
-        for serial in serials:
-            try:
-                pcb = PCB.objects.get(serial_number=serial)
-                # Only allow PCBs that have been QA verified
-                if pcb.status != 'qa_verified':
-                    raise forms.ValidationError(f'PCB {serial} is not ready for assembly. Status: {pcb.status}')
-                pcbs.append(pcb)
-            except PCB.DoesNotExist:
-                raise forms.ValidationError(f'PCB with serial number {serial} does not exist.')
-        
-        return pcbs
+        serials = parse_serials(self.cleaned_data['pcb_serials'])
+        if not serials:
+            raise forms.ValidationError('Enter at least one PCB serial number.')
+        # Existence and status are checked in bulk, with the rows locked, by save()
+        return serials
     
-    def clean(self):
-        cleaned_data = super().clean()
-        pcbs = cleaned_data.get('pcb_serials')
-        
-        if pcbs:
-            cleaned_data['pcbs'] = pcbs
+    def save(self, assembler):
+        """Assemble the module; raises ValidationError if any PCB cannot be used"""
+        result = assemble_modules([{
+            'module_serial_number': self.cleaned_data['module_serial_number'],
+            'pcb_serials': self.cleaned_data['pcb_serials'],
+            'notes': self.cleaned_data['notes'],
+        }], assembler)[0]
         
-        return cleaned_data
+        if result['status'] != 'ok':
+            raise forms.ValidationError(result['errors'])
+        return result['module']
+
+
+class ModuleAssemblyImportForm(forms.Form):
+    file = forms.FileField(label='Assembly List (.csv)',
+                           help_text='Columns: module_serial_number, pcb_serial_number and optional notes; one row per PCB')
     
-    def save(self):
-        module_serial = self.cleaned_data['module_serial_number']
-        pcbs = self.cleaned_data['pcbs']
-        notes = self.cleaned_data['notes']
-        
-        # Create the module
-        module = Module.objects.create(
-            module_serial_number=module_serial,
-            assembler=None,  # Will be set by the view
-            notes=notes
-        )
-        
-        # Add PCBs to the module
-        for pcb in pcbs:
-            module.pcbs.add(pcb)
-        
-        return module
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith('.csv'):
+            raise forms.ValidationError('Only .csv files can be uploaded.')
+        try:
+            self.requests = read_assembly_csv(iter_csv_rows(upload.file))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise forms.ValidationError(str(e))
+        if not self.requests:
+            raise forms.ValidationError('The file does not list any modules.')
+        return upload
 
 
 class ModuleTestForm(forms.ModelForm):
@@ -132,6 +140,88 @@ class PCBCreateForm(forms.ModelForm):
         self.fields['test_config'].queryset = TestConfig.objects.all()
 
 
+class PCBBulkCreateForm(forms.Form):
+    """
+    Form to register a whole range of PCBs from a serial pattern such as MQ-24-{0001..2000}
+    """
+    # Largest number of PCBs that can be registered in one submission
+    MAX_PCBS = 100000
+    # Rows per INSERT statement
+    CHUNK_SIZE = 2000
+    PATTERN_RE = re.compile(r'^(?P<prefix>[^{}]*)\{(?P<start>\d+)\.\.(?P<end>\d+)\}(?P<suffix>[^{}]*)$')
+    
+    serial_pattern = forms.CharField(max_length=100, label='Serial Number Pattern',
+                                     help_text='Use {first..last} for the numeric part, e.g. MQ-24-{0001..2000}')
+    batch = forms.ModelChoiceField(queryset=Batch.objects.none())
+    test_config = forms.ModelChoiceField(queryset=TestConfig.objects.none(), required=False)
+    notes = forms.CharField(widget=forms.Textarea(attrs={'rows': 3}), required=False)
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['batch'].queryset = Batch.objects.all()
+        self.fields['test_config'].queryset = TestConfig.objects.all()
+    
+    def clean_serial_pattern(self):
+        pattern = self.cleaned_data['serial_pattern'].strip()
+        match = self.PATTERN_RE.match(pattern)
+        if not match:
+            raise forms.ValidationError('Enter a pattern with one numeric range, e.g. MQ-24-{0001..2000}.')
+        
+        start, end = int(match['start']), int(match['end'])
+        if start > end:
+            raise forms.ValidationError('The first number of the range must not be larger than the last.')
+        if end - start + 1 > self.MAX_PCBS:
+            raise forms.ValidationError(f'At most {self.MAX_PCBS} PCBs can be created at once.')
+        
+        # Zero padding follows the width of the first number, e.g. 0001
+        width = len(match['start'])
+        prefix, suffix = match['prefix'], match['suffix']
+        if len(prefix) + max(width, len(match['end'])) + len(suffix) > PCB._meta.get_field('serial_number').max_length:
+            raise forms.ValidationError('The generated serial numbers are too long.')
+        
+        return [f'{prefix}{number:0{width}d}{suffix}' for number in range(start, end + 1)]
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        serials = cleaned_data.get('serial_pattern')
+        
+        if serials:
+            # Exact lookups on the unique index, CHUNK_SIZE serials per query
+            collisions = []
+            for start in range(0, len(serials), self.CHUNK_SIZE):
+                collisions.extend(PCB.objects.filter(
+                    serial_number__in=serials[start:start + self.CHUNK_SIZE]
+                ).values_list('serial_number', flat=True))
+            collisions.sort()
+            if collisions:
+                shown = ', '.join(collisions[:10])
+                more = f' and {len(collisions) - 10} more' if len(collisions) > 10 else ''
+                self.add_error('serial_pattern', f'{len(collisions)} serial number(s) already exist: {shown}{more}')
+        
+        return cleaned_data
+    
+    def save(self):
+        """Insert all PCBs with chunked bulk inserts and return how many were created"""
+        serials = self.cleaned_data['serial_pattern']
+        batch = self.cleaned_data['batch']
+        test_config = self.cleaned_data['test_config']
+        notes = self.cleaned_data['notes']
+        
+        try:
+            with transaction.atomic():
+                for start in range(0, len(serials), self.CHUNK_SIZE):
+                    PCB.objects.bulk_create([
+                        PCB(serial_number=serial, batch=batch, test_config=test_config, notes=notes)
+                        for serial in serials[start:start + self.CHUNK_SIZE]
+                    ])
+                adjust_counters('pcb', {(batch.pcb_type_id, 'pending'): len(serials)})
+        except IntegrityError:
+            # Another user registered one of the serials since validation ran
+            raise forms.ValidationError('Some of these serial numbers were just created by someone else. Please try again.')
+        
+        return len(serials)
+
+
 class BatchCreateForm(forms.ModelForm):
     class Meta:
         model = Batch
@@ -195,57 +285,10 @@ class PCBTestWithConfigForm(forms.Form):
         self.pcb = kwargs.pop('pcb', None)
         super().__init__(*args, **kwargs)
         
-        # If we have a PCB with a test config, dynamically add form fields
+        # If we have a PCB with a test config, copy in the fields of its prebuilt form class
         if self.pcb and self.pcb.test_config:
-            test_config = self.pcb.test_config
-            
-            # Add fields for each test parameter
-            for parameter in test_config.parameters.all():
-                field_name = f"param_{parameter.id}"
-                if parameter.parameter_type == 'voltage':
-                    self.fields[field_name] = forms.DecimalField(
-                        label=parameter.name,
-                        required=parameter.required,
-                        decimal_places=4,
-                        max_digits=15
-                    )
-                elif parameter.parameter_type == 'current':
-                    self.fields[field_name] = forms.DecimalField(
-                        label=parameter.name,
-                        required=parameter.required,
-                        decimal_places=4,
-                        max_digits=15
-                    )
-                elif parameter.parameter_type == 'frequency':
-                    self.fields[field_name] = forms.DecimalField(
-                        label=parameter.name,
-                        required=parameter.required,
-                        decimal_places=2,
-                        max_digits=15
-                    )
-                elif parameter.parameter_type == 'resistance':
-                    self.fields[field_name] = forms.DecimalField(
-                        label=parameter.name,
-                        required=parameter.required,
-                        decimal_places=2,
-                        max_digits=15
-                    )
-                else:  # 'temperature' or 'other'
-                    self.fields[field_name] = forms.DecimalField(
-                        label=parameter.name,
-                        required=parameter.required,
-                        decimal_places=2,
-                        max_digits=15
-                    )
-            
-            # Add fields for each test question
-            for question in test_config.questions.all():
-                field_name = f"question_{question.id}"
-                self.fields[field_name] = forms.BooleanField(
-                    label=question.question_text,
-                    required=question.required,
-                    widget=forms.RadioSelect(choices=[(True, 'Yes'), (False, 'No')])
-                )
+            spec = get_config_spec(self.pcb.test_config)
+            self.fields.update(copy.deepcopy(spec.form_class.base_fields))
         
         # Add general fields
         self.fields['notes'] = forms.CharField(
@@ -0,0 +1,187 @@
+from django.db.models import Prefetch
+
+from .models import PCB, Batch, FileAttachment, Module, ModuleTestRecord, ParameterMeasurement, QuestionResponse, TestMeasurement
+
+
+def _module_prefetches():
+    return [Prefetch('test_records', queryset=ModuleTestRecord.objects.select_related('tester').order_by('test_date', 'id'))]
+
+
+def _pcb_prefetches():
+    """
+    Everything recorded against a PCB, one query per relation whatever the
+    number of boards: its runs with their values and answers, its files and
+    the modules it went into.
+    """
+    measurements = TestMeasurement.objects.select_related('tester', 'test_config').order_by('test_date', 'id').prefetch_related(
+        Prefetch('parameter_measurements', queryset=ParameterMeasurement.objects.select_related('test_parameter').order_by('test_parameter__order', 'test_parameter__name', 'id')),
+        Prefetch('question_responses', queryset=QuestionResponse.objects.select_related('test_question').order_by('test_question__order', 'id')),
+    )
+    return [
+        Prefetch('measurements', queryset=measurements),
+        Prefetch('attachments', queryset=FileAttachment.objects.select_related('uploaded_by').order_by('upload_date', 'id')),
+        Prefetch('modules', queryset=Module.objects.select_related('assembler').prefetch_related(*_module_prefetches())),
+    ]
+
+
+def _pcbs():
+    return PCB.objects.select_related('batch', 'batch__pcb_type', 'test_config').prefetch_related(*_pcb_prefetches()).order_by('serial_number')
+
+
+def _user(user):
+    return {'id': user.id, 'username': user.username} if user else None
+
+
+def _batch_node(batch):
+    return {
+        'id': batch.id,
+        'batch_number': batch.batch_number,
+        'pcb_type': batch.pcb_type.name if batch.pcb_type else None,
+        'production_date': batch.production_date,
+    }
+
+
+def _module_node(module):
+    return {
+        'id': module.id,
+        'serial_number': module.module_serial_number,
+        'status': module.status,
+        'assembler': _user(module.assembler),
+        'assembly_date': module.assembly_date,
+        'notes': module.notes,
+        'pcbs': [],
+        'test_records': [
+            {
+                'id': record.id,
+                'test_type': record.test_type,
+                'result': record.result,
+                'tester': _user(record.tester),
+                'test_date': record.test_date,
+                'notes': record.notes,
+            }
+            for record in module.test_records.all()
+        ],
+    }
+
+
+def _measurement_node(measurement):
+    return {
+        'id': measurement.id,
+        'test_config': measurement.test_config.name if measurement.test_config else None,
+        'tester': _user(measurement.tester),
+        'test_date': measurement.test_date,
+        'verdict': measurement.verdict,
+        'notes': measurement.notes,
+        'parameters': [
+            {
+                'id': value.id,
+                'parameter': value.test_parameter.name,
+                'value': value.value,
+                'unit': value.unit or value.test_parameter.unit,
+                'min_value': value.test_parameter.min_value,
+                'max_value': value.test_parameter.max_value,
+                'verdict': value.verdict,
+            }
+            for value in measurement.parameter_measurements.all()
+        ],
+        'questions': [
+            {'id': answer.id, 'question': answer.test_question.question_text, 'response': answer.response, 'notes': answer.notes}
+            for answer in measurement.question_responses.all()
+        ],
+    }
+
+
+def _attachment_node(attachment):
+    return {
+        'id': attachment.id,
+        'file_type': attachment.file_type,
+        'name': attachment.display_name,
+        'uploaded_by': _user(attachment.uploaded_by),
+        'upload_date': attachment.upload_date,
+        'description': attachment.description,
+    }
+
+
+def _pcb_node(pcb):
+    return {
+        'id': pcb.id,
+        'serial_number': pcb.serial_number,
+        'batch': pcb.batch_id,
+        'batch_number': pcb.batch.batch_number,
+        'test_config': pcb.test_config.name if pcb.test_config else None,
+        'status': pcb.status,
+        'created_at': pcb.created_at,
+        'notes': pcb.notes,
+        'modules': [module.id for module in pcb.modules.all()],
+        'measurements': [_measurement_node(measurement) for measurement in pcb.measurements.all()],
+        'attachments': [_attachment_node(attachment) for attachment in pcb.attachments.all()],
+    }
+
+
+def _graph(root, pcbs, modules=()):
+    """Flatten prefetched PCBs (and extra modules) into the genealogy dict"""
+    batches = {}
+    module_nodes = {module.id: _module_node(module) for module in modules}
+    pcb_nodes = []
+    testers = {}
+    for pcb in pcbs:
+        batches.setdefault(pcb.batch_id, _batch_node(pcb.batch))
+        node = _pcb_node(pcb)
+        pcb_nodes.append(node)
+        for measurement in node['measurements']:
+            testers[measurement['tester']['id']] = measurement['tester']
+        for module in pcb.modules.all():
+            module_nodes.setdefault(module.id, _module_node(module))['pcbs'].append(pcb.id)
+    for module in module_nodes.values():
+        for record in module['test_records']:
+            testers[record['tester']['id']] = record['tester']
+    return {
+        'root': root,
+        'batches': list(batches.values()),
+        'modules': sorted(module_nodes.values(), key=lambda module: module['serial_number']),
+        'pcbs': pcb_nodes,
+        'testers': sorted(testers.values(), key=lambda user: user['username']),
+    }
+
+
+def module_genealogy(module_id):
+    """Genealogy of a module: its boards with all their history, and its own tests"""
+    module = Module.objects.select_related('assembler').prefetch_related(
+        *_module_prefetches(), Prefetch('pcbs', queryset=_pcbs())
+    ).get(id=module_id)
+    pcbs = list(module.pcbs.all())
+    # A module without boards still shows its own record
+    extra = [] if pcbs else [module]
+    return _graph({'kind': 'module', 'id': module.id, 'label': module.module_serial_number}, pcbs, extra)
+
+
+def pcb_genealogy(pcb_id):
+    """Genealogy of one board and the modules it went into"""
+    pcb = _pcbs().get(id=pcb_id)
+    return _graph({'kind': 'pcb', 'id': pcb.id, 'label': pcb.serial_number}, [pcb])
+
+
+def batch_genealogy(batch_id):
+    """Genealogy of every board of a batch"""
+    batch = Batch.objects.select_related('pcb_type').get(id=batch_id)
+    pcbs = list(_pcbs().filter(batch=batch))
+    graph = _graph({'kind': 'batch', 'id': batch.id, 'label': batch.batch_number}, pcbs)
+    if not pcbs:
+        graph['batches'] = [_batch_node(batch)]
+    return graph
+
+
+def genealogy(kind, object_id):
+    """
+    Return the full traceability tree of a module, PCB or batch as plain
+    data: batches, modules with their test records, and PCBs with their
+    test runs, parameter values, question answers and attachments.
+
+    The number of queries is fixed per kind (at most nine) whatever the
+    number of boards, runs or files. Raises ValueError for an unknown kind
+    and the model's DoesNotExist for a missing object.
+    """
+    builders = {'module': module_genealogy, 'pcb': pcb_genealogy, 'batch': batch_genealogy}
+    if kind not in builders:
+        raise ValueError(f'Unknown genealogy root "{kind}"')
+    return builders[kind](object_id)
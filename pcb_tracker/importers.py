@@ -0,0 +1,159 @@
+import csv
+import io
+import os
+
+from .results import record_results
+
+
+# Number of spreadsheet rows validated and inserted per transaction
+DEFAULT_CHUNK_SIZE = 500
+
+SERIAL_HEADERS = {'serial_number', 'serial number', 'serial', 'pcb_serial', 'pcb serial'}
+NOTES_HEADERS = {'notes'}
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx')
+
+
+class ImportFormatError(Exception):
+    """Raised when an uploaded file cannot be read as a tester export"""
+
+
+def iter_csv_rows(fileobj):
+    """Yield the rows of a binary UTF-8 CSV file one at a time"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    try:
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except UnicodeDecodeError:
+                raise ImportFormatError('The file is not UTF-8 text. Save it as "CSV UTF-8".')
+            except csv.Error as e:
+                raise ImportFormatError(f'Line {reader.line_num}: {e}')
+            yield row
+    finally:
+        # Leave the underlying file open for the caller to close
+        text.detach()
+
+
+def iter_xlsx_rows(fileobj):
+    """Yield the rows of the first worksheet of an XLSX file one at a time"""
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f'Could not open workbook: {e}')
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_rows(fileobj, filename):
+    """Pick the row reader that matches the file extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return iter_csv_rows(fileobj)
+    if extension == '.xlsx':
+        return iter_xlsx_rows(fileobj)
+    raise ImportFormatError(f'Unsupported file type "{extension}". Use {" or ".join(SUPPORTED_EXTENSIONS)}.')
+
+
+def _cell(value):
+    """Normalize a spreadsheet cell, treating blanks as missing"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _parse_header(header):
+    """Return (serial column, notes column, {column index: label}) for the header row"""
+    serial_column = notes_column = None
+    value_columns = {}
+    for index, label in enumerate(header):
+        label = _cell(label)
+        if label is None:
+            continue
+        label = str(label)
+        if label.lower() in SERIAL_HEADERS and serial_column is None:
+            serial_column = index
+        elif label.lower() in NOTES_HEADERS and notes_column is None:
+            notes_column = index
+        else:
+            value_columns[index] = label
+    if serial_column is None:
+        raise ImportFormatError('The header row needs a "serial_number" column.')
+    return serial_column, notes_column, value_columns
+
+
+def import_results(rows, tester, chunk_size=DEFAULT_CHUNK_SIZE, on_reject=None):
+    """
+    Load tester export rows into TestMeasurement/ParameterMeasurement records.
+
+    The first non-empty row is the header: one column holds the PCB serial
+    number, an optional one holds notes and every other column is matched
+    against the TestParameter names and TestQuestion texts of each PCB's
+    test config. Rows are consumed lazily and recorded chunk_size at a time,
+    so only one chunk is ever held in memory. on_reject(row_number, serial,
+    errors) is called for every row that could not be recorded.
+    Returns a dict with the number of rows read, recorded and rejected.
+    """
+    summary = {'rows': 0, 'recorded': 0, 'rejected': 0}
+    rows = iter(rows)
+
+    header = None
+    row_number = 0
+    for row in rows:
+        row_number += 1
+        if any(_cell(value) is not None for value in row):
+            header = row
+            break
+    if header is None:
+        raise ImportFormatError('The file is empty.')
+    serial_column, notes_column, value_columns = _parse_header(header)
+
+    def flush(chunk):
+        report = record_results([entry for number, entry in chunk], tester)
+        for (number, entry), result in zip(chunk, report):
+            if result['status'] == 'ok':
+                summary['recorded'] += 1
+            else:
+                summary['rejected'] += 1
+                if on_reject:
+                    on_reject(number, entry['serial_number'], result['errors'])
+
+    chunk = []
+    for row in rows:
+        row_number += 1
+        row = list(row)
+        if not any(_cell(value) is not None for value in row):
+            continue
+        summary['rows'] += 1
+        row.extend([None] * (len(header) - len(row)))
+
+        serial = _cell(row[serial_column])
+        if serial is None:
+            summary['rejected'] += 1
+            if on_reject:
+                on_reject(row_number, '', ['Missing serial number'])
+            continue
+
+        chunk.append((row_number, {
+            'serial_number': str(serial),
+            'values': {label: _cell(row[index]) for index, label in value_columns.items()},
+            'notes': _cell(row[notes_column]) if notes_column is not None else '',
+        }))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+
+    if chunk:
+        flush(chunk)
+
+    return summary
@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pcb_tracker.benchmark import BENCHMARK_EXCLUDED, benchmark_user, compare_reports, run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Time every pcb_tracker view through the test client and write a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', metavar='FILE',
+                            help='Write the JSON report to this file instead of standard output')
+        parser.add_argument('--compare', metavar='FILE',
+                            help='Earlier report to compare with; regressions make the command fail')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed requests per view (default: %(default)s)')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Untimed requests per view first (default: %(default)s)')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Slowdown of the median accepted by --compare (default: %(default)s)')
+        parser.add_argument('--user', default='benchmark',
+                            help='User to log in as; created with every group if missing (default: %(default)s)')
+        parser.add_argument('--exclude', action='append', default=[], metavar='URL_NAME',
+                            help='Leave out this view (can be repeated)')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['warmup'] < 0:
+            raise CommandError('--repeat must be at least 1 and --warmup not negative')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as source:
+                    baseline = json.load(source)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read {options["compare"]}: {e}')
+
+        def progress(name, result):
+            if 'skipped' in result:
+                self.stderr.write(f'{name}: skipped ({result["skipped"]})')
+            else:
+                self.stderr.write(f'{name}: {result["status"]}, {result["queries"]} queries, {result["median_ms"]:.1f} ms')
+
+        report = run_benchmark(
+            benchmark_user(options['user']), options['repeat'], options['warmup'],
+            BENCHMARK_EXCLUDED | set(options['exclude']), progress
+        )
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as target:
+                target.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+        if baseline is not None:
+            regressions = compare_reports(baseline, report, options['tolerance'])
+            for name, message in regressions:
+                self.stderr.write(self.style.ERROR(f'{name}: {message}'))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+            self.stderr.write(self.style.SUCCESS(f'No regressions against {options["compare"]}'))
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from pcb_tracker.blobs import DEFAULT_GRACE, adopt_legacy_attachments, collect_blobs, reconcile_blob_refs
+from pcb_tracker.uploads import expire_upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete attachment blobs that no attachment references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=DEFAULT_GRACE.total_seconds() / 3600,
+                            help='Keep unreferenced blobs touched this recently (default: %(default)s)')
+        parser.add_argument('--no-reconcile', action='store_true',
+                            help='Trust the stored reference counts instead of recounting them first')
+        parser.add_argument('--adopt-legacy', action='store_true',
+                            help='First move attachments stored under their upload names into the blob store')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['adopt_legacy']:
+            moved, missing = adopt_legacy_attachments(dry_run)
+            self.stdout.write(f'{moved} legacy attachment(s) moved into the blob store, {missing} file(s) missing')
+        expired = expire_upload_sessions(dry_run=dry_run)
+        if expired:
+            self.stdout.write(f'{expired} abandoned upload session(s) discarded')
+        if not options['no_reconcile'] and not dry_run:
+            for digest, stored, actual in reconcile_blob_refs():
+                self.stdout.write(f'{digest}: {stored} -> {actual} reference(s)')
+        removed, stray, freed = collect_blobs(timedelta(hours=options['grace_hours']), dry_run)
+        verb = 'Would remove' if dry_run else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {removed} unreferenced blob(s) and {stray} stray file(s), {freed} bytes'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pcb_tracker.evaluation import evaluate_batch
+from pcb_tracker.models import Batch
+
+
+class Command(BaseCommand):
+    help = 'Evaluate parameter measurements against their test limits and store pass/fail verdicts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', action='append', dest='batches', metavar='BATCH_NUMBER',
+                            help='Only evaluate this batch (can be repeated); defaults to every batch')
+
+    def handle(self, *args, **options):
+        batches = Batch.objects.order_by('id')
+        if options['batches']:
+            batches = batches.filter(batch_number__in=options['batches'])
+            missing = set(options['batches']) - set(batches.values_list('batch_number', flat=True))
+            if missing:
+                raise CommandError(f'Unknown batch(es): {", ".join(sorted(missing))}')
+
+        # One batch at a time keeps the arrays bounded by the size of a batch
+        for batch in batches.iterator():
+            result = evaluate_batch(batch)
+            self.stdout.write(
+                f'Batch {batch.batch_number}: {result["measurements"]} measurements, '
+                f'{result["failed"]} failed ({result["failed_values"]} of {result["values"]} values out of limits)'
+            )
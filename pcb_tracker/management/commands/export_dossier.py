@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pcb_tracker.dossier import dossier_filename, dossier_pcbs, stream_dossier
+from pcb_tracker.models import Batch, Module
+
+
+class Command(BaseCommand):
+    help = 'Write the traceability dossier (CSV tables and attached reports) of a module or batch to a ZIP file'
+
+    def add_arguments(self, parser):
+        root = parser.add_mutually_exclusive_group(required=True)
+        root.add_argument('--module', metavar='MODULE_SERIAL_NUMBER', help='Module to export')
+        root.add_argument('--batch', metavar='BATCH_NUMBER', help='Batch to export')
+        parser.add_argument('--output', help='ZIP file to write; defaults to dossier_<kind>_<name>.zip in the current directory')
+
+    def handle(self, *args, **options):
+        if options['module']:
+            kind = 'module'
+            found = Module.objects.filter(module_serial_number=options['module']).values_list('id', flat=True).first()
+        else:
+            kind = 'batch'
+            found = Batch.objects.filter(batch_number=options['batch']).values_list('id', flat=True).first()
+        if found is None:
+            raise CommandError(f'Unknown {kind} "{options[kind]}"')
+
+        label, pcbs, modules = dossier_pcbs(kind, found)
+        output = options['output'] or dossier_filename(kind, label)
+        written = 0
+        with open(output, 'wb') as archive:
+            for chunk in stream_dossier(kind, found):
+                archive.write(chunk)
+                written += len(chunk)
+        self.stdout.write(f'Wrote {output} ({written} bytes)')
@@ -0,0 +1,56 @@
+import time
+from collections import Counter
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pcb_tracker.extraction import EXTRACT_BATCH_SIZE, EXTRACT_WORKERS, extract_pending, extraction_pool
+from pcb_tracker.models import FileAttachment
+
+
+class Command(BaseCommand):
+    help = 'Read measurement values from uploaded test report spreadsheets into their test runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=EXTRACT_WORKERS,
+                            help='Parser processes (default: %(default)s)')
+        parser.add_argument('--batch-size', type=int, default=EXTRACT_BATCH_SIZE,
+                            help='Attachments claimed per round (default: %(default)s)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling the queue when it is empty')
+        parser.add_argument('--interval', type=float, default=10.0, metavar='SECONDS',
+                            help='Polling interval with --loop (default: %(default)s)')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Queue the attachments that failed to parse again first')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1')
+        if options['retry_failed']:
+            requeued = FileAttachment.objects.filter(parse_status='failed').update(parse_status='pending')
+            self.stdout.write(f'{requeued} failed attachment(s) queued again')
+
+        totals = Counter()
+        executor = extraction_pool(options['workers'])
+        try:
+            while True:
+                try:
+                    statuses = extract_pending(executor, options['batch_size'])
+                except BrokenProcessPool:
+                    # The attachments of the round were marked failed; start fresh workers
+                    executor.shutdown(wait=False)
+                    executor = extraction_pool(options['workers'])
+                    continue
+                totals.update(statuses)
+                if statuses:
+                    self.stdout.write(', '.join(f'{count} {status}' for status, count in sorted(statuses.items())))
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown()
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(totals.items())) or 'nothing queued'
+        self.stdout.write(self.style.SUCCESS(f'Report extraction finished: {summary}'))
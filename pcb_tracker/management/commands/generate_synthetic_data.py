@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pcb_tracker.models import PCBType
+from pcb_tracker.synthetic import SYNTHETIC_CHUNK_SIZE, generate, refresh_derived_data
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic production history for performance work'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pcbs', type=int, default=10000,
+                            help='Boards to create (default: %(default)s)')
+        parser.add_argument('--prefix', default='SYN',
+                            help='Prefix of every generated name and serial number (default: %(default)s)')
+        parser.add_argument('--pcb-types', type=int, default=5,
+                            help='PCB types, each with its own test configuration (default: %(default)s)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Boards per batch (default: %(default)s)')
+        parser.add_argument('--parameters', type=int, default=8,
+                            help='Test parameters per configuration (default: %(default)s)')
+        parser.add_argument('--questions', type=int, default=2,
+                            help='Test questions per configuration (default: %(default)s)')
+        parser.add_argument('--runs', type=int, default=1,
+                            help='Test runs per tested board (default: %(default)s)')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Length of the production history (default: %(default)s)')
+        parser.add_argument('--defect-rate', type=float, default=0.02,
+                            help='Share of test runs with a value out of limits (default: %(default)s)')
+        parser.add_argument('--pcbs-per-module', type=int, default=4,
+                            help='Boards assembled into each module (default: %(default)s)')
+        parser.add_argument('--chunk-size', type=int, default=SYNTHETIC_CHUNK_SIZE,
+                            help='Boards written per transaction (default: %(default)s)')
+        parser.add_argument('--seed', type=int,
+                            help='Random seed, for a reproducible dataset')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild the counters, rollups, SPC aggregates and snapshots afterwards')
+
+    def handle(self, *args, **options):
+        for name in ('pcbs', 'pcb_types', 'batch_size', 'parameters', 'runs', 'days', 'pcbs_per_module', 'chunk_size'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+        if not 0 <= options['defect_rate'] <= 1:
+            raise CommandError('--defect-rate must be between 0 and 1')
+        prefix = options['prefix']
+        if PCBType.objects.filter(name__startswith=f'{prefix} Type ').exists():
+            raise CommandError(f'Synthetic data with the prefix {prefix} already exists; choose another --prefix')
+
+        started = time.monotonic()
+
+        def progress(done):
+            rate = done / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f'{done}/{options["pcbs"]} boards ({rate:.0f}/s)')
+
+        created, catalogue = generate(
+            prefix, options['pcbs'],
+            pcb_types=options['pcb_types'],
+            batch_size=options['batch_size'],
+            parameters=options['parameters'],
+            questions=options['questions'],
+            runs=options['runs'],
+            days=options['days'],
+            defect_rate=options['defect_rate'],
+            pcbs_per_module=options['pcbs_per_module'],
+            chunk_size=options['chunk_size'],
+            seed=options['seed'],
+            progress=progress
+        )
+        self.stdout.write(', '.join(f'{count} {model}' for model, count in created.items()))
+        if not options['skip_derived']:
+            self.stdout.write('Rebuilding counters, rollups, SPC aggregates and snapshots...')
+            refresh_derived_data(catalogue)
+        self.stdout.write(self.style.SUCCESS(f'Synthetic data generated in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,51 @@
+import csv
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from pcb_tracker.importers import DEFAULT_CHUNK_SIZE, ImportFormatError, import_results, iter_rows
+
+
+class Command(BaseCommand):
+    help = 'Import PCB test results from a CSV or XLSX tester export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file exported by the tester')
+        parser.add_argument('--tester', required=True, help='Username recorded as the tester of the imported results')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows inserted per transaction')
+        parser.add_argument('--rejects', help='Write the reject report to this CSV file instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            tester = User.objects.get(username=options['tester'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["tester"]}" does not exist.')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+
+        report_file = open(options['rejects'], 'w', newline='') if options['rejects'] else sys.stdout
+        try:
+            writer = csv.writer(report_file)
+            writer.writerow(['row', 'serial_number', 'errors'])
+
+            def on_reject(row_number, serial, errors):
+                writer.writerow([row_number, serial, '; '.join(errors)])
+
+            try:
+                with open(options['path'], 'rb') as fileobj:
+                    summary = import_results(
+                        iter_rows(fileobj, options['path']),
+                        tester,
+                        chunk_size=options['chunk_size'],
+                        on_reject=on_reject
+                    )
+            except (OSError, ImportFormatError) as e:
+                raise CommandError(str(e))
+        finally:
+            if report_file is not sys.stdout:
+                report_file.close()
+
+        self.stderr.write(
+            f'Read {summary["rows"]} rows: {summary["recorded"]} recorded, {summary["rejected"]} rejected.'
+        )
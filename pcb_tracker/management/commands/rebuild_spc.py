@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from pcb_tracker.spc import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the SPC running aggregates and control chart subgroups from the measurement snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parameter', action='append', type=int, dest='parameters', metavar='PARAMETER_ID',
+                            help='Only rebuild this test parameter (can be repeated); defaults to every parameter')
+        parser.add_argument('--rebuild-snapshots', action='store_true',
+                            help='Rewrite the measurement snapshots from scratch first, e.g. after values were deleted by hand')
+
+    def handle(self, *args, **options):
+        total = rebuild(options['parameters'], options['rebuild_snapshots'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt SPC aggregates from {total} value(s)'))
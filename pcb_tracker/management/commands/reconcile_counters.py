@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from pcb_tracker.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard status counters from the PCB and module tables'
+
+    def handle(self, *args, **options):
+        corrections = reconcile_counters()
+        for entity, pcb_type_id, status, stored, actual in sorted(corrections, key=lambda row: (row[0], row[1] or 0, row[2])):
+            self.stdout.write(f'{entity} type={pcb_type_id or "-"} {status}: {stored} -> {actual}')
+        self.stdout.write(self.style.SUCCESS(f'{len(corrections)} counter(s) corrected'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pcb_tracker.models import TestConfig
+from pcb_tracker.snapshots import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Append new test measurements to the columnar measurement snapshots used by analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config', action='append', type=int, dest='configs', metavar='TEST_CONFIG_ID',
+                            help='Only refresh this test configuration (can be repeated); defaults to every one')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rewrite the snapshots from scratch instead of appending')
+
+    def handle(self, *args, **options):
+        configs = options['configs']
+        if configs:
+            missing = set(configs) - set(TestConfig.objects.filter(id__in=configs).values_list('id', flat=True))
+            if missing:
+                raise CommandError(f'Unknown test configuration(s): {", ".join(str(config) for config in sorted(missing))}')
+
+        for test_config_id, appended in refresh_snapshots(configs, options['rebuild']).items():
+            self.stdout.write(f'Test configuration {test_config_id}: {appended} row(s) appended')
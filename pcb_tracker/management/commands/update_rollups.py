@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pcb_tracker.rollups import DEFAULT_LAG, rebuild_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold production changes since the last run into the daily rollup tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag', type=int, default=int(DEFAULT_LAG.total_seconds()), metavar='SECONDS',
+                            help='Leave changes younger than this for the next run (default: %(default)s)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Discard the rollups and recompute them from the whole history')
+
+    def handle(self, *args, **options):
+        if options['lag'] < 0:
+            raise CommandError('--lag must not be negative')
+        lag = timedelta(seconds=options['lag'])
+        start, end, rows = rebuild_rollups(lag) if options['rebuild'] else update_rollups(lag)
+        if start == end:
+            self.stdout.write('Nothing to do; the rollups are up to date.')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rolled up changes from {start:%Y-%m-%d %H:%M:%S} to {end:%Y-%m-%d %H:%M:%S} into {rows} row(s)'))
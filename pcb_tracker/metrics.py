@@ -0,0 +1,370 @@
+import atexit
+import fcntl
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+# Set to False to turn the request instrumentation off
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', True)
+
+# Directory shared by the server's worker processes; each one writes its own
+# figures there and /metrics adds them up. None keeps them in this process only
+METRICS_DIR = getattr(settings, 'METRICS_DIR', None)
+
+# Bearer token that lets a scraper read /metrics without a staff login. Not an
+# address list: behind the proxy every request comes from 127.0.0.1
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+
+# Seconds between two writes of this process's figures to METRICS_DIR
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+# File in METRICS_DIR adding up the figures of every worker that has exited
+EXITED_FILE = 'metrics-exited.json'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SQL_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RESPONSE_SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Queries and SQL seconds of the request being handled; the list is shared with
+# the threads the request's ORM calls run in, which see a copy of the context
+_current_request = ContextVar('pcb_tracker_metrics_request', default=None)
+
+
+class Histogram:
+    """
+    Prometheus-style histogram keyed by a tuple of label values. Each series
+    is a list of per-bucket counts (the last one for +Inf), then the sum and
+    the number of observations.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self, series):
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                yield '_bucket', labels + (_format_number(bound),), ('le',), cumulative
+            yield '_sum', labels, (), values[-2]
+            yield '_count', labels, (), values[-1]
+
+
+class Counter:
+    """Prometheus-style counter keyed by a tuple of label values"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def samples(self, series):
+        for labels, value in sorted(series.items()):
+            yield '', labels, (), value
+
+
+REQUEST_DURATION = Histogram('pcb_tracker_request_duration_seconds', 'Time spent handling a request', ('view',), LATENCY_BUCKETS)
+REQUEST_QUERIES = Histogram('pcb_tracker_request_queries', 'SQL queries run by a request', ('view',), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_TIME = Histogram('pcb_tracker_request_sql_seconds', 'Time spent in SQL queries by a request', ('view',), SQL_TIME_BUCKETS)
+RESPONSE_SIZE = Histogram('pcb_tracker_response_size_bytes', 'Size of the response body', ('view',), RESPONSE_SIZE_BUCKETS)
+REQUESTS = Counter('pcb_tracker_requests_total', 'Requests handled, by view and status code', ('view', 'status'))
+
+METRICS = (REQUEST_DURATION, REQUEST_QUERIES, REQUEST_SQL_TIME, RESPONSE_SIZE, REQUESTS)
+
+_lock = threading.Lock()
+_last_flush = 0.0
+# Process that last wrote its file, to spot a fork or a reused pid
+_flushed_pid = None
+
+
+def _format_number(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every database connection"""
+    current = _current_request.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current[0] += 1
+        current[1] += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if METRICS_ENABLED and _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+def _response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    length = response.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def observe_request(request, response, duration, queries, sql_time):
+    """Add one request to this process's figures"""
+    view = _view_label(request)
+    if view == 'metrics':
+        return
+    size = _response_size(response)
+    with _lock:
+        REQUEST_DURATION.observe((view,), duration)
+        REQUEST_QUERIES.observe((view,), queries)
+        REQUEST_SQL_TIME.observe((view,), sql_time)
+        if size is not None:
+            RESPONSE_SIZE.observe((view,), size)
+        REQUESTS.inc((view, str(response.status_code)))
+    if METRICS_DIR and time.monotonic() - _last_flush >= METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def _process_file(pid=None):
+    return os.path.join(METRICS_DIR, f'metrics-{pid or os.getpid()}.json')
+
+
+def _process_files():
+    """[(pid, path)] of the per-process files in METRICS_DIR"""
+    files = []
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.json')):
+        pid = os.path.basename(path)[len('metrics-'):-len('.json')]
+        if pid.isdigit():
+            files.append((int(pid), path))
+    return files
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _locked(exclusive):
+    """Hold the lock of METRICS_DIR: exclusive to fold files, shared to read them"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(os.path.join(METRICS_DIR, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def _snapshot():
+    with _lock:
+        return {metric.name: [[list(labels), values] for labels, values in metric.series.items()] for metric in METRICS}
+
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, snapshot):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as target:
+        json.dump(snapshot, target)
+    os.replace(temporary, path)
+
+
+def _fold(paths):
+    """
+    Add the files of exited processes to EXITED_FILE and delete them, so
+    their counts survive without one more file to read per scrape. The
+    caller holds the exclusive lock.
+    """
+    exited = os.path.join(METRICS_DIR, EXITED_FILE)
+    snapshots = [_read(path) for path in [exited, *paths]]
+    _write(exited, {
+        name: [[list(labels), values] for labels, values in series.items()]
+        for name, series in _merge_snapshots(snapshot for snapshot in snapshots if snapshot).items()
+    })
+    for path in paths:
+        os.unlink(path)
+
+
+def flush():
+    """Write this process's figures to METRICS_DIR, replacing its previous file"""
+    global _last_flush, _flushed_pid
+    if not METRICS_DIR:
+        return
+    _last_flush = time.monotonic()
+    path = _process_file()
+    if _flushed_pid != os.getpid():
+        # A file under this pid was left by an exited process that had it before
+        if os.path.exists(path):
+            with _locked(True):
+                if os.path.exists(path):
+                    _fold([path])
+        _flushed_pid = os.getpid()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write(path, _snapshot())
+
+
+atexit.register(flush)
+
+
+def _merge(into, values):
+    if isinstance(values, list):
+        if into is None:
+            return list(values)
+        return [a + b for a, b in zip(into, values)]
+    return (into or 0) + values
+
+
+def _merge_snapshots(snapshots):
+    merged = {metric.name: {} for metric in METRICS}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            if name not in merged:
+                continue
+            for labels, values in series:
+                labels = tuple(labels)
+                merged[name][labels] = _merge(merged[name].get(labels), values)
+    return merged
+
+
+def collect():
+    """
+    {metric name: {labels: values}} over every worker process: this one's
+    live figures plus the files the others last wrote to METRICS_DIR. The
+    files of exited workers are folded into EXITED_FILE first, so their
+    counts never go backwards and the number of files stays bounded.
+    """
+    snapshots = [_snapshot()]
+    if METRICS_DIR:
+        own = os.getpid()
+        if any(pid != own and not _alive(pid) for pid, path in _process_files()):
+            with _locked(True):
+                _fold([path for pid, path in _process_files() if pid != own and not _alive(pid)])
+        with _locked(False):
+            for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.json')):
+                if path == _process_file():
+                    continue
+                snapshot = _read(path)
+                # None: being replaced right now; its figures appear on the next scrape
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+    return _merge_snapshots(snapshots)
+
+
+def can_read_metrics(request):
+    """Staff users, or a scraper sending METRICS_TOKEN as a bearer token"""
+    if request.user.is_staff:
+        return True
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return bool(METRICS_TOKEN) and scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode())
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    merged = collect()
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for suffix, labels, extra_names, value in metric.samples(merged[metric.name]):
+            names = metric.label_names + extra_names
+            label_text = ','.join(f'{name}="{_escape(label)}"' for name, label in zip(names, labels))
+            lines.append(f'{metric.name}{suffix}{{{label_text}}} {_format_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, SQL query count and time, and response size of
+    every request, per view. Queries are counted by an execute wrapper on
+    each connection, so the cost is two clock reads per query and a few
+    dictionary updates per request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not METRICS_ENABLED:
+            return self.get_response(request)
+        current = [0, 0.0]
+        token = _current_request.set(current)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        observe_request(request, response, time.perf_counter() - start, *current)
+        return response
+
+    async def __acall__(self, request):
+        if not METRICS_ENABLED:
+            return await self.get_response(request)
+        current = [0, 0.0]
+        token = _current_request.set(current)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        observe_request(request, response, time.perf_counter() - start, *current)
+        return response
@@ -33,7 +33,11 @@ def create_user_groups(apps, schema_editor):
     # Define permissions for each group
     pcb_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'PCB'))
     batch_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'Batch'))
-    pcb_type_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'PCBType'))
+    try:
+        pcb_type_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'PCBType'))
+    except LookupError:
+        # PCBType is added by 0005; 0006 grants its permissions
+        pcb_type_content_type = None
     test_measurement_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'TestMeasurement'))
     module_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'Module'))
     module_test_record_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'ModuleTestRecord'))
@@ -44,11 +48,15 @@ def create_user_groups(apps, schema_editor):
         test_config_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'TestConfig'))
         test_parameter_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'TestParameter'))
         test_question_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'TestQuestion'))
+        parameter_measurement_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'ParameterMeasurement'))
+        question_response_content_type = ContentType.objects.get_for_model(apps.get_model('pcb_tracker', 'QuestionResponse'))
     except:
         # If models don't exist yet in this migration, we'll add permissions later
         test_config_content_type = None
         test_parameter_content_type = None
         test_question_content_type = None
+        parameter_measurement_content_type = None
+        question_response_content_type = None
     
     permissions_config = {
         'pcb_testing': [
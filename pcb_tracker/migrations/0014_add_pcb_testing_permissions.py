@@ -13,11 +13,11 @@ def add_pcb_testing_permissions(apps, schema_editor):
         pcb_testing_group, created = Group.objects.get_or_create(name='pcb_testing')
         
         # Get content types for the relevant models
-        pcb_content_type = ContentType.objects.get(app_label='pcb_tracker', model='pcb')
-        testmeasurement_content_type = ContentType.objects.get(app_label='pcb_tracker', model='testmeasurement')
-        parametermeasurement_content_type = ContentType.objects.get(app_label='pcb_tracker', model='parametermeasurement')
-        questionresponse_content_type = ContentType.objects.get(app_label='pcb_tracker', model='questionresponse')
-        fileattachment_content_type = ContentType.objects.get(app_label='pcb_tracker', model='fileattachment')
+        pcb_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='pcb')[0]
+        testmeasurement_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='testmeasurement')[0]
+        parametermeasurement_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='parametermeasurement')[0]
+        questionresponse_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='questionresponse')[0]
+        fileattachment_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='fileattachment')[0]
         
         # Define the permissions needed for PCB testing
         permissions_to_add = [
@@ -84,11 +84,11 @@ def reverse_add_pcb_testing_permissions(apps, schema_editor):
             return
         
         # Get content types for the relevant models
-        pcb_content_type = ContentType.objects.get(app_label='pcb_tracker', model='pcb')
-        testmeasurement_content_type = ContentType.objects.get(app_label='pcb_tracker', model='testmeasurement')
-        parametermeasurement_content_type = ContentType.objects.get(app_label='pcb_tracker', model='parametermeasurement')
-        questionresponse_content_type = ContentType.objects.get(app_label='pcb_tracker', model='questionresponse')
-        fileattachment_content_type = ContentType.objects.get(app_label='pcb_tracker', model='fileattachment')
+        pcb_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='pcb')[0]
+        testmeasurement_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='testmeasurement')[0]
+        parametermeasurement_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='parametermeasurement')[0]
+        questionresponse_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='questionresponse')[0]
+        fileattachment_content_type = ContentType.objects.get_or_create(app_label='pcb_tracker', model='fileattachment')[0]
         
         # Define the permissions that were added
         permissions_to_remove = [
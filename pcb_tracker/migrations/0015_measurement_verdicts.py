@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0014_add_pcb_testing_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parametermeasurement',
+            name='verdict',
+            field=models.CharField(blank=True, choices=[('pass', 'Pass'), ('fail', 'Fail')], db_index=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='testmeasurement',
+            name='verdict',
+            field=models.CharField(choices=[('pending', 'Not Evaluated'), ('pass', 'Pass'), ('fail', 'Fail')], db_index=True, default='pending', max_length=10),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    """Count the existing PCBs and modules so the dashboard starts out correct"""
+    PCB = apps.get_model('pcb_tracker', 'PCB')
+    Module = apps.get_model('pcb_tracker', 'Module')
+    StatusCounter = apps.get_model('pcb_tracker', 'StatusCounter')
+    rows = [
+        StatusCounter(entity='pcb', pcb_type_id=pcb_type_id, status=status, count=total)
+        for pcb_type_id, status, total in PCB.objects.order_by().values_list('batch__pcb_type', 'status').annotate(total=models.Count('id'))
+    ]
+    rows += [
+        StatusCounter(entity='module', pcb_type_id=None, status=status, count=total)
+        for status, total in Module.objects.order_by().values_list('status').annotate(total=models.Count('id'))
+    ]
+    StatusCounter.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0015_measurement_verdicts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('pcb', 'PCB'), ('module', 'Module')], max_length=10)),
+                ('status', models.CharField(max_length=30)),
+                ('count', models.BigIntegerField(default=0)),
+                ('pcb_type', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pcb_tracker.pcbtype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('entity', 'pcb_type', 'status'), name='unique_status_counter')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0016_status_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyModuleRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('assembled', models.PositiveIntegerField(default=0)),
+                ('tests_passed', models.PositiveIntegerField(default=0)),
+                ('tests_failed', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('high_water', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pcb',
+            name='rolled_up_status',
+            field=models.CharField(blank=True, default='', max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='module',
+            name='assembly_date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='moduletestrecord',
+            name='test_date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='pcb',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='testmeasurement',
+            name='test_date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='DailyProductionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('tested', models.PositiveIntegerField(default=0)),
+                ('verified', models.PositiveIntegerField(default=0)),
+                ('assembled', models.PositiveIntegerField(default=0)),
+                ('tests', models.PositiveIntegerField(default=0)),
+                ('tests_failed', models.PositiveIntegerField(default=0)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='pcb_tracker.batch')),
+                ('pcb_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='pcb_tracker.pcbtype')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'batch'), name='unique_daily_production_rollup')],
+            },
+        ),
+    ]
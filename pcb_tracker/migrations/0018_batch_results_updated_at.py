@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0017_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='results_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0018_batch_results_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.BigIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('m2', models.FloatField(default=0)),
+                ('min_value', models.FloatField(blank=True, null=True)),
+                ('max_value', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_stats', to='pcb_tracker.batch')),
+                ('test_parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='pcb_tracker.testparameter')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('test_parameter', 'batch'), name='unique_parameter_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ParameterSubgroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('m2', models.FloatField(default=0)),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_subgroups', to='pcb_tracker.batch')),
+                ('test_parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subgroups', to='pcb_tracker.testparameter')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['test_parameter', 'batch', 'id'], name='pcb_tracker_test_pa_581741_idx')],
+            },
+        ),
+    ]
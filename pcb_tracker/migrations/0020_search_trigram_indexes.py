@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# (index name, table, column); the expression matches what icontains compiles
+# to on PostgreSQL, UPPER(column::text), so the planner can use the index
+TRIGRAM_INDEXES = [
+    ('pcb_serial_number_trgm', 'pcb_tracker_pcb', 'serial_number'),
+    ('pcb_notes_trgm', 'pcb_tracker_pcb', 'notes'),
+    ('batch_number_trgm', 'pcb_tracker_batch', 'batch_number'),
+    ('pcbtype_name_trgm', 'pcb_tracker_pcbtype', 'name'),
+    ('testconfig_name_trgm', 'pcb_tracker_testconfig', 'name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Trigram GIN indexes exist only on PostgreSQL; other backends keep plain scans"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0019_spc_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0020_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='pcbtype',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:07
+
+import pcb_tracker.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0021_reference_data_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fileattachment',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='fileattachment',
+            name='file',
+            field=models.FileField(max_length=255, storage=pcb_tracker.storage.attachment_storage, upload_to='attachments/'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:11
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0022_content_addressed_attachments'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_type', models.CharField(choices=[('pcb_test', 'PCB Test Report'), ('functional_test', 'Functional Test Report'), ('environmental_test', 'Environmental Test Report'), ('other', 'Other')], default='pcb_test', max_length=20)),
+                ('description', models.TextField(blank=True)),
+                ('size', models.BigIntegerField()),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('open', 'Receiving'), ('complete', 'Complete'), ('failed', 'Failed')], default='open', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attachment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='pcb_tracker.fileattachment')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+                ('pcb', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='pcb_tracker.pcb')),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0023_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileattachment',
+            name='parse_message',
+            field=models.TextField(blank=True),
+        ),
+        # Existing attachments are left out of the extraction queue
+        migrations.AddField(
+            model_name='fileattachment',
+            name='parse_status',
+            field=models.CharField(blank=True, choices=[('', 'Not queued'), ('pending', 'Pending'), ('parsing', 'Parsing'), ('parsed', 'Parsed'), ('skipped', 'Skipped'), ('failed', 'Failed')], db_index=True, default='', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='fileattachment',
+            name='parse_status',
+            field=models.CharField(blank=True, choices=[('', 'Not queued'), ('pending', 'Pending'), ('parsing', 'Parsing'), ('parsed', 'Parsed'), ('skipped', 'Skipped'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='fileattachment',
+            name='parsed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileattachment',
+            name='parsed_values',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:34
+
+from django.db import migrations, models
+
+
+def create_role_version(apps, schema_editor):
+    apps.get_model('pcb_tracker', 'RoleVersion').objects.get_or_create(id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0024_report_extraction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_role_version, migrations.RunPython.noop),
+    ]
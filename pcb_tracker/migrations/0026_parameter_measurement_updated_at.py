@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_tracker', '0025_role_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parametermeasurement',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
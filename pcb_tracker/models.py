@@ -1,7 +1,12 @@
+import os
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
 
+from .storage import attachment_storage
+
 
 class PCBType(models.Model):
     """
@@ -10,6 +15,7 @@ class PCBType(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -26,6 +32,9 @@ class Batch(models.Model):
     pcb_type = models.ForeignKey(PCBType, on_delete=models.CASCADE, related_name='batches', null=True, blank=True)
     production_date = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped whenever test results of the batch change; versions the yield cache
+    results_updated_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         if self.pcb_type:
@@ -74,8 +83,10 @@ class PCB(models.Model):
     test_config = models.ForeignKey(TestConfig, on_delete=models.SET_NULL, null=True, blank=True, related_name='pcbs')
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     notes = models.TextField(blank=True)
+    # Furthest milestone already counted in the daily rollups (see rollups.py)
+    rolled_up_status = models.CharField(max_length=30, blank=True, default='')
     
     def __str__(self):
         return f"PCB {self.serial_number} - Batch {self.batch.batch_number}"
@@ -134,6 +145,13 @@ class TestMeasurement(models.Model):
     """
     Model to store test measurements for a PCB
     """
+    # Overall verdict against the test parameter limits
+    VERDICT_CHOICES = [
+        ('pending', 'Not Evaluated'),
+        ('pass', 'Pass'),
+        ('fail', 'Fail'),
+    ]
+    
     pcb = models.ForeignKey(PCB, on_delete=models.CASCADE, related_name='measurements')
     test_config = models.ForeignKey(TestConfig, on_delete=models.CASCADE, related_name='test_measurements', null=True, blank=True)
     voltage = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
@@ -141,8 +159,9 @@ class TestMeasurement(models.Model):
     temperature = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     other_measurements = models.JSONField(default=dict, blank=True)  # For additional measurements
     tester = models.ForeignKey(User, on_delete=models.CASCADE)
-    test_date = models.DateTimeField(auto_now_add=True)
+    test_date = models.DateTimeField(auto_now_add=True, db_index=True)
     notes = models.TextField(blank=True)
+    verdict = models.CharField(max_length=10, choices=VERDICT_CHOICES, default='pending', db_index=True)
     
     def __str__(self):
         return f"Measurements for {self.pcb.serial_number} - {self.test_date}"
@@ -152,11 +171,20 @@ class ParameterMeasurement(models.Model):
     """
     Model to store individual parameter measurements according to test config
     """
+    # Verdict of the value against the parameter's min/max limits
+    VERDICT_CHOICES = [
+        ('pass', 'Pass'),
+        ('fail', 'Fail'),
+    ]
+    
     test_measurement = models.ForeignKey(TestMeasurement, on_delete=models.CASCADE, related_name='parameter_measurements')
     test_parameter = models.ForeignKey(TestParameter, on_delete=models.CASCADE)
     value = models.DecimalField(max_digits=15, decimal_places=6)
     unit = models.CharField(max_length=20, blank=True)  # Override default unit if needed
     notes = models.TextField(blank=True)
+    verdict = models.CharField(max_length=10, choices=VERDICT_CHOICES, blank=True, db_index=True)  # Blank until evaluated
+    # Lets snapshot refreshes find values added to or edited in older test runs
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return f"{self.test_parameter.name}: {self.value} {self.unit}"
@@ -192,17 +220,86 @@ class FileAttachment(models.Model):
         ('environmental_test', 'Environmental Test Report'),
         ('other', 'Other'),
     ]
+    PARSE_STATUS_CHOICES = [
+        ('', 'Not queued'),
+        ('pending', 'Pending'),
+        ('parsing', 'Parsing'),
+        ('parsed', 'Parsed'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    ]
     
     pcb = models.ForeignKey(PCB, on_delete=models.CASCADE, related_name='attachments', null=True, blank=True)
     file_type = models.CharField(max_length=20, choices=FILE_TYPE_CHOICES)
-    file = models.FileField(upload_to='attachments/')
+    # Stored once per distinct content under its digest (see storage.py)
+    file = models.FileField(upload_to='attachments/', storage=attachment_storage, max_length=255)
+    # Name of the file as uploaded; the stored name is the content digest
+    original_name = models.CharField(max_length=255, blank=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     upload_date = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True)
+    # Extraction of the measurement values in test reports (see extraction.py);
+    # blank for files uploaded before extraction existed, which are not queued
+    parse_status = models.CharField(max_length=10, choices=PARSE_STATUS_CHOICES, default='pending', blank=True, db_index=True)
+    parse_message = models.TextField(blank=True)
+    parsed_at = models.DateTimeField(null=True, blank=True)
+    parsed_values = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         pcb_info = f"for {self.pcb.serial_number}" if self.pcb else ""
         return f"{self.file_type} {pcb_info} - {self.upload_date}"
+    
+    @property
+    def display_name(self):
+        return self.original_name or os.path.basename(self.file.name)
+
+
+class Blob(models.Model):
+    """
+    One stored attachment content. ref_count is the number of FileAttachment
+    rows pointing at it, kept up to date by signals; collect_blobs deletes
+    blobs that nothing references any more.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.digest} ({self.ref_count} reference(s))"
+
+
+class UploadSession(models.Model):
+    """
+    An attachment sent in chunks that can be resumed after a dropped
+    connection (see uploads.py). The received bytes are kept in a partial
+    file and offset counts them; once all of them have arrived and the hash
+    matches, the file becomes a blob and is attached to the PCB.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Receiving'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    ]
+    
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=20, choices=FileAttachment.FILE_TYPE_CHOICES, default='pcb_test')
+    description = models.TextField(blank=True)
+    size = models.BigIntegerField()
+    # SHA-256 the client announced; filled from the received bytes if it sent none
+    sha256 = models.CharField(max_length=64, blank=True)
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    # Set when the test submission the file belongs to is recorded
+    pcb = models.ForeignKey(PCB, on_delete=models.CASCADE, related_name='upload_sessions', null=True, blank=True)
+    attachment = models.ForeignKey(FileAttachment, on_delete=models.SET_NULL, related_name='upload_sessions', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.file_name} ({self.offset}/{self.size} bytes, {self.status})"
 
 
 class Module(models.Model):
@@ -221,7 +318,7 @@ class Module(models.Model):
     module_serial_number = models.CharField(max_length=100, unique=True)
     pcbs = models.ManyToManyField(PCB, related_name='modules')
     assembler = models.ForeignKey(User, on_delete=models.CASCADE, related_name='assembled_modules')
-    assembly_date = models.DateTimeField(auto_now_add=True)
+    assembly_date = models.DateTimeField(auto_now_add=True, db_index=True)
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='assembled')
     notes = models.TextField(blank=True)
     
@@ -246,7 +343,7 @@ class ModuleTestRecord(models.Model):
     test_type = models.CharField(max_length=20, choices=TEST_TYPE_CHOICES)
     result = models.CharField(max_length=10, choices=[('pass', 'Pass'), ('fail', 'Fail')])
     tester = models.ForeignKey(User, on_delete=models.CASCADE)
-    test_date = models.DateTimeField(auto_now_add=True)
+    test_date = models.DateTimeField(auto_now_add=True, db_index=True)
     notes = models.TextField(blank=True)
     
     def __str__(self):
@@ -263,4 +360,140 @@ class UserGroupExtension(models.Model):
     department = models.CharField(max_length=50, help_text="Department the group belongs to")
     
     def __str__(self):
-        return f"{self.group.name} Extension"
\ No newline at end of file
+        return f"{self.group.name} Extension"
+
+
+class StatusCounter(models.Model):
+    """
+    Running number of PCBs or modules per PCB type and status.
+
+    Kept up to date in the same transaction as every status change, create and
+    delete so the dashboard never has to count the large tables. Modules and
+    PCBs of batches without a type are counted with an empty pcb_type.
+    """
+    ENTITY_CHOICES = [
+        ('pcb', 'PCB'),
+        ('module', 'Module'),
+    ]
+    
+    entity = models.CharField(max_length=10, choices=ENTITY_CHOICES)
+    # No database constraint: PCBs deleted by a PCB type cascade may decrement
+    # these rows after the type itself is gone; reconcile_counters drops them
+    pcb_type = models.ForeignKey(PCBType, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=30)
+    count = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.entity} {self.pcb_type_id or '-'} {self.status}: {self.count}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['entity', 'pcb_type', 'status'], name='unique_status_counter'),
+        ]
+
+
+class DailyProductionRollup(models.Model):
+    """
+    PCB throughput of one batch on one day, maintained incrementally by the
+    update_rollups command so trend reports never scan the PCB history
+    """
+    day = models.DateField()
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='daily_rollups')
+    pcb_type = models.ForeignKey(PCBType, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_rollups')
+    created = models.PositiveIntegerField(default=0)
+    tested = models.PositiveIntegerField(default=0)
+    verified = models.PositiveIntegerField(default=0)
+    assembled = models.PositiveIntegerField(default=0)
+    tests = models.PositiveIntegerField(default=0)
+    tests_failed = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.day} {self.batch_id}"
+    
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'batch'], name='unique_daily_production_rollup'),
+        ]
+
+
+class DailyModuleRollup(models.Model):
+    """Modules assembled and module tests recorded on one day"""
+    day = models.DateField(unique=True)
+    assembled = models.PositiveIntegerField(default=0)
+    tests_passed = models.PositiveIntegerField(default=0)
+    tests_failed = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return str(self.day)
+    
+    class Meta:
+        ordering = ['-day']
+
+
+class RollupState(models.Model):
+    """High-water mark up to which a rollup source has been processed"""
+    name = models.CharField(max_length=50, unique=True)
+    high_water = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.high_water}"
+
+
+class ParameterStats(models.Model):
+    """
+    Running aggregates (Welford count, mean and sum of squared deviations)
+    of one test parameter's values in one batch. New values are merged in as
+    they are recorded, so capability figures never rescan the history.
+    """
+    test_parameter = models.ForeignKey(TestParameter, on_delete=models.CASCADE, related_name='stats')
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='parameter_stats')
+    count = models.BigIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)
+    min_value = models.FloatField(null=True, blank=True)
+    max_value = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.test_parameter_id} in batch {self.batch_id}: n={self.count}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test_parameter', 'batch'], name='unique_parameter_stats'),
+        ]
+
+
+class ParameterSubgroup(models.Model):
+    """
+    Aggregates of consecutive values of a test parameter in one batch; the
+    subgroups plotted on X-bar/R charts and merged for rolling windows
+    """
+    test_parameter = models.ForeignKey(TestParameter, on_delete=models.CASCADE, related_name='subgroups')
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='parameter_subgroups')
+    started_at = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    
+    def __str__(self):
+        return f"Subgroup {self.id} of {self.test_parameter_id} in batch {self.batch_id}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['test_parameter', 'batch', 'id']),
+        ]
+
+
+class RoleVersion(models.Model):
+    """
+    Single row counting changes to group memberships and groups. Cached
+    group names are keyed by it, so every server process sees a change
+    within ROLE_VERSION_TTL seconds of its commit.
+    """
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Roles version {self.version}"
@@ -0,0 +1,183 @@
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+
+
+# 'cursor' pages long lists by key instead of OFFSET; 'offset' keeps numbered pages
+LIST_PAGINATION = getattr(settings, 'LIST_PAGINATION', 'cursor')
+
+# In cursor mode, show the planner's row estimate (PostgreSQL only); COUNT(*) is never run
+LIST_PAGINATION_ESTIMATE_COUNT = getattr(settings, 'LIST_PAGINATION_ESTIMATE_COUNT', True)
+
+CURSOR_SALT = 'pcb_tracker.pagination'
+
+
+def estimated_count(queryset):
+    """
+    Approximate row count of a queryset from PostgreSQL statistics:
+    pg_class.reltuples for a whole table, the EXPLAIN row estimate for a
+    filtered one. None on other backends, which have no cheap estimate and
+    would scan the table on every page for an exact count.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # -1 means the table was never analyzed
+            if row and row[0] >= 0:
+                return row[0]
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CursorPage:
+    """
+    One page of a CursorPaginator. Iterates like a Django Page; instead of
+    page numbers it carries opaque tokens for the neighbouring pages.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None, count_is_estimate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_estimate = count_is_estimate
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over an ordered queryset.
+
+    Each page is read as "the next per_page rows after the last key seen",
+    so every page costs the same index range scan however deep it is, and
+    no COUNT(*) is needed. The ordering is taken from the queryset (its
+    fields must be non-null model fields or annotations) and the primary
+    key is added as the final tie-breaker.
+    """
+
+    def __init__(self, queryset, per_page, estimate_count=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.estimate_count = estimate_count
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not any(name.lstrip('-') in ('id', 'pk') for name in ordering):
+            ordering.append('-id' if ordering and ordering[0].startswith('-') else 'id')
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.queryset = queryset.order_by(*ordering)
+
+    def _key(self, obj):
+        values = []
+        for name, descending in self.ordering:
+            value = getattr(obj, 'pk' if name == 'pk' else name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def _parse_key(self, values):
+        parsed = []
+        for (name, descending), value in zip(self.ordering, values):
+            try:
+                field = self.queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations hold plain JSON numbers
+                parsed.append(value)
+                continue
+            parsed.append(field.to_python(value))
+        return parsed
+
+    def _encode(self, direction, obj):
+        return signing.dumps([direction, self._key(obj)], salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, cursor):
+        try:
+            direction, values = signing.loads(cursor, salt=CURSOR_SALT)
+            if direction not in ('next', 'previous') or len(values) != len(self.ordering):
+                return None
+            return direction, self._parse_key(values)
+        except (signing.BadSignature, ValidationError, TypeError, ValueError):
+            return None
+
+    def _after(self, values, forward):
+        """Rows strictly after (forward) or before a key in the page ordering"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        # A plain bound on the leading column lets the planner start an index range scan
+        name, descending = self.ordering[0]
+        bound = Q(**{f'{name}__{"lte" if descending == forward else "gte"}': values[0]})
+        return bound & condition
+
+    def get_page(self, cursor=None):
+        """Return the CursorPage a token points to; missing or bad tokens give the first page"""
+        decoded = self._decode(cursor) if cursor else None
+        queryset = self.queryset
+        if decoded is None:
+            rows = list(queryset[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            next_cursor = self._encode('next', rows[-1]) if more else None
+            previous_cursor = None
+        else:
+            direction, values = decoded
+            forward = direction == 'next'
+            queryset = queryset.filter(self._after(values, forward))
+            if not forward:
+                queryset = queryset.reverse()
+            rows = list(queryset[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            if not forward:
+                rows.reverse()
+            if forward:
+                next_cursor = self._encode('next', rows[-1]) if more else None
+                previous_cursor = self._encode('previous', rows[0]) if rows else None
+            else:
+                next_cursor = self._encode('next', rows[-1]) if rows else None
+                previous_cursor = self._encode('previous', rows[0]) if more else None
+
+        count = estimated_count(self.queryset) if self.estimate_count else None
+        return CursorPage(rows, next_cursor, previous_cursor, count, count is not None)
+
+
+def paginate(request, queryset, per_page):
+    """
+    Page an ordered queryset for a list view in the configured mode:
+    cursor pages (?cursor=<token>) or numbered pages (?page=<n>).
+    """
+    if LIST_PAGINATION == 'cursor':
+        paginator = CursorPaginator(queryset, per_page, estimate_count=LIST_PAGINATION_ESTIMATE_COUNT)
+        return paginator.get_page(request.GET.get('cursor'))
+    return Paginator(queryset, per_page).get_page(request.GET.get('page'))
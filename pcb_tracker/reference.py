@@ -0,0 +1,53 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import Batch, PCBType, TestConfig
+
+
+REFERENCE_CACHE_TIMEOUT = getattr(settings, 'REFERENCE_CACHE_TIMEOUT', 24 * 60 * 60)
+
+# Tables the edit form dropdowns are built from (batch labels include the PCB type name)
+REFERENCE_MODELS = [PCBType, Batch, TestConfig]
+
+
+def reference_version():
+    """
+    Short version string of the dropdown reference data, read from the
+    tables themselves so every process agrees on it: row counts and highest
+    ids change with inserts and deletes, the latest updated_at with edits.
+    """
+    parts = []
+    for model in REFERENCE_MODELS:
+        stats = model.objects.order_by().aggregate(rows=Count('id'), last_id=Max('id'), updated=Max('updated_at'))
+        updated = stats['updated'].timestamp() if stats['updated'] else 0
+        parts.append(f'{stats["rows"]}:{stats["last_id"]}:{updated}')
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+
+
+def _build_reference_data():
+    batches = Batch.objects.select_related('pcb_type').order_by('-production_date', '-id')
+    return {
+        'batches': [
+            [batch.id, f'{batch.batch_number} ({batch.pcb_type.name})' if batch.pcb_type else batch.batch_number]
+            for batch in batches
+        ],
+        'test_configs': list(TestConfig.objects.order_by('name', 'id').values_list('id', 'name')),
+    }
+
+
+def reference_data(version=None):
+    """
+    Return {'version', 'batches', 'test_configs'} with [id, label] options
+    for the PCB edit form. The lists are cached per version, so a change
+    to any batch, PCB type or test config makes the next read a miss.
+    """
+    version = version or reference_version()
+    key = f'pcb_tracker:reference_data:{version}'
+    data = cache.get(key)
+    if data is None:
+        data = {'version': version, **_build_reference_data()}
+        cache.set(key, data, REFERENCE_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,89 @@
+from numbers import Number
+
+
+# Rows scanned per worksheet before giving up on finding more parameters
+MAX_REPORT_ROWS = 5000
+
+
+def normalize_label(label):
+    """Case- and space-insensitive form of a parameter name or sheet label"""
+    return ' '.join(str(label).split()).casefold()
+
+
+def _is_value(cell):
+    if isinstance(cell, bool):
+        return False
+    if isinstance(cell, Number):
+        return True
+    if isinstance(cell, str):
+        try:
+            float(cell.strip())
+        except ValueError:
+            return False
+        return True
+    return False
+
+
+def _label(cell):
+    if not isinstance(cell, str):
+        return None
+    # Labels are often written as "Supply Voltage (V)" or "Supply Voltage:"
+    text = cell.split('(')[0].strip().rstrip(':').strip()
+    return normalize_label(text) if text else None
+
+
+def parse_report(path, labels, max_rows=MAX_REPORT_ROWS):
+    """
+    Return ({label: raw value}, error) for the parameter labels (normalized
+    with normalize_label) found in an XLSX report.
+
+    Sheets are read with openpyxl's read-only row iterator, so memory use
+    does not depend on the size of the file. Two layouts are recognised: a
+    label cell followed on its row by the value ("Supply Voltage | 3.31 |
+    V"), and a header row of labels with the values on the next row. The
+    first value found for a label wins.
+
+    This runs in the extraction worker processes, so it only deals with
+    plain values and never touches the database; errors are returned
+    rather than raised for the same reason.
+    """
+    with open(path, 'rb') as source:
+        return _scan(source, set(labels), max_rows)
+
+
+def _scan(source, wanted, max_rows):
+    from openpyxl import load_workbook
+
+    found = {}
+    try:
+        # Opened from a file object: blob names have no .xlsx extension for openpyxl to check
+        workbook = load_workbook(source, read_only=True, data_only=True)
+    except Exception as e:
+        return {}, f'Could not open workbook: {e}'
+    try:
+        for worksheet in workbook.worksheets:
+            header = {}
+            for count, row in enumerate(worksheet.iter_rows(values_only=True), 1):
+                if count > max_rows or len(found) == len(wanted):
+                    break
+                if header:
+                    for index, label in header.items():
+                        if index < len(row) and _is_value(row[index]):
+                            found.setdefault(label, row[index])
+                header = {}
+                for index, cell in enumerate(row):
+                    label = _label(cell)
+                    if label not in wanted or label in found:
+                        continue
+                    value = next((other for other in row[index + 1:] if other is not None and other != ''), None)
+                    if _is_value(value):
+                        found[label] = value
+                    else:
+                        header[index] = label
+            if len(found) == len(wanted):
+                break
+    except Exception as e:
+        return found, f'Could not read workbook: {e}'
+    finally:
+        workbook.close()
+    return found, None
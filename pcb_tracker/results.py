@@ -0,0 +1,253 @@
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.db import transaction
+
+from .models import PCB, TestMeasurement, ParameterMeasurement, QuestionResponse
+from .config_cache import get_config_specs
+from .evaluation import compute_verdicts, failed_groups, to_float_array
+from .workflow import pcb_workflow
+from .analytics import touch_batches
+from .spc import add_values
+
+
+# ParameterMeasurement.value is DecimalField(max_digits=15, decimal_places=6)
+VALUE_QUANTUM = Decimal('0.000001')
+VALUE_LIMIT = Decimal('1000000000')
+
+TRUE_RESPONSES = {'true', 'yes', 'y', '1'}
+FALSE_RESPONSES = {'false', 'no', 'n', '0'}
+
+
+class ResultError(Exception):
+    """Raised when a submitted value cannot be recorded"""
+
+
+def parse_value(raw):
+    """Convert a raw measurement into a Decimal that fits ParameterMeasurement.value"""
+    if isinstance(raw, bool):
+        raise ResultError('expected a number')
+    try:
+        value = Decimal(str(raw).strip())
+    except InvalidOperation:
+        raise ResultError(f'"{raw}" is not a number')
+    if not value.is_finite() or abs(value) >= VALUE_LIMIT:
+        raise ResultError(f'"{raw}" is out of range')
+    return value.quantize(VALUE_QUANTUM)
+
+
+def parse_response(raw):
+    """Convert a raw yes/no answer into a boolean"""
+    if isinstance(raw, bool):
+        return raw
+    text = str(raw).strip().lower()
+    if text in TRUE_RESPONSES:
+        return True
+    if text in FALSE_RESPONSES:
+        return False
+    raise ResultError(f'"{raw}" is not a yes/no answer')
+
+
+def _lookup(items, key, label):
+    """
+    Find a parameter/question by its label, or by id for an int key or a
+    digit-only str key that is not a label (JSON object keys are strings)
+    """
+    if isinstance(key, int):
+        matches = [item for item in items if item.id == key]
+    else:
+        matches = [item for item in items if getattr(item, label) == key]
+        if not matches and key.isdigit():
+            matches = [item for item in items if item.id == int(key)]
+    if not matches:
+        raise ResultError(f'unknown entry "{key}"')
+    if len(matches) > 1:
+        raise ResultError(f'"{key}" matches more than one entry, submit it by id instead')
+    return matches[0]
+
+
+def validate_entry(entry, parameters, questions):
+    """
+    Validate the submitted values of one PCB against its test config.
+
+    Parameter and question keys are the parameter name / question text or
+    the id, as an int or a string of digits. Entries may also carry "values", keyed by a label that
+    is matched against parameter names first and question texts second, for
+    sources such as spreadsheet columns that do not say which is which.
+    Returns (parameter_values, question_values, errors).
+    """
+    errors = []
+    submitted_params = entry.get('parameters') or {}
+    submitted_questions = entry.get('questions') or {}
+    submitted_values = entry.get('values') or {}
+    if not all(isinstance(d, dict) for d in (submitted_params, submitted_questions, submitted_values)):
+        return [], [], ['"parameters" and "questions" must be objects']
+
+    if submitted_values:
+        submitted_params = dict(submitted_params)
+        submitted_questions = dict(submitted_questions)
+        parameter_names = {parameter.name for parameter in parameters}
+        question_texts = {question.question_text for question in questions}
+        for key, raw in submitted_values.items():
+            if key in parameter_names:
+                submitted_params[key] = raw
+            elif key in question_texts:
+                submitted_questions[key] = raw
+            elif raw is not None and raw != '':
+                errors.append(f'Column {key}: not part of this PCB\'s test configuration')
+
+    # Ids that were submitted, whether or not their value was usable
+    submitted = set()
+
+    parameter_values = {}
+    for key, raw in submitted_params.items():
+        if raw is None or raw == '':
+            continue
+        try:
+            parameter = _lookup(parameters, key, 'name')
+        except ResultError as e:
+            errors.append(f'Parameter {key}: {e}')
+            continue
+        submitted.add(('parameter', parameter.id))
+        try:
+            parameter_values[parameter.id] = (parameter, parse_value(raw))
+        except ResultError as e:
+            errors.append(f'Parameter {parameter.name}: {e}')
+
+    question_values = {}
+    for key, raw in submitted_questions.items():
+        if raw is None or raw == '':
+            continue
+        try:
+            question = _lookup(questions, key, 'question_text')
+        except ResultError as e:
+            errors.append(f'Question {key}: {e}')
+            continue
+        submitted.add(('question', question.id))
+        try:
+            question_values[question.id] = (question, parse_response(raw))
+        except ResultError as e:
+            errors.append(f'Question {question.question_text}: {e}')
+
+    for parameter in parameters:
+        if parameter.required and ('parameter', parameter.id) not in submitted:
+            errors.append(f'Parameter {parameter.name}: a value is required')
+    for question in questions:
+        if question.required and ('question', question.id) not in submitted:
+            errors.append(f'Question {question.question_text}: a response is required')
+
+    return list(parameter_values.values()), list(question_values.values()), errors
+
+
+def record_results(entries, tester):
+    """
+    Validate and store test results for many PCBs in one transaction.
+
+    Each entry is a dict with "serial_number", "parameters", "questions" and
+    optional "notes". The number of queries does not depend on the number of
+    entries: PCBs are locked with one query, their test config specs come
+    from the spec cache and every row type is written with a single bulk insert.
+    Returns one report dict per entry, in the order they were submitted.
+    """
+    serials = [str(entry.get('serial_number', '')).strip() if isinstance(entry, dict) else '' for entry in entries]
+    report = [{'serial_number': serial, 'status': 'error', 'errors': []} for serial in serials]
+
+    with transaction.atomic():
+        pcbs = {
+            pcb.serial_number: pcb
+            for pcb in PCB.objects.select_for_update().filter(serial_number__in=set(filter(None, serials)))
+        }
+        specs = get_config_specs({pcb.test_config_id for pcb in pcbs.values() if pcb.test_config_id})
+
+        accepted = []
+        seen = set()
+        for entry, serial, result in zip(entries, serials, report):
+            if not isinstance(entry, dict):
+                result['errors'].append('Each result must be an object')
+                continue
+            pcb = pcbs.get(serial)
+            if pcb is None:
+                result['errors'].append('PCB with this serial number does not exist')
+                continue
+            if serial in seen:
+                result['errors'].append('Duplicate result for this PCB in the same submission')
+                continue
+            seen.add(serial)
+            if pcb.status != 'pending':
+                result['errors'].append(f'PCB is not available for testing (status: {pcb.status})')
+                continue
+
+            spec = specs.get(pcb.test_config_id)
+            parameters, questions = (spec.parameters, spec.questions) if spec else ((), ())
+            parameter_values, question_values, errors = validate_entry(entry, parameters, questions)
+            if errors:
+                result['errors'].extend(errors)
+                continue
+            accepted.append((result, pcb, parameter_values, question_values, str(entry.get('notes') or '')))
+
+        if not accepted:
+            return report
+
+        # Check every submitted value against its limits in one vectorized pass
+        submitted = [
+            (index, parameter, value)
+            for index, (result, pcb, parameter_values, question_values, notes) in enumerate(accepted)
+            for parameter, value in parameter_values
+        ]
+        passed = compute_verdicts(
+            to_float_array([value for index, parameter, value in submitted]),
+            to_float_array([parameter.min_value for index, parameter, value in submitted]),
+            to_float_array([parameter.max_value for index, parameter, value in submitted])
+        )
+        failed = set(failed_groups(np.array([index for index, parameter, value in submitted], dtype=np.int64), passed).tolist())
+
+        measurements = TestMeasurement.objects.bulk_create([
+            TestMeasurement(
+                pcb=pcb,
+                test_config_id=pcb.test_config_id,
+                tester=tester,
+                notes=notes,
+                verdict='fail' if index in failed else 'pass'
+            )
+            for index, (result, pcb, parameter_values, question_values, notes) in enumerate(accepted)
+        ])
+
+        parameter_rows = []
+        question_rows = []
+        verdicts = iter(passed.tolist())
+        for measurement, (result, pcb, parameter_values, question_values, notes) in zip(measurements, accepted):
+            for parameter, value in parameter_values:
+                parameter_rows.append(ParameterMeasurement(
+                    test_measurement=measurement,
+                    test_parameter_id=parameter.id,
+                    value=value,
+                    unit=parameter.unit,
+                    verdict='pass' if next(verdicts) else 'fail'
+                ))
+            for question, response in question_values:
+                question_rows.append(QuestionResponse(
+                    test_measurement=measurement,
+                    test_question_id=question.id,
+                    response=response
+                ))
+            result['status'] = 'ok'
+            result['pcb_id'] = pcb.id
+            result['test_measurement_id'] = measurement.id
+            result['verdict'] = measurement.verdict
+            del result['errors']
+
+        ParameterMeasurement.objects.bulk_create(parameter_rows)
+        QuestionResponse.objects.bulk_create(question_rows)
+        touch_batches({pcb.batch_id for result, pcb, *rest in accepted})
+        add_values(
+            (parameter.id, pcb.batch_id, value)
+            for result, pcb, parameter_values, question_values, notes in accepted
+            for parameter, value in parameter_values
+        )
+
+        pcb_ids = [pcb.id for result, pcb, *rest in accepted]
+        # The rows are locked, so the conditional update must hit every one of them
+        if pcb_workflow.bulk_transition(pcb_ids, 'pending', 'tested') != len(pcb_ids):
+            raise RuntimeError('PCB status changed while the rows were locked')
+
+    return report
@@ -0,0 +1,127 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, ProgrammingError, connection, transaction
+from django.db.models import F
+
+from .models import RoleVersion
+
+
+# Lifetime of a cached set of group names; changes take effect at once through
+# the version, so this only bounds how long unused entries are kept
+ROLE_CACHE_TIMEOUT = getattr(settings, 'ROLE_CACHE_TIMEOUT', 5 * 60)
+
+# Seconds a process reuses the roles version it last read; a change made in
+# another process reaches it within this delay. 0 reads it on every request
+ROLE_VERSION_TTL = getattr(settings, 'ROLE_VERSION_TTL', 5)
+
+ROLE_VERSION_ID = 1
+
+# (version, time.monotonic() deadline) of the last version read by this process
+_known_version = (None, 0.0)
+
+
+def _cached_version():
+    version, deadline = _known_version
+    return version if version is not None and time.monotonic() < deadline else None
+
+
+def _remember_version(version):
+    global _known_version
+    if ROLE_VERSION_TTL > 0:
+        _known_version = (version, time.monotonic() + ROLE_VERSION_TTL)
+    return version
+
+
+def forget_roles_version():
+    """Read the version from the database on the next check"""
+    global _known_version
+    _known_version = (None, 0.0)
+
+
+def roles_version():
+    """
+    Current version of the group data; part of every cached role key. It is
+    kept in the database rather than the cache, which is per process unless
+    CACHES configures a shared backend, and each process rereads it after
+    ROLE_VERSION_TTL seconds, so a revoked group stops granting access in
+    every worker within that delay of the change committing.
+    """
+    version = _cached_version()
+    if version is None:
+        version = _remember_version(
+            RoleVersion.objects.filter(id=ROLE_VERSION_ID).values_list('version', flat=True).first() or 0
+        )
+    return version
+
+
+async def aroles_version():
+    version = _cached_version()
+    if version is None:
+        version = _remember_version(
+            await RoleVersion.objects.filter(id=ROLE_VERSION_ID).values_list('version', flat=True).afirst() or 0
+        )
+    return version
+
+
+def bump_roles_version():
+    """Invalidate every cached set of group names, in the caller's transaction"""
+    rows = RoleVersion.objects.filter(id=ROLE_VERSION_ID)
+    try:
+        with transaction.atomic():
+            if not rows.update(version=F('version') + 1):
+                # The row is created by the migration; recreate it if it was removed
+                version, created = RoleVersion.objects.get_or_create(id=ROLE_VERSION_ID, defaults={'version': 1})
+                if not created:
+                    rows.update(version=F('version') + 1)
+    except (OperationalError, ProgrammingError):
+        # The data migrations before the one creating the table save groups too
+        if RoleVersion._meta.db_table in connection.introspection.table_names():
+            raise
+        return
+    # This process sees its own change at once; the other ones within the TTL
+    forget_roles_version()
+    transaction.on_commit(forget_roles_version)
+
+
+def user_groups(user):
+    """
+    Names of the groups a user belongs to.
+
+    They are read at most once per request (kept on the user object) and
+    shared between requests through the cache under the current roles
+    version, so permission checks cost no query while the version is known
+    to this process (see ROLE_VERSION_TTL) instead of a join per check.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, '_group_names', None)
+    if names is None:
+        key = f'pcb_tracker:roles:{roles_version()}:{user.pk}'
+        names = cache.get(key)
+        if names is None:
+            names = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(key, names, ROLE_CACHE_TIMEOUT)
+        user._group_names = names
+    return names
+
+
+async def auser_groups(user):
+    """user_groups() for async views, using the async cache and ORM"""
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, '_group_names', None)
+    if names is None:
+        key = f'pcb_tracker:roles:{await aroles_version()}:{user.pk}'
+        names = await cache.aget(key)
+        if names is None:
+            names = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+            await cache.aset(key, names, ROLE_CACHE_TIMEOUT)
+        user._group_names = names
+    return names
+
+
+def forget_user_groups(user):
+    """Drop the per-request copy after the user's memberships changed"""
+    user.__dict__.pop('_group_names', None)
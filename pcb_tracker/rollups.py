@@ -0,0 +1,168 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import PCB, Module, ModuleTestRecord, TestMeasurement, DailyProductionRollup, DailyModuleRollup, RollupState
+
+
+# Milestones counted per day, in workflow order, with the rollup column each one feeds
+MILESTONES = [
+    ('pending', 'created'),
+    ('tested', 'tested'),
+    ('qa_verified', 'verified'),
+    ('assembled', 'assembled'),
+]
+MILESTONE_ORDER = {status: index for index, (status, field) in enumerate(MILESTONES)}
+
+# Rows changed this recently are left for the next run, so transactions that
+# were still open when a run started are never skipped by the high-water mark
+DEFAULT_LAG = timedelta(minutes=5)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def reached_milestone(status):
+    """The furthest milestone a status implies; statuses past assembly count as assembled"""
+    if status in MILESTONE_ORDER:
+        return status
+    return MILESTONES[-1][0] if status else ''
+
+
+def milestones_between(counted, status):
+    """Return the rollup columns for the milestones after counted up to status"""
+    start = MILESTONE_ORDER.get(reached_milestone(counted), -1) + 1
+    return [field for status_value, field in MILESTONES[start:MILESTONE_ORDER[reached_milestone(status)] + 1]]
+
+
+def _add(model, key, values, defaults=None):
+    """Add values to the rollup row identified by key, creating it (with defaults) if needed"""
+    values = {field: value for field, value in values.items() if value}
+    if not values:
+        return
+    rows = model.objects.filter(**key)
+    if rows.update(**{field: F(field) + value for field, value in values.items()}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **(defaults or {}), **values)
+    except IntegrityError:
+        rows.update(**{field: F(field) + value for field, value in values.items()})
+
+
+def _roll_up_pcbs(start, end):
+    """
+    Count the milestones PCBs reached since the last run.
+
+    Each PCB remembers in rolled_up_status the furthest milestone it has
+    been counted for, so a board that was tested and verified between two
+    runs adds to both columns exactly once, and later statuses past
+    assembly add nothing. The rows are claimed with conditional UPDATEs
+    whose counts feed the rollup, so a PCB that changes again mid-run is
+    left for next time.
+
+    "created" is dated by the board's created_at. The other milestones
+    are dated by its last change, as no history of status changes is kept:
+    on a rebuild, a board that went through several milestones has them
+    all on the day it last changed, so those columns are approximate.
+    """
+    changed = PCB.objects.filter(updated_at__gt=start, updated_at__lte=end).exclude(status=F('rolled_up_status'))
+    groups = (
+        changed.annotate(created_day=TruncDate('created_at'), day=TruncDate('updated_at'))
+        .order_by()
+        .values_list('created_day', 'day', 'batch_id', 'batch__pcb_type', 'rolled_up_status', 'status')
+        .distinct()
+    )
+    deltas = defaultdict(Counter)
+    for created_day, day, batch_id, pcb_type_id, counted, status in groups:
+        fields = milestones_between(counted, status)
+        if not fields:
+            # Moved back by a manager correction, or moving on past assembly;
+            # counted again only once it passes its furthest milestone
+            continue
+        claimed = changed.filter(
+            created_at__date=created_day, updated_at__date=day, batch_id=batch_id,
+            rolled_up_status=counted, status=status
+        ).update(rolled_up_status=reached_milestone(status))
+        for field in fields:
+            deltas[(created_day if field == 'created' else day, batch_id, pcb_type_id)][field] += claimed
+    return deltas
+
+
+def _roll_up_measurements(start, end, deltas):
+    """Add the test runs recorded since the last run"""
+    rows = (
+        TestMeasurement.objects.filter(test_date__gt=start, test_date__lte=end)
+        .annotate(day=TruncDate('test_date'))
+        .order_by()
+        .values_list('day', 'pcb__batch_id', 'pcb__batch__pcb_type')
+        .annotate(tests=Count('id'), failed=Count('id', filter=Q(verdict='fail')))
+    )
+    for day, batch_id, pcb_type_id, tests, failed in rows:
+        deltas[(day, batch_id, pcb_type_id)]['tests'] += tests
+        deltas[(day, batch_id, pcb_type_id)]['tests_failed'] += failed
+
+
+def _roll_up_modules(start, end):
+    deltas = defaultdict(Counter)
+    assembled = (
+        Module.objects.filter(assembly_date__gt=start, assembly_date__lte=end)
+        .annotate(day=TruncDate('assembly_date'))
+        .order_by()
+        .values_list('day')
+        .annotate(total=Count('id'))
+    )
+    for day, total in assembled:
+        deltas[day]['assembled'] += total
+    tests = (
+        ModuleTestRecord.objects.filter(test_date__gt=start, test_date__lte=end)
+        .annotate(day=TruncDate('test_date'))
+        .order_by()
+        .values_list('day', 'result')
+        .annotate(total=Count('id'))
+    )
+    for day, result, total in tests:
+        deltas[day]['tests_passed' if result == 'pass' else 'tests_failed'] += total
+    return deltas
+
+
+def update_rollups(lag=DEFAULT_LAG):
+    """
+    Fold everything that changed since the stored high-water mark into the
+    daily rollup tables and move the mark forward, in one transaction.
+    Returns (previous mark, new mark, number of rollup rows touched).
+    """
+    end = timezone.now() - lag
+    with transaction.atomic():
+        state, created = RollupState.objects.select_for_update().get_or_create(
+            name='production', defaults={'high_water': EPOCH}
+        )
+        start = state.high_water
+        if end <= start:
+            return start, start, 0
+
+        deltas = _roll_up_pcbs(start, end)
+        _roll_up_measurements(start, end, deltas)
+        for (day, batch_id, pcb_type_id), values in deltas.items():
+            _add(DailyProductionRollup, {'day': day, 'batch_id': batch_id}, values, {'pcb_type_id': pcb_type_id})
+
+        module_deltas = _roll_up_modules(start, end)
+        for day, values in module_deltas.items():
+            _add(DailyModuleRollup, {'day': day}, values)
+
+        state.high_water = end
+        state.save(update_fields=['high_water'])
+    return start, end, len(deltas) + len(module_deltas)
+
+
+def rebuild_rollups(lag=DEFAULT_LAG):
+    """Throw the rollups away and recompute them from the whole history"""
+    with transaction.atomic():
+        DailyProductionRollup.objects.all().delete()
+        DailyModuleRollup.objects.all().delete()
+        RollupState.objects.filter(name='production').delete()
+        PCB.objects.exclude(rolled_up_status='').update(rolled_up_status='')
+        return update_rollups(lag)
@@ -0,0 +1,65 @@
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import PCB, Batch, TestConfig
+
+
+# Shorter queries cannot use the trigram indexes and only match serial number prefixes
+MIN_TRIGRAM_LENGTH = 3
+
+
+def _matching_batches(query):
+    return Batch.objects.filter(Q(batch_number__icontains=query) | Q(pcb_type__name__icontains=query)).values('id')
+
+
+def _matching_test_configs(query):
+    return TestConfig.objects.filter(name__icontains=query).values('id')
+
+
+def search_pcbs(query, queryset=None):
+    """
+    Return the PCBs of queryset (all by default) whose serial number, notes,
+    batch number, PCB type name or test config name contain query, best
+    matches first.
+
+    Batch, type and config names are matched in subqueries on their own,
+    small tables, so each condition on the PCB table is a separate index
+    scan PostgreSQL can combine, instead of an OR across joins that forces
+    a scan of every PCB. Results are ranked by match kind (exact serial
+    number, serial prefix, serial or notes substring, related names) and,
+    on PostgreSQL, by trigram similarity within a kind.
+    """
+    if queryset is None:
+        queryset = PCB.objects.all()
+    query = query.strip()
+    if not query:
+        return queryset
+    if len(query) < MIN_TRIGRAM_LENGTH:
+        return queryset.filter(serial_number__istartswith=query).order_by('serial_number')
+
+    queryset = queryset.filter(
+        Q(serial_number__icontains=query) |
+        Q(notes__icontains=query) |
+        Q(batch_id__in=_matching_batches(query)) |
+        Q(test_config_id__in=_matching_test_configs(query))
+    ).annotate(
+        search_rank=Case(
+            When(serial_number__iexact=query, then=Value(4)),
+            When(serial_number__istartswith=query, then=Value(3)),
+            When(serial_number__icontains=query, then=Value(2)),
+            When(notes__icontains=query, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        queryset = queryset.annotate(search_similarity=Greatest(
+            TrigramSimilarity('serial_number', query),
+            TrigramSimilarity('batch__batch_number', query),
+            output_field=FloatField(),
+        ))
+        return queryset.order_by('-search_rank', '-search_similarity', '-created_at', '-id')
+    return queryset.order_by('-search_rank', '-created_at', '-id')
@@ -1,7 +1,16 @@
-from django.db.models.signals import post_delete
+import os
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django.contrib.auth.models import User
-from django.db import transaction
+from django.contrib.auth.models import Group, User
+from django.utils import timezone
+from .models import PCB, Batch, FileAttachment, Module, PCBType, TestConfig, TestMeasurement, TestParameter, TestQuestion
+from .config_cache import spec_cache
+from .counters import adjust_counters, batch_status_counts, seed_counters
+from .analytics import touch_batches
+from .blobs import adjust_blob_refs
+from .storage import blob_digest
+from .roles import bump_roles_version, forget_user_groups
 
 
 @receiver(post_delete, sender=User)
@@ -23,4 +32,168 @@ def ensure_superuser_exists(sender, instance, **kwargs):
             User.objects.filter(id=remaining_user.id).update(
                 is_superuser=True,
                 is_staff=True
-            )
\ No newline at end of file
+            )
+
+
+@receiver(post_save, sender=TestParameter)
+@receiver(post_delete, sender=TestParameter)
+@receiver(post_save, sender=TestQuestion)
+@receiver(post_delete, sender=TestQuestion)
+def invalidate_test_config_spec(sender, instance, **kwargs):
+    """
+    Bump the owning test config's updated_at whenever one of its parameters or
+    questions changes, so every process sees a new cache key for the spec.
+    """
+    TestConfig.objects.filter(id=instance.test_config_id).update(updated_at=timezone.now())
+    spec_cache.evict(instance.test_config_id)
+
+
+@receiver(post_save, sender=TestConfig)
+@receiver(post_delete, sender=TestConfig)
+def evict_test_config_spec(sender, instance, **kwargs):
+    """Drop cached specs of a test config that was edited or deleted"""
+    spec_cache.evict(instance.id)
+
+
+# Single-object saves and deletes (forms, admin, cascades) keep the status
+# counters in step here; bulk inserts and workflow transitions adjust them
+# explicitly since they bypass these signals.
+
+@receiver(pre_save, sender=PCB)
+def remember_pcb_counter_key(sender, instance, raw=False, **kwargs):
+    """Remember the PCB type and status the row had before this save"""
+    if raw or instance.pk is None:
+        instance._counter_key = None
+        return
+    instance._counter_key = PCB.objects.filter(pk=instance.pk).values_list('batch__pcb_type', 'status').first()
+
+
+@receiver(post_save, sender=PCB)
+def count_saved_pcb(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    old_key = None if created else getattr(instance, '_counter_key', None)
+    status = instance.status
+    if old_key is not None and update_fields is not None and 'status' not in update_fields:
+        # The status column was not written, so the stored one still applies
+        status = old_key[1]
+    new_key = (instance.batch.pcb_type_id, status)
+    if old_key != new_key:
+        deltas = {new_key: 1}
+        if old_key is not None:
+            deltas[old_key] = -1
+        adjust_counters('pcb', deltas)
+
+
+@receiver(post_delete, sender=PCB)
+def count_deleted_pcb(sender, instance, **kwargs):
+    # The batch row outlives its PCBs when a batch is deleted by cascade
+    pcb_type_id = Batch.objects.filter(id=instance.batch_id).values_list('pcb_type', flat=True).first()
+    adjust_counters('pcb', {(pcb_type_id, instance.status): -1})
+
+
+@receiver(pre_save, sender=Module)
+def remember_module_status(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._counter_status = None
+        return
+    instance._counter_status = Module.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Module)
+def count_saved_module(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    old_status = None if created else getattr(instance, '_counter_status', None)
+    if old_status is not None and update_fields is not None and 'status' not in update_fields:
+        return
+    if old_status != instance.status:
+        deltas = {(None, instance.status): 1}
+        if old_status is not None:
+            deltas[(None, old_status)] = -1
+        adjust_counters('module', deltas)
+
+
+@receiver(post_delete, sender=Module)
+def count_deleted_module(sender, instance, **kwargs):
+    adjust_counters('module', {(None, instance.status): -1})
+
+
+@receiver(pre_save, sender=Batch)
+def remember_batch_pcb_type(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._counter_pcb_type_id = None
+        return
+    instance._counter_pcb_type_id = Batch.objects.filter(pk=instance.pk).values_list('pcb_type', flat=True).first()
+
+
+@receiver(post_save, sender=Batch)
+def move_batch_counters(sender, instance, created, raw=False, **kwargs):
+    """Move the PCBs of a batch to the counters of its new PCB type"""
+    if raw or created or instance._counter_pcb_type_id == instance.pcb_type_id:
+        return
+    deltas = {}
+    for status, total in batch_status_counts(instance.id).items():
+        deltas[(instance._counter_pcb_type_id, status)] = -total
+        deltas[(instance.pcb_type_id, status)] = total
+    adjust_counters('pcb', deltas)
+
+
+@receiver(post_save, sender=PCBType)
+def seed_pcb_type_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        seed_counters(instance.id)
+
+
+@receiver(post_save, sender=TestMeasurement)
+@receiver(post_delete, sender=TestMeasurement)
+def touch_measurement_batch(sender, instance, raw=False, **kwargs):
+    """Invalidate the cached yields of the batch a single measurement belongs to"""
+    if not raw:
+        touch_batches(Batch.objects.filter(pcbs__id=instance.pcb_id))
+
+
+@receiver(pre_save, sender=FileAttachment)
+def remember_attachment_blob(sender, instance, raw=False, **kwargs):
+    """Keep the uploaded file name and remember which blob the row pointed at before"""
+    if raw:
+        return
+    if instance.file and not instance.file._committed and not instance.original_name:
+        instance.original_name = os.path.basename(instance.file.name)[:255]
+    instance._blob_name = None
+    if instance.pk is not None:
+        instance._blob_name = FileAttachment.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+
+
+@receiver(post_save, sender=FileAttachment)
+def count_attachment_blob(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_digest = blob_digest(getattr(instance, '_blob_name', None))
+    new_digest = blob_digest(instance.file.name)
+    if old_digest != new_digest:
+        adjust_blob_refs({new_digest: 1, old_digest: -1})
+
+
+@receiver(post_delete, sender=FileAttachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    adjust_blob_refs({blob_digest(instance.file.name): -1})
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership(sender, instance, action, reverse, **kwargs):
+    """Group memberships changed from either side: cached group names are stale"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        forget_user_groups(instance)
+    # In the same transaction, so the new version and memberships commit together
+    bump_roles_version()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, instance, raw=False, **kwargs):
+    """A renamed or deleted group changes the names of its members' groups"""
+    if not raw:
+        bump_roles_version()
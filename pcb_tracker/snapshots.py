@@ -0,0 +1,260 @@
+import fcntl
+import json
+import os
+import shutil
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, FloatField, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import ParameterMeasurement, TestConfig, TestMeasurement, TestParameter
+
+
+SNAPSHOT_FORMAT = 2
+
+# Values saved this long before the previous refresh started are looked at
+# again, so transactions that were still open at the time are not missed
+SNAPSHOT_LAG = timedelta(minutes=5)
+
+# Test measurements read from the database per pass while refreshing
+EXPORT_CHUNK_SIZE = 50000
+
+# Fixed columns of every snapshot; parameters add one float64 column each
+BASE_COLUMNS = {
+    'measurement_id': np.int64,
+    'pcb_id': np.int64,
+    'test_date': 'datetime64[us]',
+}
+PARAMETER_DTYPE = np.float64
+
+Snapshot = namedtuple('Snapshot', ['test_config_id', 'rows', 'measurement_id', 'pcb_id', 'test_date', 'parameters', 'values'])
+
+
+def snapshot_dir(test_config_id):
+    return os.path.join(str(settings.MEASUREMENT_SNAPSHOT_DIR), f'config_{test_config_id}')
+
+
+def _column_path(directory, name):
+    return os.path.join(directory, f'{name}.bin')
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+    except FileNotFoundError:
+        return None
+    return meta if meta.get('format') == SNAPSHOT_FORMAT else None
+
+
+def _write_meta(directory, meta):
+    """Replace meta.json atomically; readers only trust rows it declares"""
+    temporary = os.path.join(directory, 'meta.json.tmp')
+    with open(temporary, 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(temporary, os.path.join(directory, 'meta.json'))
+
+
+def _truncate(directory, name, rows, dtype):
+    """Cut a column back to the declared rows, dropping bytes of an interrupted refresh"""
+    path = _column_path(directory, name)
+    size = rows * np.dtype(dtype).itemsize
+    with open(path, 'ab') as column:
+        column.truncate(size)
+
+
+def _chunks(test_config_id, after_id):
+    """Yield (measurement rows, values) for measurements with id > after_id, in id order"""
+    while True:
+        measurements = list(
+            TestMeasurement.objects.filter(test_config_id=test_config_id, id__gt=after_id)
+            .order_by('id')
+            .values_list('id', 'pcb_id', 'test_date')[:EXPORT_CHUNK_SIZE]
+        )
+        if not measurements:
+            return
+        first_id, last_id = measurements[0][0], measurements[-1][0]
+        values = list(
+            ParameterMeasurement.objects.filter(
+                test_measurement__test_config_id=test_config_id,
+                test_measurement_id__gte=first_id,
+                test_measurement_id__lte=last_id
+            )
+            .annotate(value_f=Cast('value', FloatField()))
+            .values_list('test_measurement_id', 'test_parameter_id', 'value_f')
+        )
+        yield measurements, values
+        after_id = last_id
+
+
+def _patch_values(directory, meta, test_config_id, since):
+    """
+    Write the values added to or edited in runs already in the snapshot
+    (by report extraction or in the admin) into their rows, in place.
+    The snapshot must have rows. Returns the number of values written.
+    """
+    values = list(
+        ParameterMeasurement.objects.filter(
+            test_measurement__test_config_id=test_config_id,
+            test_measurement_id__lte=meta['last_measurement_id'],
+            updated_at__gt=since
+        )
+        .annotate(value_f=Cast('value', FloatField()))
+        .values_list('test_measurement_id', 'test_parameter_id', 'value_f')
+    )
+    if not values:
+        return 0
+    measurement_ids, parameter_ids, parameter_values = zip(*values)
+    measurement_ids = np.array(measurement_ids, dtype=np.int64)
+    parameter_ids = np.array(parameter_ids, dtype=np.int64)
+    parameter_values = np.array([np.nan if v is None else v for v in parameter_values], dtype=PARAMETER_DTYPE)
+    known = _open_column(directory, 'measurement_id', BASE_COLUMNS['measurement_id'], meta['rows'])
+    rows = np.minimum(np.searchsorted(known, measurement_ids), meta['rows'] - 1)
+    found = known[rows] == measurement_ids
+    written = 0
+    for parameter in meta['parameters']:
+        selected = found & (parameter_ids == parameter['id'])
+        if not selected.any():
+            continue
+        column = np.memmap(_column_path(directory, f'param_{parameter["id"]}'), dtype=PARAMETER_DTYPE, mode='r+', shape=(meta['rows'],))
+        column[rows[selected]] = parameter_values[selected]
+        column.flush()
+        del column
+        written += int(selected.sum())
+    return written
+
+
+def refresh_snapshot(test_config_id, rebuild=False):
+    """
+    Append the test measurements recorded since the last refresh to the
+    columnar snapshot of a test config, one binary column file per field.
+
+    The snapshot is rebuilt from scratch when asked to, when it does not
+    exist yet or when rows below its high-water id appeared or disappeared
+    (late commits or deletions, told by the count and the sum of their ids,
+    so one of each in between is caught too); otherwise only new rows are read, and
+    values saved since the previous refresh (by updated_at) are written
+    into the rows of older runs. Deleting a single value from an older run
+    is not noticed; refresh with rebuild=True after doing so by hand.
+    Call it through refresh_snapshots, which holds the refresh lock.
+    Returns the number of rows appended.
+    """
+    directory = snapshot_dir(test_config_id)
+    started = timezone.now()
+    meta = None if rebuild else _read_meta(directory)
+    if meta is not None:
+        known = TestMeasurement.objects.filter(test_config_id=test_config_id, id__lte=meta['last_measurement_id']).aggregate(
+            rows=Count('id'), id_sum=Sum('id')
+        )
+        if (known['rows'], known['id_sum'] or 0) != (meta['rows'], meta.get('id_sum')):
+            meta = None
+    if meta is None:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        meta = {'format': SNAPSHOT_FORMAT, 'test_config_id': test_config_id, 'rows': 0, 'last_measurement_id': 0,
+                'id_sum': 0, 'parameters': [], 'refreshed_at': None}
+        for name, dtype in BASE_COLUMNS.items():
+            open(_column_path(directory, name), 'wb').close()
+
+    for name, dtype in BASE_COLUMNS.items():
+        _truncate(directory, name, meta['rows'], dtype)
+    for parameter in meta['parameters']:
+        _truncate(directory, f'param_{parameter["id"]}', meta['rows'], PARAMETER_DTYPE)
+
+    parameters = {parameter['id']: parameter for parameter in meta['parameters']}
+    for parameter in TestParameter.objects.filter(test_config_id=test_config_id).order_by('order', 'name'):
+        entry = {'id': parameter.id, 'name': parameter.name, 'unit': parameter.unit}
+        if parameter.id not in parameters:
+            # Older rows have no value for a parameter added later
+            with open(_column_path(directory, f'param_{parameter.id}'), 'wb') as column:
+                np.full(meta['rows'], np.nan, dtype=PARAMETER_DTYPE).tofile(column)
+        parameters[parameter.id] = entry
+    meta['parameters'] = list(parameters.values())
+
+    if meta['refreshed_at'] and meta['rows']:
+        _patch_values(directory, meta, test_config_id, datetime.fromisoformat(meta['refreshed_at']) - SNAPSHOT_LAG)
+
+    appended = 0
+    for measurements, values in _chunks(test_config_id, meta['last_measurement_id']):
+        ids, pcb_ids, test_dates = zip(*measurements)
+        ids = np.array(ids, dtype=np.int64)
+        columns = {
+            'measurement_id': ids,
+            'pcb_id': np.array(pcb_ids, dtype=np.int64),
+            'test_date': np.array([date.replace(tzinfo=None) for date in test_dates], dtype='datetime64[us]'),
+        }
+        for parameter_id in parameters:
+            columns[f'param_{parameter_id}'] = np.full(len(ids), np.nan, dtype=PARAMETER_DTYPE)
+        if values:
+            measurement_ids, parameter_ids, parameter_values = zip(*values)
+            rows = np.searchsorted(ids, np.array(measurement_ids, dtype=np.int64))
+            parameter_ids = np.array(parameter_ids, dtype=np.int64)
+            parameter_values = np.array([np.nan if v is None else v for v in parameter_values], dtype=PARAMETER_DTYPE)
+            for parameter_id in parameters:
+                selected = parameter_ids == parameter_id
+                columns[f'param_{parameter_id}'][rows[selected]] = parameter_values[selected]
+
+        for name, column in columns.items():
+            with open(_column_path(directory, name), 'ab') as column_file:
+                column.tofile(column_file)
+        meta['rows'] += len(ids)
+        meta['id_sum'] += int(ids.sum())
+        meta['last_measurement_id'] = int(ids[-1])
+        appended += len(ids)
+        _write_meta(directory, meta)
+
+    meta['refreshed_at'] = started.isoformat()
+    _write_meta(directory, meta)
+    return appended
+
+
+def refresh_snapshots(test_config_ids=None, rebuild=False):
+    """
+    Refresh the snapshots of several (by default all) test configs and
+    return {config id: rows appended}. An exclusive lock file keeps two
+    refreshes from appending to the same columns at once.
+    """
+    if test_config_ids is None:
+        test_config_ids = TestConfig.objects.order_by('id').values_list('id', flat=True)
+    os.makedirs(str(settings.MEASUREMENT_SNAPSHOT_DIR), exist_ok=True)
+    with open(os.path.join(str(settings.MEASUREMENT_SNAPSHOT_DIR), '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return {test_config_id: refresh_snapshot(test_config_id, rebuild) for test_config_id in test_config_ids}
+
+
+def _open_column(directory, name, dtype, rows):
+    if not rows:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(_column_path(directory, name), dtype=dtype, mode='r', shape=(rows,))
+
+
+def open_snapshot(test_config_id):
+    """
+    Open the snapshot of a test config as read-only memory-mapped columns.
+
+    Returns a Snapshot whose values map parameter id to a float64 column
+    (NaN where a run has no value), or None if no snapshot exists yet.
+    test_date is in UTC.
+    Pages are only read from disk as the columns are used.
+    """
+    directory = snapshot_dir(test_config_id)
+    meta = _read_meta(directory)
+    if meta is None:
+        return None
+    rows = meta['rows']
+    return Snapshot(
+        test_config_id,
+        rows,
+        _open_column(directory, 'measurement_id', BASE_COLUMNS['measurement_id'], rows),
+        _open_column(directory, 'pcb_id', BASE_COLUMNS['pcb_id'], rows),
+        _open_column(directory, 'test_date', BASE_COLUMNS['test_date'], rows),
+        meta['parameters'],
+        {
+            parameter['id']: _open_column(directory, f'param_{parameter["id"]}', PARAMETER_DTYPE, rows)
+            for parameter in meta['parameters']
+        },
+    )
@@ -0,0 +1,324 @@
+from collections import defaultdict, namedtuple
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PCB, ParameterStats, ParameterSubgroup, TestParameter
+from .snapshots import open_snapshot, refresh_snapshots
+
+
+# Values per X-bar/R subgroup
+SUBGROUP_SIZE = 5
+
+# Values merged into the aggregates per call while rebuilding
+REBUILD_CHUNK_SIZE = 10000
+
+# Subgroups plotted on a control chart and merged for the rolling capability
+DEFAULT_WINDOW = 50
+
+# X-bar/R control chart constants by subgroup size
+A2 = {2: 1.880, 3: 1.023, 4: 0.729, 5: 0.577, 6: 0.483, 7: 0.419, 8: 0.373, 9: 0.337, 10: 0.308}
+D3 = {2: 0.0, 3: 0.0, 4: 0.0, 5: 0.0, 6: 0.0, 7: 0.076, 8: 0.136, 9: 0.184, 10: 0.223}
+D4 = {2: 3.267, 3: 2.574, 4: 2.282, 5: 2.114, 6: 2.004, 7: 1.924, 8: 1.864, 9: 1.816, 10: 1.777}
+
+Summary = namedtuple('Summary', ['count', 'mean', 'm2', 'min_value', 'max_value'])
+EMPTY = Summary(0, 0.0, 0.0, None, None)
+
+
+def summarize(values):
+    """Return the Summary of a float array"""
+    if not len(values):
+        return EMPTY
+    mean = float(values.mean())
+    return Summary(len(values), mean, float(((values - mean) ** 2).sum()), float(values.min()), float(values.max()))
+
+
+def merge(a, b):
+    """
+    Combine two Summaries (Chan et al. parallel form of Welford's update).
+    Merging a single value is the classic O(1) Welford step.
+    """
+    if not a.count:
+        return b
+    if not b.count:
+        return a
+    count = a.count + b.count
+    delta = b.mean - a.mean
+    return Summary(
+        count,
+        a.mean + delta * b.count / count,
+        a.m2 + b.m2 + delta * delta * a.count * b.count / count,
+        min(a.min_value, b.min_value),
+        max(a.max_value, b.max_value),
+    )
+
+
+def merge_arrays(counts, means, m2s):
+    """Merge many (count, mean, m2) aggregates at once; returns (count, mean, m2)"""
+    count = counts.sum()
+    if not count:
+        return 0, 0.0, 0.0
+    mean = (counts * means).sum() / count
+    m2 = m2s.sum() + (counts * (means - mean) ** 2).sum()
+    return int(count), float(mean), float(m2)
+
+
+def capability(count, mean, m2, lower=None, upper=None):
+    """
+    Mean, sample sigma, Cp and Cpk of an aggregate against spec limits.
+    Cp needs both limits; Cpk uses whichever limits exist.
+    """
+    sigma = (m2 / (count - 1)) ** 0.5 if count > 1 else None
+    lower = None if lower is None else float(lower)
+    upper = None if upper is None else float(upper)
+    cp = cpk = None
+    if sigma:
+        if lower is not None and upper is not None:
+            cp = (upper - lower) / (6 * sigma)
+        sides = [(upper - mean) / (3 * sigma) if upper is not None else None,
+                 (mean - lower) / (3 * sigma) if lower is not None else None]
+        sides = [side for side in sides if side is not None]
+        cpk = min(sides) if sides else None
+    return {'count': count, 'mean': mean if count else None, 'sigma': sigma, 'cp': cp, 'cpk': cpk}
+
+
+def _fill_subgroups(test_parameter_id, batch_id, values, open_subgroup, now):
+    """
+    Top up the open subgroup of a parameter/batch and cut the rest of the
+    values into new subgroups. Returns (subgroup to update or None, new subgroups).
+    """
+    to_update = None
+    if open_subgroup is not None and len(values):
+        take = SUBGROUP_SIZE - open_subgroup.count
+        merged = merge(
+            Summary(open_subgroup.count, open_subgroup.mean, open_subgroup.m2, open_subgroup.min_value, open_subgroup.max_value),
+            summarize(values[:take])
+        )
+        open_subgroup.count, open_subgroup.mean, open_subgroup.m2, open_subgroup.min_value, open_subgroup.max_value = merged
+        to_update = open_subgroup
+        values = values[take:]
+    created = []
+    for start in range(0, len(values), SUBGROUP_SIZE):
+        summary = summarize(values[start:start + SUBGROUP_SIZE])
+        created.append(ParameterSubgroup(
+            test_parameter_id=test_parameter_id, batch_id=batch_id, started_at=now,
+            count=summary.count, mean=summary.mean, m2=summary.m2,
+            min_value=summary.min_value, max_value=summary.max_value
+        ))
+    return to_update, created
+
+
+def add_values(samples):
+    """
+    Merge newly recorded values into the running aggregates.
+
+    samples is an iterable of (test parameter id, batch id, value) in the
+    order the values were recorded. Call it inside the transaction that
+    stores the values. The aggregate rows are locked per (parameter, batch),
+    which also serializes concurrent updates of the open subgroups; the cost
+    depends only on the number of new values, never on the history.
+    """
+    grouped = defaultdict(list)
+    for test_parameter_id, batch_id, value in samples:
+        if value is not None:
+            grouped[(test_parameter_id, batch_id)].append(float(value))
+    if not grouped:
+        return
+
+    now = timezone.now()
+    parameter_ids = {key[0] for key in grouped}
+    batch_ids = {key[1] for key in grouped}
+    with transaction.atomic():
+        # Make sure every row exists, then lock them all in a stable order
+        ParameterStats.objects.bulk_create(
+            [ParameterStats(test_parameter_id=p, batch_id=b) for p, b in grouped],
+            ignore_conflicts=True
+        )
+        stats = {
+            (row.test_parameter_id, row.batch_id): row
+            for row in ParameterStats.objects.select_for_update()
+            .filter(test_parameter_id__in=parameter_ids, batch_id__in=batch_ids).order_by('id')
+            if (row.test_parameter_id, row.batch_id) in grouped
+        }
+        open_subgroups = {}
+        for subgroup in ParameterSubgroup.objects.filter(
+            test_parameter_id__in=parameter_ids, batch_id__in=batch_ids, count__lt=SUBGROUP_SIZE
+        ).order_by('id'):
+            open_subgroups[(subgroup.test_parameter_id, subgroup.batch_id)] = subgroup
+
+        updated_subgroups = []
+        new_subgroups = []
+        for key, values in grouped.items():
+            values = np.array(values, dtype=np.float64)
+            row = stats[key]
+            merged = merge(Summary(row.count, row.mean, row.m2, row.min_value, row.max_value), summarize(values))
+            row.count, row.mean, row.m2, row.min_value, row.max_value = merged
+            row.updated_at = now
+            to_update, created = _fill_subgroups(key[0], key[1], values, open_subgroups.get(key), now)
+            if to_update is not None:
+                updated_subgroups.append(to_update)
+            new_subgroups.extend(created)
+
+        ParameterStats.objects.bulk_update(stats.values(), ['count', 'mean', 'm2', 'min_value', 'max_value', 'updated_at'])
+        ParameterSubgroup.objects.bulk_update(updated_subgroups, ['count', 'mean', 'm2', 'min_value', 'max_value'])
+        ParameterSubgroup.objects.bulk_create(new_subgroups)
+
+
+def _parameters_by_config(test_parameter_ids):
+    parameters = TestParameter.objects.order_by('id')
+    if test_parameter_ids is not None:
+        parameters = parameters.filter(id__in=test_parameter_ids)
+    by_config = defaultdict(list)
+    for test_parameter_id, test_config_id in parameters.values_list('id', 'test_config_id'):
+        by_config[test_config_id].append(test_parameter_id)
+    return by_config
+
+
+def _snapshot_samples(by_config):
+    """
+    Yield lists of (test parameter id, batch id, value) from the columnar
+    snapshots of {test config id: [parameter ids]}, per parameter in batch,
+    test date and run order. The columns are read through numpy.memmap and
+    ordered with NumPy, so the database only supplies the PCB to batch
+    mapping.
+    """
+    if not by_config:
+        return
+    # One pass, so the ids and batches line up even while boards are added
+    boards = PCB.objects.order_by('id').values_list('id', 'batch_id').iterator(chunk_size=50000)
+    pairs = np.fromiter(chain.from_iterable(boards), dtype=np.int64).reshape(-1, 2)
+    pcb_ids, batch_of = pairs[:, 0], pairs[:, 1]
+    for test_config_id, config_parameter_ids in sorted(by_config.items()):
+        snapshot = open_snapshot(test_config_id)
+        if snapshot is None or not snapshot.rows or not len(pcb_ids):
+            continue
+        positions = np.minimum(np.searchsorted(pcb_ids, snapshot.pcb_id), len(pcb_ids) - 1)
+        # Rows of boards deleted since the snapshot was written are left out
+        known = np.flatnonzero(pcb_ids[positions] == snapshot.pcb_id)
+        batches = batch_of[positions[known]]
+        order = known[np.lexsort((snapshot.measurement_id[known], snapshot.test_date[known], batches))]
+        batches = batch_of[positions[order]]
+        for test_parameter_id in config_parameter_ids:
+            column = snapshot.values.get(test_parameter_id)
+            if column is None:
+                continue
+            values = column[order]
+            present = ~np.isnan(values)
+            parameter_batches = batches[present].tolist()
+            parameter_values = values[present].tolist()
+            for start in range(0, len(parameter_values), REBUILD_CHUNK_SIZE):
+                yield [
+                    (test_parameter_id, batch_id, value)
+                    for batch_id, value in zip(parameter_batches[start:start + REBUILD_CHUNK_SIZE], parameter_values[start:start + REBUILD_CHUNK_SIZE])
+                ]
+
+
+def rebuild(test_parameter_ids=None, rebuild_snapshots=False):
+    """
+    Recompute the aggregates and subgroups from the stored measurements,
+    for example after measurements were edited or deleted by hand. The
+    snapshots of the parameters' test configs are refreshed first (from
+    scratch with rebuild_snapshots, which single deleted values need), then
+    the values are read from their memory-mapped columns and summarized
+    with NumPy. Returns the number of values processed.
+    """
+    stats = ParameterStats.objects.all()
+    subgroups = ParameterSubgroup.objects.all()
+    if test_parameter_ids is not None:
+        stats = stats.filter(test_parameter_id__in=test_parameter_ids)
+        subgroups = subgroups.filter(test_parameter_id__in=test_parameter_ids)
+
+    by_config = _parameters_by_config(test_parameter_ids)
+    refresh_snapshots(sorted(by_config), rebuild_snapshots)
+    with transaction.atomic():
+        stats.delete()
+        subgroups.delete()
+        total = 0
+        for batch in _snapshot_samples(by_config):
+            add_values(batch)
+            total += len(batch)
+    return total
+
+
+def parameter_capability(test_parameter, batch_ids=None):
+    """
+    Capability of a TestParameter over all batches (or some), merged from
+    the per-batch running aggregates with one query.
+    """
+    rows = ParameterStats.objects.filter(test_parameter=test_parameter)
+    if batch_ids is not None:
+        rows = rows.filter(batch_id__in=batch_ids)
+    rows = list(rows.values_list('count', 'mean', 'm2'))
+    if not rows:
+        return capability(0, 0.0, 0.0, test_parameter.min_value, test_parameter.max_value)
+    counts, means, m2s = (np.array(column, dtype=np.float64) for column in zip(*rows))
+    return capability(*merge_arrays(counts, means, m2s), test_parameter.min_value, test_parameter.max_value)
+
+
+def batch_capabilities(test_parameter):
+    """Return [(batch id, capability)] for every batch with values of a parameter"""
+    return [
+        (row.batch_id, capability(row.count, row.mean, row.m2, test_parameter.min_value, test_parameter.max_value))
+        for row in ParameterStats.objects.filter(test_parameter=test_parameter).order_by('batch_id')
+    ]
+
+
+def control_chart(test_parameter, batch_id=None, window=DEFAULT_WINDOW):
+    """
+    X-bar/R chart data for the latest complete subgroups of a parameter.
+
+    Returns the subgroup means and ranges, their centre lines and control
+    limits, and the capability over the same rolling window, all computed
+    with NumPy from the stored subgroup aggregates.
+    """
+    subgroups = ParameterSubgroup.objects.filter(test_parameter=test_parameter, count=SUBGROUP_SIZE)
+    if batch_id is not None:
+        subgroups = subgroups.filter(batch_id=batch_id)
+    rows = list(subgroups.order_by('-id').values_list('id', 'started_at', 'count', 'mean', 'm2', 'min_value', 'max_value')[:window])
+    rows.reverse()
+    chart = {'subgroups': [], 'size': SUBGROUP_SIZE, 'limits': None,
+             'rolling': capability(0, 0.0, 0.0, test_parameter.min_value, test_parameter.max_value)}
+    if not rows:
+        return chart
+
+    ids, started, counts, means, m2s, mins, maxs = zip(*rows)
+    counts = np.array(counts, dtype=np.float64)
+    means = np.array(means, dtype=np.float64)
+    ranges = np.array(maxs, dtype=np.float64) - np.array(mins, dtype=np.float64)
+    x_bar = float(means.mean())
+    r_bar = float(ranges.mean())
+    chart['limits'] = {
+        'x_bar': x_bar,
+        'x_ucl': x_bar + A2[SUBGROUP_SIZE] * r_bar,
+        'x_lcl': x_bar - A2[SUBGROUP_SIZE] * r_bar,
+        'r_bar': r_bar,
+        'r_ucl': D4[SUBGROUP_SIZE] * r_bar,
+        'r_lcl': D3[SUBGROUP_SIZE] * r_bar,
+    }
+    chart['subgroups'] = [
+        {'id': subgroup_id, 'started_at': started_at, 'mean': float(mean), 'range': float(value_range)}
+        for subgroup_id, started_at, mean, value_range in zip(ids, started, means, ranges)
+    ]
+    chart['rolling'] = capability(
+        *merge_arrays(counts, means, np.array(m2s, dtype=np.float64)),
+        test_parameter.min_value, test_parameter.max_value
+    )
+    return chart
+
+
+def capabilities_by_parameter(test_parameters):
+    """Return {parameter id: capability} over all batches, with one query"""
+    test_parameters = list(test_parameters)
+    grouped = defaultdict(list)
+    for test_parameter_id, count, mean, m2 in ParameterStats.objects.filter(
+        test_parameter__in=test_parameters
+    ).values_list('test_parameter_id', 'count', 'mean', 'm2'):
+        grouped[test_parameter_id].append((count, mean, m2))
+    capabilities = {}
+    for test_parameter in test_parameters:
+        rows = grouped.get(test_parameter.id)
+        merged = merge_arrays(*(np.array(column, dtype=np.float64) for column in zip(*rows))) if rows else (0, 0.0, 0.0)
+        capabilities[test_parameter.id] = capability(*merged, test_parameter.min_value, test_parameter.max_value)
+    return capabilities
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+# Directory (relative to the storage root) holding one file per distinct content
+BLOB_PREFIX = 'blobs'
+
+# Bytes hashed and written per step while an upload is stored
+BLOB_CHUNK_SIZE = 64 * 1024
+
+
+def blob_name(digest):
+    """Storage name of the blob with a SHA-256 hex digest"""
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}'
+
+
+def blob_digest(name):
+    """Digest of a blob storage name, or None for a file stored some other way"""
+    if not name or not name.startswith(f'{BLOB_PREFIX}/'):
+        return None
+    return os.path.basename(name)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps each distinct content once, named by
+    its SHA-256 digest.
+
+    An upload is hashed while it is copied to a temporary file next to the
+    blobs and then renamed into place; if a blob with the same digest exists
+    already the copy is dropped and the existing blob is touched instead, so
+    the garbage collector sees it as recently used. Deleting through the
+    storage is refused: blobs are shared, and only the collect_blobs command
+    removes them once their reference count is zero.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, never from the upload
+        return name
+
+    def _save(self, name, content):
+        temporary_dir = self.path(os.path.join(BLOB_PREFIX, 'tmp'))
+        os.makedirs(temporary_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        descriptor, temporary = tempfile.mkstemp(dir=temporary_dir)
+        try:
+            with os.fdopen(descriptor, 'wb') as target:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(BLOB_CHUNK_SIZE):
+                    digest.update(chunk)
+                    target.write(chunk)
+            return self.place(temporary, digest.hexdigest())
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+    def place(self, path, digest):
+        """
+        Move a local file whose digest is known into the blob store and
+        return the blob name. The file must be on the storage's file system.
+        """
+        name = blob_name(digest)
+        target = self.path(name)
+        try:
+            os.utime(target)
+        except FileNotFoundError:
+            # New content, or the collector has just moved the blob away
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+            os.replace(path, target)
+        else:
+            os.unlink(path)
+        return name
+
+    def delete(self, name):
+        if blob_digest(name) is None:
+            super().delete(name)
+
+    def remove_blob(self, name, cutoff):
+        """
+        Really delete a blob file not touched since cutoff (a timestamp);
+        only for the garbage collector. The file is first moved aside, so an
+        upload reusing it from now on stores its own copy, and put back if
+        an upload touched it before the move. Returns whether it was deleted.
+        """
+        path = self.path(name)
+        trash_dir = self.path(os.path.join(BLOB_PREFIX, 'trash'))
+        os.makedirs(trash_dir, exist_ok=True)
+        trash = os.path.join(trash_dir, os.path.basename(path))
+        try:
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return True
+        if os.path.getmtime(trash) >= cutoff:
+            os.replace(trash, path)
+            return False
+        os.unlink(trash)
+        return True
+
+
+def attachment_storage():
+    return ContentAddressedStorage()
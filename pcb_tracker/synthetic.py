@@ -0,0 +1,266 @@
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics import touch_batches
+from .counters import reconcile_counters
+from .evaluation import compute_verdicts
+from .models import PCB, Batch, Module, ParameterMeasurement, PCBType, QuestionResponse, TestConfig, TestMeasurement, TestParameter, TestQuestion
+from .rollups import rebuild_rollups
+from .snapshots import refresh_snapshots
+from .spc import rebuild
+
+
+# Boards written per transaction
+SYNTHETIC_CHUNK_SIZE = 10000
+
+# (type, name, unit, min, max) cycled through for the generated test parameters
+SYNTHETIC_PARAMETERS = [
+    ('voltage', 'Supply Voltage', 'V', 3.135, 3.465),
+    ('current', 'Operating Current', 'A', 0.080, 0.250),
+    ('frequency', 'Clock Frequency', 'MHz', 99.95, 100.05),
+    ('resistance', 'Termination Resistance', 'Ohm', 47.5, 52.5),
+    ('temperature', 'Board Temperature', 'C', 20.0, 70.0),
+    ('voltage', 'Core Voltage', 'V', 1.14, 1.26),
+    ('current', 'Standby Current', 'A', 0.001, 0.010),
+    ('other', 'Output Power', 'dBm', 9.0, 11.0),
+]
+
+SYNTHETIC_QUESTIONS = ['Visual inspection passed?', 'Connectors seated?', 'Labels legible?', 'Conformal coating intact?']
+
+# Fields that Django would stamp with the current time in bulk_create
+TIMESTAMP_FIELDS = [
+    (Batch, 'production_date'),
+    (PCB, 'created_at'),
+    (PCB, 'updated_at'),
+    (TestMeasurement, 'test_date'),
+    (Module, 'assembly_date'),
+]
+
+
+@contextmanager
+def explicit_timestamps():
+    """Keep the generated dates instead of stamping every row with now()"""
+    fields = [model._meta.get_field(name) for model, name in TIMESTAMP_FIELDS]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def create_catalogue(prefix, pcb_types, parameters, questions):
+    """
+    Create the PCB types, one test configuration per type and its parameters
+    and questions. Returns [(pcb type, test config, [parameters], [questions])].
+    """
+    catalogue = []
+    for index in range(pcb_types):
+        pcb_type = PCBType.objects.create(name=f'{prefix} Type {index + 1}', description='Synthetic data')
+        config = TestConfig.objects.create(name=f'{prefix} Config {index + 1}', pcb_type=pcb_type, description='Synthetic data')
+        config_parameters = []
+        for order in range(parameters):
+            parameter_type, name, unit, low, high = SYNTHETIC_PARAMETERS[order % len(SYNTHETIC_PARAMETERS)]
+            if order >= len(SYNTHETIC_PARAMETERS):
+                name = f'{name} {order // len(SYNTHETIC_PARAMETERS) + 1}'
+            config_parameters.append(TestParameter.objects.create(
+                test_config=config, parameter_type=parameter_type, name=name, unit=unit,
+                min_value=low, max_value=high, order=order
+            ))
+        config_questions = [
+            TestQuestion.objects.create(test_config=config, question_text=SYNTHETIC_QUESTIONS[order % len(SYNTHETIC_QUESTIONS)], order=order)
+            for order in range(questions)
+        ]
+        catalogue.append((pcb_type, config, config_parameters, config_questions))
+    return catalogue
+
+
+def generate(prefix, pcbs, pcb_types=5, batch_size=500, parameters=8, questions=2, runs=1, days=365,
+             tested_fraction=0.9, defect_rate=0.02, verified_fraction=0.8, assembled_fraction=0.5,
+             pcbs_per_module=4, chunk_size=SYNTHETIC_CHUNK_SIZE, seed=None, progress=None):
+    """
+    Generate a production history of pcbs boards spread over the last days
+    days, with bulk_create and in chunks of chunk_size boards, so millions
+    of rows take minutes and bounded memory.
+
+    Boards are made in batches of batch_size, the batches going round the
+    PCB types. A tested board has runs test runs; its values are normally
+    distributed inside the limits with a per-batch drift, and defect_rate
+    of the runs push one value out of them. Passing boards are QA verified
+    and assembled into modules in the given proportions.
+
+    Signals are bypassed, so the derived tables (counters, rollups, SPC,
+    snapshots) must be rebuilt afterwards; see refresh_derived_data().
+    progress is called with the number of boards written after each chunk.
+    Returns (Counter of rows created by model name, catalogue).
+    """
+    rng = np.random.default_rng(seed)
+    created = Counter()
+    tester, _ = User.objects.get_or_create(username=f'{prefix.lower()}_tester', defaults={'first_name': 'Synthetic'})
+    catalogue = create_catalogue(prefix, pcb_types, parameters, questions)
+
+    end = timezone.now()
+    span = timedelta(days=days).total_seconds()
+    start = end - timedelta(seconds=span)
+    batch_count = -(-pcbs // batch_size)
+    batch_ids = []
+    with explicit_timestamps():
+        for offset in range(0, batch_count, chunk_size):
+            batch_ids.extend(batch.id for batch in Batch.objects.bulk_create([
+                Batch(
+                    batch_number=f'{prefix}-B{index + 1:07d}',
+                    pcb_type=catalogue[index % pcb_types][0],
+                    production_date=start + timedelta(seconds=span * index * batch_size / pcbs),
+                    description='Synthetic data'
+                )
+                for index in range(offset, min(offset + chunk_size, batch_count))
+            ]))
+        created['Batch'] = len(batch_ids)
+        # Per batch, per parameter shift of the process mean, in standard deviations
+        drift = rng.normal(0, 0.5, size=(batch_count, parameters))
+        module_number = 0
+
+        for first in range(0, pcbs, chunk_size):
+            count = min(chunk_size, pcbs - first)
+            boards = np.arange(first, first + count)
+            batches = boards // batch_size
+            born = span * boards / pcbs + rng.uniform(0, 3600, count)
+            tested = rng.random(count) < tested_fraction
+
+            with transaction.atomic():
+                rows = []
+                for index, board in enumerate(boards.tolist()):
+                    batch = int(batches[index])
+                    rows.append(PCB(
+                        serial_number=f'{prefix}-{board + 1:09d}',
+                        batch_id=batch_ids[batch],
+                        test_config_id=catalogue[batch % pcb_types][1].id,
+                        status='pending',
+                        created_at=start + timedelta(seconds=float(born[index])),
+                        updated_at=start + timedelta(seconds=float(born[index])),
+                    ))
+                rows = PCB.objects.bulk_create(rows)
+                created['PCB'] += len(rows)
+
+                # Test runs: runs per tested board, hours apart
+                run_boards = np.repeat(np.flatnonzero(tested), runs)
+                run_times = born[run_boards] + np.cumsum(rng.exponential(4 * 3600, (len(run_boards) // runs, runs)), axis=1).ravel()
+                run_times = np.minimum(run_times, span)
+                measurements = []
+                values = np.empty((len(run_boards), parameters))
+                for config_index, (pcb_type, config, config_parameters, config_questions) in enumerate(catalogue):
+                    selected = np.flatnonzero(batches[run_boards] % pcb_types == config_index)
+                    low = np.array([float(parameter.min_value) for parameter in config_parameters])
+                    high = np.array([float(parameter.max_value) for parameter in config_parameters])
+                    sigma = (high - low) / 10
+                    noise = rng.normal(0, 1, (len(selected), parameters)) + drift[batches[run_boards[selected]]]
+                    values[selected] = (low + high) / 2 + sigma * noise
+                    defects = selected[rng.random(len(selected)) < defect_rate]
+                    columns = rng.integers(0, parameters, len(defects))
+                    values[defects, columns] = high[columns] + sigma[columns] * rng.uniform(0.5, 3, len(defects))
+                limits = np.array([
+                    [(float(parameter.min_value), float(parameter.max_value)) for parameter in config_parameters]
+                    for pcb_type, config, config_parameters, config_questions in catalogue
+                ])
+                run_configs = batches[run_boards] % pcb_types
+                passed = compute_verdicts(
+                    values.ravel(), limits[run_configs, :, 0].ravel(), limits[run_configs, :, 1].ravel()
+                ).reshape(values.shape)
+                run_passed = passed.all(axis=1)
+
+                for index, board in enumerate(run_boards.tolist()):
+                    measurements.append(TestMeasurement(
+                        pcb_id=rows[board].id,
+                        test_config_id=rows[board].test_config_id,
+                        tester=tester,
+                        test_date=start + timedelta(seconds=float(run_times[index])),
+                        verdict='pass' if run_passed[index] else 'fail'
+                    ))
+                measurements = TestMeasurement.objects.bulk_create(measurements)
+                created['TestMeasurement'] += len(measurements)
+
+                values = values.round(6).tolist()
+                parameter_rows = []
+                question_rows = []
+                for index, measurement in enumerate(measurements):
+                    pcb_type, config, config_parameters, config_questions = catalogue[int(run_configs[index])]
+                    for column, parameter in enumerate(config_parameters):
+                        parameter_rows.append(ParameterMeasurement(
+                            test_measurement_id=measurement.id,
+                            test_parameter_id=parameter.id,
+                            value=values[index][column],
+                            unit=parameter.unit,
+                            verdict='pass' if passed[index, column] else 'fail'
+                        ))
+                    for question in config_questions:
+                        question_rows.append(QuestionResponse(
+                            test_measurement_id=measurement.id,
+                            test_question_id=question.id,
+                            response=bool(run_passed[index])
+                        ))
+                created['ParameterMeasurement'] += len(ParameterMeasurement.objects.bulk_create(parameter_rows, batch_size=chunk_size))
+                created['QuestionResponse'] += len(QuestionResponse.objects.bulk_create(question_rows, batch_size=chunk_size))
+
+                # The last run of a board decides how far it went
+                last_run = {board: index for index, board in enumerate(run_boards.tolist())}
+                statuses = {}
+                for board, index in last_run.items():
+                    finished = float(run_times[index])
+                    if run_passed[index] and rng.random() < verified_fraction:
+                        statuses[board] = ('qa_verified', finished + 3600)
+                    else:
+                        statuses[board] = ('tested', finished)
+                verified = [board for board, (status, when) in statuses.items() if status == 'qa_verified']
+                assembled = verified[:int(len(verified) * assembled_fraction) // pcbs_per_module * pcbs_per_module]
+
+                modules = []
+                module_statuses = [choice for choice, label in Module.STATUS_CHOICES]
+                for group in range(0, len(assembled), pcbs_per_module):
+                    module_number += 1
+                    members = assembled[group:group + pcbs_per_module]
+                    when = min(max(statuses[board][1] for board in members) + 86400, span)
+                    modules.append(Module(
+                        module_serial_number=f'{prefix}-M{module_number:08d}',
+                        assembler=tester,
+                        assembly_date=start + timedelta(seconds=when),
+                        status=module_statuses[min(int(rng.exponential(1)), len(module_statuses) - 1)]
+                    ))
+                    for board in members:
+                        statuses[board] = ('assembled', when)
+                modules = Module.objects.bulk_create(modules)
+                created['Module'] += len(modules)
+                Through = Module.pcbs.through
+                Through.objects.bulk_create([
+                    Through(module_id=module.id, pcb_id=rows[board].id)
+                    for index, module in enumerate(modules)
+                    for board in assembled[index * pcbs_per_module:(index + 1) * pcbs_per_module]
+                ], batch_size=chunk_size)
+
+                changed = []
+                for board, (status, when) in statuses.items():
+                    pcb = rows[board]
+                    pcb.status = status
+                    pcb.updated_at = start + timedelta(seconds=min(when, span))
+                    changed.append(pcb)
+                PCB.objects.bulk_update(changed, ['status', 'updated_at'], batch_size=chunk_size)
+
+            if progress:
+                progress(first + count)
+    return created, catalogue
+
+
+def refresh_derived_data(catalogue):
+    """Rebuild what the signals and incremental jobs would have maintained for the generated rows"""
+    reconcile_counters()
+    rebuild([parameter.id for pcb_type, config, parameters, questions in catalogue for parameter in parameters])
+    rebuild_rollups(timedelta(0))
+    refresh_snapshots([config.id for pcb_type, config, parameters, questions in catalogue])
+    touch_batches(Batch.objects.filter(pcb_type__in=[pcb_type for pcb_type, config, parameters, questions in catalogue]))
@@ -0,0 +1,1311 @@
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import blobs, downloads, metrics, roles
+from .analytics import batch_yields, touch_batches, yield_stats
+from .assembly import assemble_modules, read_assembly_csv
+from .benchmark import benchmark_user, compare_reports, run_benchmark
+from .config_cache import ConfigSpecCache, get_config_spec, get_config_specs, spec_cache
+from .counters import reconcile_counters, status_totals
+from .downloads import parse_range
+from .evaluation import compute_verdicts, evaluate_batch, evaluate_measurements, evaluate_pcb, failed_groups
+from .extraction import extract_pending
+from .forms import PCBBulkCreateForm
+from .genealogy import genealogy
+from .importers import ImportFormatError, import_results, iter_csv_rows, iter_rows
+from .models import (
+    PCB, Batch, Blob, DailyProductionRollup, FileAttachment, Module, ModuleTestRecord, ParameterMeasurement, ParameterSubgroup,
+    PCBType, QuestionResponse, RoleVersion, StatusCounter, TestConfig, TestMeasurement, TestParameter, TestQuestion,
+)
+from .pagination import CursorPaginator
+from .reports import parse_report
+from .results import record_results
+from .roles import forget_roles_version, user_groups
+from .rollups import rebuild_rollups, update_rollups
+from .search import search_pcbs
+from .snapshots import open_snapshot, refresh_snapshots
+from .spc import _snapshot_samples, add_values, capability, control_chart, parameter_capability
+from .synthetic import generate, refresh_derived_data
+from .uploads import UploadError, UploadOffsetError, bind_upload, finish_upload, partial_path, start_upload, write_chunk
+from .workflow import TransitionError, pcb_workflow
+
+
+class ViewTestCase(TestCase):
+    """
+    Rolled-back tests reuse user ids and roles versions, so group names
+    cached by an earlier test must not be seen by the next one.
+    """
+    def setUp(self):
+        cache.clear()
+        forget_roles_version()
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+        self.pcbs = [PCB.objects.create(serial_number=f'S{index}', batch=self.batch) for index in range(3)]
+
+    def totals(self):
+        return DailyProductionRollup.objects.aggregate(
+            created=Sum('created'), tested=Sum('tested'), verified=Sum('verified'), assembled=Sum('assembled')
+        )
+
+    def move(self, pcb, status, when=None):
+        PCB.objects.filter(id=pcb.id).update(status=status, updated_at=when or timezone.now())
+
+    def test_statuses_past_assembly_are_not_counted_again(self):
+        self.move(self.pcbs[0], 'functional_tested')
+        self.move(self.pcbs[1], 'tested')
+        rebuild_rollups(timedelta(0))
+        self.assertEqual(self.totals(), {'created': 3, 'tested': 2, 'verified': 1, 'assembled': 1})
+        self.assertEqual(PCB.objects.get(id=self.pcbs[0].id).rolled_up_status, 'assembled')
+
+        self.move(self.pcbs[0], 'environmental_tested')
+        update_rollups(timedelta(0))
+        self.assertEqual(self.totals(), {'created': 3, 'tested': 2, 'verified': 1, 'assembled': 1})
+
+    def test_legacy_raw_statuses_are_read_as_assembled(self):
+        rebuild_rollups(timedelta(0))
+        PCB.objects.filter(id=self.pcbs[0].id).update(rolled_up_status='functional_tested')
+        self.move(self.pcbs[0], 'completed')
+        update_rollups(timedelta(0))
+        self.assertEqual(self.totals(), {'created': 3, 'tested': 0, 'verified': 0, 'assembled': 0})
+
+    def test_created_is_dated_by_creation(self):
+        created = timezone.now() - timedelta(days=10)
+        PCB.objects.filter(id=self.pcbs[0].id).update(created_at=created)
+        self.move(self.pcbs[0], 'tested')
+        rebuild_rollups(timedelta(0))
+        old_day = DailyProductionRollup.objects.get(day=timezone.localdate(created))
+        self.assertEqual((old_day.created, old_day.tested), (1, 0))
+        today = DailyProductionRollup.objects.get(day=timezone.localdate())
+        self.assertEqual((today.created, today.tested), (2, 1))
+
+
+class RoleCacheTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('manager')
+        self.user.groups.add(Group.objects.create(name='Manager_lvl1'))
+
+    def groups(self):
+        return user_groups(User.objects.get(id=self.user.id))
+
+    def test_removed_membership_is_not_granted(self):
+        self.assertEqual(self.groups(), {'Manager_lvl1'})
+        self.user.groups.clear()
+        self.assertEqual(self.groups(), frozenset())
+
+    def test_known_version_costs_no_query(self):
+        self.groups()
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(user_groups(user), {'Manager_lvl1'})
+
+    def test_version_bumped_by_another_process_is_seen_after_the_ttl(self):
+        self.assertEqual(self.groups(), {'Manager_lvl1'})
+        # Another process changed the memberships; only the database tells this one
+        User.groups.through.objects.filter(user=self.user).delete()
+        RoleVersion.objects.update(version=F('version') + 1)
+        self.assertEqual(self.groups(), {'Manager_lvl1'})
+        later = time.monotonic() + roles.ROLE_VERSION_TTL + 1
+        with mock.patch.object(roles, 'time', mock.Mock(monotonic=lambda: later)):
+            self.assertEqual(self.groups(), frozenset())
+
+
+@override_settings(MIGRATION_MODULES={})
+class MigrationTests(TransactionTestCase):
+    def test_migrate_from_zero(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Marks the migrations applied where the test database was built without them
+            call_command('migrate', 'pcb_tracker', fake=True, verbosity=0)
+            call_command('migrate', 'pcb_tracker', 'zero', verbosity=0)
+            call_command('migrate', 'pcb_tracker', verbosity=0)
+        self.assertEqual(RoleVersion.objects.count(), 1)
+        self.assertTrue(Group.objects.filter(name='pcb_testing').exists())
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        snapshot_settings = override_settings(MEASUREMENT_SNAPSHOT_DIR=directory)
+        snapshot_settings.enable()
+        self.addCleanup(snapshot_settings.disable)
+        pcb_type = PCBType.objects.create(name='T')
+        self.config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        self.voltage = TestParameter.objects.create(test_config=self.config, parameter_type='voltage', name='Vcc', unit='V')
+        self.current = TestParameter.objects.create(test_config=self.config, parameter_type='current', name='Icc', unit='A')
+        batch = Batch.objects.create(batch_number='B1', pcb_type=pcb_type)
+        tester = User.objects.create_user('tester')
+        self.runs = []
+        for index in range(2):
+            pcb = PCB.objects.create(serial_number=f'S{index}', batch=batch, test_config=self.config)
+            run = TestMeasurement.objects.create(pcb=pcb, test_config=self.config, tester=tester)
+            ParameterMeasurement.objects.create(test_measurement=run, test_parameter=self.voltage, value=Decimal('3.3'))
+            self.runs.append(run)
+
+    def test_values_added_or_edited_in_older_runs_are_picked_up(self):
+        self.assertEqual(refresh_snapshots([self.config.id]), {self.config.id: 2})
+        ParameterMeasurement.objects.bulk_create([
+            ParameterMeasurement(test_measurement=self.runs[1], test_parameter=self.current, value=Decimal('0.5'))
+        ])
+        edited = ParameterMeasurement.objects.get(test_measurement=self.runs[0])
+        edited.value = Decimal('3.4')
+        edited.save()
+
+        self.assertEqual(refresh_snapshots([self.config.id]), {self.config.id: 0})
+        snapshot = open_snapshot(self.config.id)
+        self.assertEqual(snapshot.values[self.voltage.id].tolist(), [3.4, 3.3])
+        self.assertEqual(snapshot.values[self.current.id][1], 0.5)
+
+    def test_a_deleted_and_a_late_run_trigger_a_rebuild(self):
+        pcb, tester = self.runs[1].pcb, self.runs[1].tester
+        gap = TestMeasurement.objects.create(pcb=pcb, test_config=self.config, tester=tester)
+        last = TestMeasurement.objects.create(pcb=pcb, test_config=self.config, tester=tester)
+        gap_id = gap.id
+        gap.delete()
+        refresh_snapshots([self.config.id])
+        # One run deleted, and one that committed late with an id below the high-water mark
+        self.runs[1].delete()
+        TestMeasurement.objects.create(id=gap_id, pcb=pcb, test_config=self.config, tester=tester)
+        refresh_snapshots([self.config.id])
+        self.assertEqual(open_snapshot(self.config.id).measurement_id.tolist(), [self.runs[0].id, gap_id, last.id])
+
+    def test_rows_of_deleted_boards_are_left_out_of_spc_samples(self):
+        gone = PCB.objects.create(serial_number='S9', batch=Batch.objects.create(batch_number='B2', pcb_type=self.config.pcb_type))
+        run = TestMeasurement.objects.create(pcb=gone, test_config=self.config, tester=self.runs[0].tester)
+        ParameterMeasurement.objects.create(test_measurement=run, test_parameter=self.voltage, value=Decimal('9'))
+        refresh_snapshots([self.config.id])
+        gone.delete()
+        samples = [sample for chunk in _snapshot_samples({self.config.id: [self.voltage.id]}) for sample in chunk]
+        batch_id = self.runs[0].pcb.batch_id
+        self.assertEqual(samples, [(self.voltage.id, batch_id, 3.3), (self.voltage.id, batch_id, 3.3)])
+
+
+class ImportTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        pcb_type = PCBType.objects.create(name='T')
+        config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        TestParameter.objects.create(test_config=config, parameter_type='voltage', name='Vcc', unit='V', max_value=Decimal('3.6'))
+        TestQuestion.objects.create(test_config=config, question_text='Seated?', required=False)
+        batch = Batch.objects.create(batch_number='B1', pcb_type=pcb_type)
+        for serial in ('S1', 'S2', 'S3'):
+            PCB.objects.create(serial_number=serial, batch=batch, test_config=config)
+        self.user = User.objects.create_user('tester')
+
+    def import_csv(self, text, **options):
+        rejects = []
+        summary = import_results(
+            iter_rows(io.BytesIO(text.encode()), 'results.csv'), self.user,
+            on_reject=lambda row, serial, errors: rejects.append((row, serial, errors)), **options
+        )
+        return summary, rejects
+
+    def test_rows_are_matched_by_header_and_rejected_with_their_line(self):
+        summary, rejects = self.import_csv(
+            '\n'
+            'Serial Number,Vcc,Seated?,Notes\n'
+            'S1,3.3,yes,first\n'
+            ',3.3,yes,\n'
+            'S2,lots,no,\n'
+            '\n'
+            'S3,3.9,,\n',
+            chunk_size=1
+        )
+        self.assertEqual(summary, {'rows': 4, 'recorded': 2, 'rejected': 2})
+        self.assertEqual(rejects, [(4, '', ['Missing serial number']), (5, 'S2', ['Parameter Vcc: "lots" is not a number'])])
+        self.assertEqual(dict(TestMeasurement.objects.values_list('pcb__serial_number', 'verdict')), {'S1': 'pass', 'S3': 'fail'})
+        self.assertEqual(TestMeasurement.objects.get(pcb__serial_number='S1').notes, 'first')
+
+    def test_header_needs_a_serial_column(self):
+        with self.assertRaisesMessage(ImportFormatError, 'serial_number'):
+            self.import_csv('Vcc\n3.3\n')
+        with self.assertRaisesMessage(ImportFormatError, 'empty'):
+            self.import_csv('\n,\n')
+
+    def test_xlsx_rows_are_read_from_the_first_sheet(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        workbook.active.append(['serial_number', 'Vcc'])
+        workbook.active.append(['S1', 3.3])
+        content = io.BytesIO()
+        workbook.save(content)
+        content.seek(0)
+        summary = import_results(iter_rows(content, 'results.XLSX'), self.user)
+        self.assertEqual(summary, {'rows': 1, 'recorded': 1, 'rejected': 0})
+        with self.assertRaises(ImportFormatError):
+            iter_rows(content, 'results.txt')
+
+    def test_unreadable_csv_is_a_format_error(self):
+        with self.assertRaises(ImportFormatError):
+            list(iter_csv_rows(io.BytesIO('serial_number,Température\nS1,21\n'.encode('latin-1'))))
+        with self.assertRaises(ImportFormatError):
+            list(iter_csv_rows(io.BytesIO(b'serial_number,notes\nS1,' + b'x' * (csv.field_size_limit() + 1))))
+
+    def test_latin1_upload_is_reported_not_a_server_error(self):
+        self.user.groups.add(Group.objects.create(name='pcb_testing'))
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('results.csv', 'serial_number,Température\nS1,21\n'.encode('latin-1'))
+        response = self.client.post('/pcb/test/import/', {'file': upload}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('not UTF-8', ' '.join(str(message) for message in response.context['messages']))
+
+
+class BulkResultTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        pcb_type = PCBType.objects.create(name='T')
+        config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        self.first = TestParameter.objects.create(test_config=config, parameter_type='voltage', name='Vcc', unit='V')
+        self.second = TestParameter.objects.create(test_config=config, parameter_type='voltage', name='Vcc', unit='V', order=1)
+        PCB.objects.create(serial_number='S1', batch=Batch.objects.create(batch_number='B1', pcb_type=pcb_type), test_config=config)
+        user = User.objects.create_user('station')
+        user.groups.add(Group.objects.create(name='pcb_testing'))
+        self.client.force_login(user)
+
+    def submit(self, parameters):
+        return self.client.post(
+            '/pcb/test/bulk/', {'results': [{'serial_number': 'S1', 'parameters': parameters}]}, content_type='application/json'
+        ).json()['results'][0]
+
+    def test_duplicate_names_can_be_submitted_by_id(self):
+        self.assertEqual(self.submit({'Vcc': 3.3})['status'], 'error')
+        self.assertEqual(self.submit({str(self.first.id): 3.3, str(self.second.id): 3.4})['status'], 'ok')
+        self.assertEqual(
+            sorted(ParameterMeasurement.objects.values_list('test_parameter_id', 'value')),
+            [(self.first.id, Decimal('3.3')), (self.second.id, Decimal('3.4'))]
+        )
+
+    def test_batch_is_touched_after_the_submission_commits(self):
+        batch = Batch.objects.get()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.submit({str(self.first.id): 3.3, str(self.second.id): 3.4})['status'], 'ok')
+            batch.refresh_from_db()
+            self.assertIsNone(batch.results_updated_at)
+        for callback in callbacks:
+            callback()
+        batch.refresh_from_db()
+        self.assertIsNotNone(batch.results_updated_at)
+
+
+def use_temporary_media(test):
+    """Point MEDIA_ROOT at a directory removed when the test ends"""
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory, True)
+    media_settings = override_settings(MEDIA_ROOT=directory)
+    media_settings.enable()
+    test.addCleanup(media_settings.disable)
+    return directory
+
+
+class BlobCollectionTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+        self.storage = FileAttachment._meta.get_field('file').storage
+        self.content = b'report'
+        self.digest = hashlib.sha256(self.content).hexdigest()
+        self.path = self.storage.path(self.storage.place(self.upload(), self.digest))
+        old = os.path.getmtime(self.path) - 2 * blobs.DEFAULT_GRACE.total_seconds()
+        os.utime(self.path, (old, old))
+        Blob.objects.create(digest=self.digest, size=len(self.content), ref_count=0)
+
+    def upload(self):
+        descriptor, path = tempfile.mkstemp(dir=self.storage.location)
+        with os.fdopen(descriptor, 'wb') as target:
+            target.write(self.content)
+        return path
+
+    def test_blob_reused_during_collection_is_kept(self):
+        checked = blobs._older_than
+
+        def reused_after_check(path, cutoff):
+            old = checked(path, cutoff)
+            self.storage.place(self.upload(), self.digest)
+            return old
+
+        with mock.patch.object(blobs, '_older_than', reused_after_check):
+            self.assertEqual(blobs.collect_blobs()[0], 0)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertTrue(Blob.objects.filter(digest=self.digest).exists())
+
+    def test_upload_after_the_blob_was_moved_aside_stores_its_copy(self):
+        rename = os.rename
+
+        def reused_after_move(source, target):
+            rename(source, target)
+            self.storage.place(self.upload(), self.digest)
+
+        with mock.patch.object(os, 'rename', reused_after_move):
+            self.assertEqual(blobs.collect_blobs()[0], 1)
+        with open(self.path, 'rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_identical_uploads_share_one_counted_blob(self):
+        user = User.objects.create_user('tester')
+        pcb = PCB.objects.create(serial_number='S1', batch=Batch.objects.create(batch_number='B1'))
+        first, second = [
+            FileAttachment.objects.create(pcb=pcb, file_type='pcb_test', file=SimpleUploadedFile(name, self.content), uploaded_by=user)
+            for name in ('first.txt', 'second.txt')
+        ]
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual((first.display_name, second.display_name), ('first.txt', 'second.txt'))
+        self.assertEqual(Blob.objects.get(digest=self.digest).ref_count, 2)
+
+        first.delete()
+        self.assertEqual(Blob.objects.get(digest=self.digest).ref_count, 1)
+        self.assertEqual(blobs.collect_blobs(), (0, 0, 0))
+        second.delete()
+        self.assertEqual(blobs.reconcile_blob_refs(), [])
+        self.assertEqual(blobs.collect_blobs(timedelta(0))[0], 1)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class MetricsFileTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        for name, value in [('METRICS_DIR', directory), ('_flushed_pid', None)]:
+            patcher = mock.patch.object(metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.live = set()
+        patcher = mock.patch.object(metrics, '_alive', lambda pid: pid in self.live)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.own = metrics.REQUESTS.series.get(('dashboard', '200'), 0)
+
+    def worker_file(self, pid, count):
+        with open(metrics._process_file(pid), 'w') as target:
+            json.dump({metrics.REQUESTS.name: [[['dashboard', '200'], count]]}, target)
+
+    def requests(self):
+        return metrics.collect()[metrics.REQUESTS.name].get(('dashboard', '200'), 0) - self.own
+
+    def files(self):
+        return sorted(os.listdir(metrics.METRICS_DIR))
+
+    def test_exited_workers_are_folded_into_one_file(self):
+        self.live.add(1000001)
+        self.worker_file(1000001, 1)
+        self.worker_file(1000002, 3)
+        self.assertEqual(self.requests(), 4)
+        self.worker_file(1000003, 2)
+        self.assertEqual(self.requests(), 6)
+        self.assertEqual([name for name in self.files() if name.endswith('.json')], ['metrics-1000001.json', metrics.EXITED_FILE])
+
+    def test_reused_pid_keeps_the_previous_owner_counts(self):
+        self.worker_file(os.getpid(), 5)
+        metrics.flush()
+        self.assertEqual(self.requests(), 5)
+
+
+class MetricsAccessTests(ViewTestCase):
+    def test_proxied_requests_need_staff_or_the_token(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with mock.patch.object(metrics, 'METRICS_TOKEN', 's3cret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_requests_are_timed_and_their_queries_counted_per_view(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        before = list(metrics.REQUEST_QUERIES.series.get(('pcb_manage',), [0] * (len(metrics.QUERY_COUNT_BUCKETS) + 3)))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/pcb/manage/')
+        after = metrics.REQUEST_QUERIES.series[('pcb_manage',)]
+        self.assertEqual((after[-1] - before[-1], after[-2] - before[-2]), (1, len(queries)))
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('pcb_tracker_requests_total{view="pcb_manage",status="200"}', text)
+        self.assertIn('pcb_tracker_request_duration_seconds_bucket{view="pcb_manage",le="+Inf"}', text)
+        self.assertNotIn('view="metrics"', text)
+
+
+class CursorPaginationTests(TestCase):
+    def test_pages_cover_every_row_once_in_both_directions(self):
+        batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+        PCB.objects.bulk_create([PCB(serial_number=f'S{index:02d}', batch=batch) for index in range(11)])
+        # Ties on the leading column are broken by the id
+        day = timezone.now()
+        for index, pcb in enumerate(PCB.objects.order_by('id')):
+            PCB.objects.filter(id=pcb.id).update(created_at=day - timedelta(days=index // 3))
+        queryset = PCB.objects.order_by('-created_at', '-id')
+        expected = list(queryset.values_list('id', flat=True))
+        paginator = CursorPaginator(queryset, 4)
+
+        pages = [paginator.get_page(None)]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([pcb.id for page in pages for pcb in page], expected)
+        self.assertEqual([len(page) for page in pages], [4, 4, 3])
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual([pcb.id for pcb in back], expected[4:8])
+        self.assertEqual([pcb.id for pcb in paginator.get_page(back.previous_cursor)], expected[:4])
+        self.assertEqual([pcb.id for pcb in paginator.get_page('tampered')], expected[:4])
+
+    def test_no_count_without_a_planner_estimate(self):
+        batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+        PCB.objects.bulk_create([PCB(serial_number=f'S{index}', batch=batch) for index in range(3)])
+        with CaptureQueriesContext(connection) as queries:
+            page = CursorPaginator(PCB.objects.all(), 2, estimate_count=True).get_page(None)
+        self.assertEqual(len(page), 2)
+        if connection.vendor != 'postgresql':
+            self.assertIsNone(page.count)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+
+class TraceabilityAccessTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+        PCB.objects.create(serial_number='S1', batch=self.batch)
+
+    def get_all(self):
+        return [
+            self.client.get(f'/trace/batch/{self.batch.id}/{suffix}').status_code
+            for suffix in ('', 'json/', 'dossier.zip')
+        ]
+
+    def test_dossier_and_tree_need_a_role_that_may_download_attachments(self):
+        self.client.force_login(User.objects.create_user('visitor'))
+        self.assertEqual(self.get_all(), [302, 302, 302])
+        tester = User.objects.create_user('tester')
+        tester.groups.add(Group.objects.create(name='pcb_testing'))
+        self.client.force_login(tester)
+        self.assertEqual(self.get_all(), [200, 200, 200])
+
+
+class RecordResultsTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        pcb_type = PCBType.objects.create(name='T')
+        config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        self.voltage = TestParameter.objects.create(
+            test_config=config, parameter_type='voltage', name='Vcc', unit='V', min_value=Decimal('3.0'), max_value=Decimal('3.6')
+        )
+        self.current = TestParameter.objects.create(
+            test_config=config, parameter_type='current', name='Icc', unit='A', max_value=Decimal('0.5'), required=False, order=1
+        )
+        self.question = TestQuestion.objects.create(test_config=config, question_text='Visual inspection passed?')
+        batch = Batch.objects.create(batch_number='B1', pcb_type=pcb_type)
+        for serial in ('S1', 'S2', 'S3'):
+            PCB.objects.create(serial_number=serial, batch=batch, test_config=config)
+        self.tester = User.objects.create_user('tester')
+
+    def entry(self, serial, voltage='3.3', **extra):
+        return dict({'serial_number': serial, 'parameters': {'Vcc': voltage}, 'questions': {'Visual inspection passed?': 'yes'}}, **extra)
+
+    def test_valid_entries_are_recorded_and_invalid_ones_reported(self):
+        report = record_results([
+            self.entry('S1'),
+            self.entry('S2', voltage='abc'),
+            self.entry('S9'),
+            {'serial_number': 'S3', 'parameters': {}, 'questions': {}},
+            self.entry('S1'),
+        ], self.tester)
+        self.assertEqual([result['status'] for result in report], ['ok', 'error', 'error', 'error', 'error'])
+        self.assertIn('Parameter Vcc: "abc" is not a number', report[1]['errors'])
+        self.assertEqual(report[2]['errors'], ['PCB with this serial number does not exist'])
+        self.assertEqual(sorted(report[3]['errors']), [
+            'Parameter Vcc: a value is required', 'Question Visual inspection passed?: a response is required'
+        ])
+        self.assertEqual(report[4]['errors'], ['Duplicate result for this PCB in the same submission'])
+        self.assertEqual(dict(PCB.objects.values_list('serial_number', 'status')), {'S1': 'tested', 'S2': 'pending', 'S3': 'pending'})
+        self.assertEqual(QuestionResponse.objects.get().response, True)
+
+    def test_verdicts_follow_the_limits(self):
+        report = record_results([
+            self.entry('S1', parameters={'Vcc': '3.6', 'Icc': '0.2'}),
+            self.entry('S2', parameters={'Vcc': '3.3', 'Icc': '0.7'}),
+        ], self.tester)
+        self.assertEqual([result['verdict'] for result in report], ['pass', 'fail'])
+        self.assertEqual(
+            dict(ParameterMeasurement.objects.filter(test_measurement__pcb__serial_number='S2').values_list('test_parameter__name', 'verdict')),
+            {'Vcc': 'pass', 'Icc': 'fail'}
+        )
+
+    def test_a_tested_board_is_not_tested_again(self):
+        record_results([self.entry('S1')], self.tester)
+        report = record_results([self.entry('S1')], self.tester)
+        self.assertEqual(report[0]['errors'], ['PCB is not available for testing (status: tested)'])
+        self.assertEqual(TestMeasurement.objects.count(), 1)
+
+    def test_malformed_requests_are_rejected(self):
+        self.client.force_login(self.tester)
+        self.tester.groups.add(Group.objects.create(name='pcb_testing'))
+        self.assertEqual(self.client.post('/pcb/test/bulk/', 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post('/pcb/test/bulk/', {'results': []}, content_type='application/json').status_code, 400)
+
+
+class ConfigSpecTests(TestCase):
+    def setUp(self):
+        spec_cache.clear()
+        self.config = TestConfig.objects.create(name='C', pcb_type=PCBType.objects.create(name='T'))
+        self.voltage = TestParameter.objects.create(
+            test_config=self.config, parameter_type='voltage', name='Vcc', unit='V', max_value=Decimal('3.6')
+        )
+
+    def test_cached_specs_cost_one_query(self):
+        get_config_specs([self.config.id])
+        with self.assertNumQueries(1):
+            specs = get_config_specs([self.config.id, 999])
+        self.assertEqual(list(specs), [self.config.id])
+        self.assertEqual([parameter.name for parameter in specs[self.config.id].parameters], ['Vcc'])
+
+    def test_edits_give_a_new_spec(self):
+        old = get_config_spec(TestConfig.objects.get(id=self.config.id))
+        self.voltage.max_value = Decimal('5.0')
+        self.voltage.save()
+        TestQuestion.objects.create(test_config=self.config, question_text='Seated?')
+        new = get_config_spec(TestConfig.objects.get(id=self.config.id))
+        self.assertNotEqual(new.updated_at, old.updated_at)
+        self.assertEqual(new.parameters[0].max_value, Decimal('5.0'))
+        self.assertEqual([question.question_text for question in new.questions], ['Seated?'])
+        self.assertIn(f'question_{new.questions[0].id}', new.form_class.base_fields)
+        self.assertEqual(len(spec_cache), 1)
+
+    def test_least_recently_used_entries_are_dropped(self):
+        specs = ConfigSpecCache(2)
+        specs.put((1, 'a'), 'one')
+        specs.put((2, 'a'), 'two')
+        specs.get((1, 'a'))
+        specs.put((3, 'a'), 'three')
+        self.assertEqual((specs.get((1, 'a')), specs.get((2, 'a')), specs.get((3, 'a'))), ('one', None, 'three'))
+        specs.put((1, 'b'), 'newer')
+        self.assertEqual((specs.get((1, 'a')), len(specs)), (None, 2))
+
+
+class EvaluationTests(TestCase):
+    def setUp(self):
+        pcb_type = PCBType.objects.create(name='T')
+        config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        self.voltage = TestParameter.objects.create(
+            test_config=config, parameter_type='voltage', name='Vcc', unit='V', min_value=Decimal('3.0'), max_value=Decimal('3.6')
+        )
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=pcb_type)
+        tester = User.objects.create_user('tester')
+        self.runs = {}
+        for serial, value in (('S1', '3.0'), ('S2', '3.6'), ('S3', '3.7')):
+            pcb = PCB.objects.create(serial_number=serial, batch=self.batch, test_config=config)
+            self.runs[serial] = TestMeasurement.objects.create(pcb=pcb, test_config=config, tester=tester)
+            ParameterMeasurement.objects.create(test_measurement=self.runs[serial], test_parameter=self.voltage, value=Decimal(value))
+
+    def verdicts(self):
+        return dict(TestMeasurement.objects.values_list('pcb__serial_number', 'verdict'))
+
+    def test_limits_are_inclusive_and_missing_limits_unbounded(self):
+        values = np.array([1.0, 2.0, 3.0, 4.0, np.nan])
+        passed = compute_verdicts(values, np.array([2.0, 2.0, np.nan, np.nan, 0.0]), np.array([3.0, 3.0, 3.0, np.nan, 1.0]))
+        self.assertEqual(passed.tolist(), [False, True, True, True, True])
+        self.assertEqual(failed_groups(np.array([7, 7, 8, 9, 9]), passed).tolist(), [7])
+
+    def test_verdicts_are_written_and_rewritten_after_a_limit_change(self):
+        self.assertEqual(evaluate_batch(self.batch), {'measurements': 3, 'failed': 1, 'values': 3, 'failed_values': 1})
+        self.assertEqual(self.verdicts(), {'S1': 'pass', 'S2': 'pass', 'S3': 'fail'})
+
+        TestParameter.objects.filter(id=self.voltage.id).update(max_value=None)
+        with CaptureQueriesContext(connection) as queries:
+            evaluate_measurements(TestMeasurement.objects.filter(pcb__batch=self.batch))
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len([sql for sql in updates if 'verdict' in sql]), 2)
+        self.assertEqual(self.verdicts(), {'S1': 'pass', 'S2': 'pass', 'S3': 'pass'})
+        self.assertEqual(set(ParameterMeasurement.objects.values_list('verdict', flat=True)), {'pass'})
+
+    def test_unchanged_verdicts_touch_nothing(self):
+        evaluate_pcb(self.runs['S3'].pcb)
+        with CaptureQueriesContext(connection) as queries:
+            evaluate_pcb(self.runs['S3'].pcb)
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')])
+
+
+class BulkCreateTests(TestCase):
+    def setUp(self):
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+
+    def form(self, pattern):
+        return PCBBulkCreateForm({'serial_pattern': pattern, 'batch': self.batch.id, 'notes': ''})
+
+    def test_range_is_expanded_with_padding_and_counted(self):
+        form = self.form('MQ-{098..102}-A')
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save(), 5)
+        self.assertEqual(
+            list(PCB.objects.order_by('serial_number').values_list('serial_number', flat=True)),
+            ['MQ-098-A', 'MQ-099-A', 'MQ-100-A', 'MQ-101-A', 'MQ-102-A']
+        )
+        self.assertEqual(status_totals()['pcb']['pending'], 5)
+        self.assertEqual(reconcile_counters(), [])
+
+    def test_existing_serials_and_bad_ranges_are_rejected(self):
+        PCB.objects.create(serial_number='MQ-0002', batch=self.batch)
+        form = self.form('MQ-{0001..0003}')
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['serial_pattern'], ['1 serial number(s) already exist: MQ-0002'])
+        for pattern in ('MQ-{5..1}', 'MQ-0001', 'MQ-{1..2}-{1..2}', 'MQ-{1..200000}'):
+            self.assertIn('serial_pattern', self.form(pattern).errors, pattern)
+        self.assertEqual(PCB.objects.count(), 1)
+
+
+class AssemblyTests(TestCase):
+    def setUp(self):
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+        for serial, status in (('P1', 'qa_verified'), ('P2', 'qa_verified'), ('P3', 'qa_verified'), ('P4', 'tested')):
+            PCB.objects.create(serial_number=serial, batch=self.batch, status=status)
+        self.assembler = User.objects.create_user('assembler')
+
+    def request(self, module, *serials):
+        return {'module_serial_number': module, 'pcb_serials': list(serials)}
+
+    def test_each_request_is_checked_on_its_own(self):
+        Module.objects.create(module_serial_number='M0', assembler=self.assembler)
+        report = assemble_modules([
+            self.request('M1', 'P1', 'P2'),
+            self.request('M2', 'P2', 'P3'),
+            self.request('M3', 'P4', 'P9'),
+            self.request('M0', 'P3'),
+            self.request('M4', 'P3', 'P3'),
+            self.request('M5', 'P3'),
+        ], self.assembler)
+        self.assertEqual([result['status'] for result in report], ['ok', 'error', 'error', 'error', 'error', 'ok'])
+        self.assertEqual(report[1]['errors'], ['PCB P2 is already used by another module in this submission.'])
+        self.assertEqual(report[2]['errors'], [
+            'PCB P4 is not ready for assembly. Status: tested', 'PCB with serial number P9 does not exist.'
+        ])
+        self.assertEqual(report[3]['errors'], ['Module M0 already exists.'])
+        self.assertIn('The same PCB is listed more than once.', report[4]['errors'])
+        self.assertEqual(sorted(report[0]['module'].pcbs.values_list('serial_number', flat=True)), ['P1', 'P2'])
+        self.assertEqual(
+            dict(PCB.objects.values_list('serial_number', 'status')),
+            {'P1': 'assembled', 'P2': 'assembled', 'P3': 'assembled', 'P4': 'tested'}
+        )
+        self.assertEqual(reconcile_counters(), [])
+
+    def test_csv_rows_are_grouped_by_module(self):
+        requests = read_assembly_csv([
+            ['Module', 'PCB', 'Notes'], ['M1', 'P1', ''], ['M2', 'P3', 'rework'], [], ['M1', 'P2', 'first'],
+        ])
+        self.assertEqual(requests, [
+            {'module_serial_number': 'M1', 'pcb_serials': ['P1', 'P2'], 'notes': 'first'},
+            {'module_serial_number': 'M2', 'pcb_serials': ['P3'], 'notes': 'rework'},
+        ])
+        with self.assertRaises(ValueError):
+            read_assembly_csv([['serial'], ['P1']])
+        with self.assertRaises(ValueError):
+            read_assembly_csv([['module', 'pcb'], ['', 'P1']])
+
+
+class WorkflowTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+        self.untyped = Batch.objects.create(batch_number='B2')
+        self.pcbs = [PCB.objects.create(serial_number=f'S{index}', batch=self.batch) for index in range(3)]
+        self.pcbs.append(PCB.objects.create(serial_number='S3', batch=self.untyped))
+
+    def test_only_neighbouring_statuses_are_allowed(self):
+        self.assertEqual(pcb_workflow.allowed('tested'), {'qa_verified'})
+        self.assertEqual(pcb_workflow.allowed('tested', correction=True), {'pending', 'qa_verified'})
+        with self.assertRaises(TransitionError):
+            pcb_workflow.transition(self.pcbs[0], 'qa_verified')
+        with self.assertRaises(TransitionError):
+            pcb_workflow.transition(self.pcbs[0], 'scrapped')
+        self.assertEqual(pcb_workflow.transition(self.pcbs[0], 'tested'), 1)
+        self.assertEqual(self.pcbs[0].status, 'tested')
+        self.assertEqual(pcb_workflow.transition(self.pcbs[0], 'pending', correction=True), 1)
+
+    def test_a_stale_status_changes_nothing(self):
+        stale = PCB.objects.get(id=self.pcbs[0].id)
+        self.assertEqual(pcb_workflow.transition(self.pcbs[0], 'tested'), 1)
+        self.assertEqual(pcb_workflow.transition(stale, 'tested'), 0)
+        self.assertEqual(stale.status, 'pending')
+        self.assertEqual(reconcile_counters(), [])
+
+    def test_bulk_transitions_move_the_counters_of_each_type(self):
+        self.assertEqual(pcb_workflow.bulk_transition(PCB.objects.all(), 'pending', 'tested'), 4)
+        self.assertEqual(pcb_workflow.bulk_transition([pcb.id for pcb in self.pcbs[:2]], 'tested', 'qa_verified'), 2)
+        self.assertEqual(pcb_workflow.bulk_transition([self.pcbs[0].id], 'tested', 'qa_verified'), 0)
+        self.assertEqual(status_totals()['pcb']['tested'], 2)
+        self.assertEqual(reconcile_counters(), [])
+
+    def test_managers_cannot_skip_statuses(self):
+        self.client.force_login(User.objects.create_user('manager', is_staff=True))
+        pcb = self.pcbs[0]
+        data = {'update': '1', 'pcb_id': pcb.id, 'serial_number': pcb.serial_number, 'batch': self.batch.id, 'notes': ''}
+        self.client.post('/pcb/manage/', dict(data, status='qa_verified'))
+        self.assertEqual(PCB.objects.get(id=pcb.id).status, 'pending')
+        self.client.post('/pcb/manage/', dict(data, status='tested'))
+        self.assertEqual(PCB.objects.get(id=pcb.id).status, 'tested')
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.first = PCBType.objects.create(name='T1')
+        self.second = PCBType.objects.create(name='T2')
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=self.first)
+        self.other = Batch.objects.create(batch_number='B2', pcb_type=self.second)
+        self.pcbs = [PCB.objects.create(serial_number=f'S{index}', batch=self.batch) for index in range(3)]
+
+    def counts(self, pcb_type):
+        return dict(StatusCounter.objects.filter(entity='pcb', pcb_type=pcb_type).exclude(count=0).values_list('status', 'count'))
+
+    def test_moving_a_board_to_another_type_moves_its_count(self):
+        pcb_workflow.transition(self.pcbs[0], 'tested')
+        pcb = PCB.objects.get(id=self.pcbs[0].id)
+        pcb.batch = self.other
+        pcb.save()
+        self.assertEqual(self.counts(self.first), {'pending': 2})
+        self.assertEqual(self.counts(self.second), {'tested': 1})
+        self.assertEqual(reconcile_counters(), [])
+
+    def test_changing_a_batch_type_moves_all_its_boards(self):
+        self.batch.pcb_type = None
+        self.batch.save()
+        self.assertEqual(self.counts(self.first), {})
+        self.assertEqual(self.counts(None), {'pending': 3})
+        self.batch.pcb_type = self.second
+        self.batch.save()
+        self.assertEqual(self.counts(self.second), {'pending': 3})
+        self.assertEqual(reconcile_counters(), [])
+
+    def test_deletes_and_cascades_are_counted(self):
+        self.pcbs[0].delete()
+        Module.objects.create(module_serial_number='M1', assembler=User.objects.create_user('assembler'))
+        totals = status_totals()
+        self.assertEqual((totals['pcb']['pending'], totals['module']), (2, {'assembled': 1}))
+        self.first.delete()
+        self.assertEqual(reconcile_counters(), [])
+        self.assertEqual(status_totals()['pcb'], {status: 0 for status, label in PCB.STATUS_CHOICES})
+
+    def test_reconcile_repairs_drifted_counters(self):
+        StatusCounter.objects.filter(entity='pcb', pcb_type=self.first, status='pending').update(count=7)
+        out = io.StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn(f'pcb type={self.first.id} pending: 7 -> 3', out.getvalue())
+        self.assertEqual(self.counts(self.first), {'pending': 3})
+
+
+class YieldTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+        self.first = User.objects.create_user('first')
+        self.second = User.objects.create_user('second')
+        runs = {'S1': [(self.first, 'pass')], 'S2': [(self.first, 'fail'), (self.second, 'pass')], 'S3': [(self.second, 'fail')]}
+        for serial, verdicts in runs.items():
+            pcb = PCB.objects.create(serial_number=serial, batch=self.batch)
+            for tester, verdict in verdicts:
+                TestMeasurement.objects.create(pcb=pcb, tester=tester, verdict=verdict)
+        PCB.objects.create(serial_number='S4', batch=self.batch)
+
+    def test_yields_follow_first_and_latest_runs(self):
+        self.assertEqual(yield_stats('batch')[self.batch.id], {
+            'boards': 3, 'tests': 4, 'first_pass': 1, 'final_pass': 2, 'retested': 1,
+            'first_pass_yield': 1 / 3, 'final_yield': 2 / 3, 'retest_rate': 1 / 3,
+        })
+        by_tester = yield_stats('tester')
+        self.assertEqual({tester: stats['boards'] for tester, stats in by_tester.items()}, {self.first.id: 2, self.second.id: 1})
+        self.assertEqual(list(yield_stats('test_config')), [None])
+        with self.assertRaises(ValueError):
+            yield_stats('station')
+
+    def test_batch_yields_are_cached_until_new_results(self):
+        empty = Batch.objects.create(batch_number='B2')
+        batches = list(Batch.objects.order_by('id'))
+        self.assertEqual(batch_yields(batches)[empty.id]['boards'], 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(batch_yields(batches)[self.batch.id]['final_pass'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TestMeasurement.objects.filter(pcb__serial_number='S3').update(verdict='pass')
+            touch_batches([self.batch.id])
+        self.assertEqual(batch_yields(Batch.objects.order_by('id'))[self.batch.id]['final_pass'], 3)
+
+
+class SpcTests(TestCase):
+    def setUp(self):
+        pcb_type = PCBType.objects.create(name='T')
+        config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        self.voltage = TestParameter.objects.create(
+            test_config=config, parameter_type='voltage', name='Vcc', unit='V', min_value=Decimal('3.0'), max_value=Decimal('3.6')
+        )
+        self.batches = [Batch.objects.create(batch_number=f'B{index}', pcb_type=pcb_type) for index in range(2)]
+        self.values = np.random.default_rng(7).normal(3.3, 0.05, 20)
+
+    def test_incremental_aggregates_match_the_whole_sample(self):
+        first, second = self.batches
+        add_values([(self.voltage.id, first.id, value) for value in self.values[:3]])
+        add_values([(self.voltage.id, first.id, value) for value in self.values[3:12]] + [(self.voltage.id, first.id, None)])
+        add_values([(self.voltage.id, second.id, value) for value in self.values[12:]])
+
+        sigma = self.values.std(ddof=1)
+        result = parameter_capability(self.voltage)
+        self.assertEqual(result['count'], 20)
+        self.assertAlmostEqual(result['mean'], self.values.mean())
+        self.assertAlmostEqual(result['sigma'], sigma)
+        self.assertAlmostEqual(result['cp'], 0.6 / (6 * sigma))
+        self.assertAlmostEqual(result['cpk'], min(3.6 - self.values.mean(), self.values.mean() - 3.0) / (3 * sigma))
+        self.assertAlmostEqual(parameter_capability(self.voltage, [second.id])['mean'], self.values[12:].mean())
+        self.assertEqual(
+            list(ParameterSubgroup.objects.filter(batch=first).order_by('id').values_list('count', flat=True)), [5, 5, 2]
+        )
+
+    def test_control_chart_uses_complete_subgroups(self):
+        add_values([(self.voltage.id, self.batches[0].id, value) for value in self.values[:12]])
+        chart = control_chart(self.voltage)
+        groups = self.values[:10].reshape(2, 5)
+        np.testing.assert_allclose([subgroup['mean'] for subgroup in chart['subgroups']], groups.mean(axis=1))
+        r_bar = np.ptp(groups, axis=1).mean()
+        self.assertAlmostEqual(chart['limits']['r_bar'], r_bar)
+        self.assertAlmostEqual(chart['limits']['x_ucl'], groups.mean() + 0.577 * r_bar)
+        self.assertEqual(chart['rolling']['count'], 10)
+        self.assertIsNone(control_chart(self.voltage, self.batches[1].id)['limits'])
+
+    def test_capability_without_limits_or_spread(self):
+        self.assertEqual(capability(1, 3.3, 0.0, None, Decimal('3.6'))['cpk'], None)
+        self.assertEqual(capability(0, 0.0, 0.0)['mean'], None)
+        self.assertAlmostEqual(capability(3, 3.0, 2.0, None, Decimal('6.0'))['cpk'], 1.0)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        power = PCBType.objects.create(name='Power')
+        batch = Batch.objects.create(batch_number='LOT-7', pcb_type=power)
+        other = Batch.objects.create(batch_number='B2', pcb_type=PCBType.objects.create(name='Sensor'))
+        config = TestConfig.objects.create(name='Burn-in ABC', pcb_type=power)
+        for serial, board_batch, notes, board_config in (
+            ('XABC1', other, '', None), ('ABC', other, '', None), ('ABC-2', other, '', None),
+            ('Q1', other, 'abc reworked', None), ('Q2', batch, '', None), ('Q3', other, '', config), ('Q4', other, '', None),
+        ):
+            PCB.objects.create(serial_number=serial, batch=board_batch, notes=notes, test_config=board_config)
+
+    def serials(self, query, queryset=None):
+        return list(search_pcbs(query, queryset).values_list('serial_number', flat=True))
+
+    def test_matches_are_ranked_by_kind(self):
+        self.assertEqual(self.serials('abc'), ['ABC', 'ABC-2', 'XABC1', 'Q1', 'Q3'])
+        self.assertEqual(self.serials('lot-7'), ['Q2'])
+        self.assertEqual(self.serials('power'), ['Q2'])
+
+    def test_short_and_empty_queries(self):
+        self.assertEqual(self.serials('q'), ['Q1', 'Q2', 'Q3', 'Q4'])
+        self.assertEqual(len(self.serials('  ')), 7)
+        self.assertEqual(self.serials('abc', PCB.objects.filter(batch__batch_number='B2', notes='')), ['ABC', 'ABC-2', 'XABC1', 'Q3'])
+
+
+class EditFormTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=PCBType.objects.create(name='T'))
+        self.pcb = PCB.objects.create(serial_number='S1', batch=self.batch, status='tested')
+        self.client.force_login(User.objects.create_user('manager', is_staff=True))
+
+    def test_edit_form_is_rendered_for_one_board(self):
+        response = self.client.get(f'/pcb/{self.pcb.id}/edit-form/')
+        self.assertContains(response, 'value="S1"')
+        self.assertContains(response, 'value="qa_verified"')
+        self.assertNotContains(response, 'value="assembled"')
+        self.assertEqual(self.client.get('/pcb/999/edit-form/').status_code, 404)
+
+    def test_list_page_does_not_grow_with_reference_data(self):
+        self.client.get('/pcb/manage/')
+        with CaptureQueriesContext(connection) as before:
+            self.client.get('/pcb/manage/')
+        for index in range(20):
+            Batch.objects.create(batch_number=f'X{index}', pcb_type=self.batch.pcb_type)
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get('/pcb/manage/')
+        self.assertEqual(len(after), len(before))
+        self.assertNotContains(response, 'X19')
+
+    def test_reference_data_is_versioned(self):
+        data = self.client.get('/reference-data/').json()
+        self.assertEqual(data['batches'], [[self.batch.id, 'B1 (T)']])
+        response = self.client.get(f'/reference-data/?v={data["version"]}')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('no-cache', self.client.get('/reference-data/?v=old')['Cache-Control'])
+
+        self.batch.batch_number = 'B1-renamed'
+        self.batch.save()
+        renamed = self.client.get('/reference-data/').json()
+        self.assertNotEqual(renamed['version'], data['version'])
+        self.assertEqual(renamed['batches'], [[self.batch.id, 'B1-renamed (T)']])
+
+
+class TraceabilityTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+        pcb_type = PCBType.objects.create(name='T')
+        self.config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        self.voltage = TestParameter.objects.create(test_config=self.config, parameter_type='voltage', name='Vcc', unit='V')
+        self.batch = Batch.objects.create(batch_number='B1', pcb_type=pcb_type)
+        self.tester = User.objects.create_user('tester')
+        self.module = Module.objects.create(module_serial_number='M1', assembler=self.tester)
+        ModuleTestRecord.objects.create(module=self.module, test_type='functional', result='pass', tester=self.tester)
+        self.pcbs = [self.add_board(f'S{index}') for index in range(2)]
+
+    def add_board(self, serial):
+        pcb = PCB.objects.create(serial_number=serial, batch=self.batch, test_config=self.config)
+        run = TestMeasurement.objects.create(pcb=pcb, test_config=self.config, tester=self.tester, verdict='pass')
+        ParameterMeasurement.objects.create(test_measurement=run, test_parameter=self.voltage, value=Decimal('3.3'))
+        FileAttachment.objects.create(
+            pcb=pcb, file_type='pcb_test', file=SimpleUploadedFile(f'{serial}.txt', serial.encode()), uploaded_by=self.tester
+        )
+        self.module.pcbs.add(pcb)
+        return pcb
+
+    def test_module_graph_holds_boards_runs_and_files(self):
+        graph = genealogy('module', self.module.id)
+        self.assertEqual(graph['root'], {'kind': 'module', 'id': self.module.id, 'label': 'M1'})
+        self.assertEqual([module['pcbs'] for module in graph['modules']], [[pcb.id for pcb in self.pcbs]])
+        self.assertEqual(graph['modules'][0]['test_records'][0]['result'], 'pass')
+        board = graph['pcbs'][0]
+        self.assertEqual(board['measurements'][0]['parameters'][0]['value'], Decimal('3.3'))
+        self.assertEqual([attachment['name'] for attachment in board['attachments']], ['S0.txt'])
+        self.assertEqual(graph['testers'], [{'id': self.tester.id, 'username': 'tester'}])
+        with self.assertRaises(ValueError):
+            genealogy('station', 1)
+
+    def test_query_count_does_not_grow_with_the_boards(self):
+        counts = []
+        for kind, object_id in (('module', self.module.id), ('batch', self.batch.id), ('pcb', self.pcbs[0].id)):
+            with CaptureQueriesContext(connection) as before:
+                genealogy(kind, object_id)
+            counts.append(len(before))
+        for index in range(2, 6):
+            self.add_board(f'S{index}')
+        for kind, object_id, count in zip(('module', 'batch', 'pcb'), (self.module.id, self.batch.id, self.pcbs[0].id), counts):
+            with self.assertNumQueries(count):
+                genealogy(kind, object_id)
+        self.assertLessEqual(max(counts), 9)
+
+    def test_json_view(self):
+        user = User.objects.create_user('viewer')
+        user.groups.add(Group.objects.create(name='pcb_testing'))
+        self.client.force_login(user)
+        data = self.client.get(f'/trace/batch/{self.batch.id}/json/').json()
+        self.assertEqual([pcb['serial_number'] for pcb in data['pcbs']], ['S0', 'S1'])
+        self.assertEqual(self.client.get('/trace/batch/999/json/').status_code, 404)
+        self.assertEqual(self.client.get('/trace/station/1/json/').status_code, 404)
+
+    def dossier(self, kind, object_id):
+        response = self.client.get(f'/trace/{kind}/{object_id}/dossier.zip')
+        self.assertEqual(response.status_code, 200)
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_dossier_holds_tables_and_reports(self):
+        user = User.objects.create_user('auditor')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(f'/trace/module/{self.module.id}/dossier.zip').status_code, 302)
+        user.groups.add(Group.objects.create(name='pcb_testing'))
+
+        os.remove(FileAttachment.objects.get(pcb=self.pcbs[1]).file.path)
+        archive = self.dossier('module', self.module.id)
+        self.assertIsNone(archive.testzip())
+        pcbs = list(csv.DictReader(io.TextIOWrapper(archive.open('pcbs.csv'))))
+        self.assertEqual([row['serial_number'] for row in pcbs], ['S0', 'S1'])
+        attachments = list(csv.DictReader(io.TextIOWrapper(archive.open('attachments.csv'))))
+        self.assertEqual([row['status'] for row in attachments], ['included', 'missing'])
+        self.assertEqual(archive.read(attachments[0]['archive_name']), b'S0')
+        self.assertEqual(len(archive.read('module_tests.csv').decode().splitlines()), 2)
+
+        self.assertIn('parameter_values.csv', self.dossier('batch', self.batch.id).namelist())
+        self.assertEqual(self.client.get(f'/trace/pcb/{self.pcbs[0].id}/dossier.zip').status_code, 404)
+
+
+class DownloadTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+        user = User.objects.create_user('tester')
+        user.groups.add(Group.objects.create(name='pcb_testing'))
+        self.client.force_login(user)
+        pcb = PCB.objects.create(serial_number='S1', batch=Batch.objects.create(batch_number='B1'))
+        self.content = bytes(range(256)) * 4
+        self.attachment = FileAttachment.objects.create(
+            pcb=pcb, file_type='pcb_test', file=SimpleUploadedFile('report.bin', self.content), uploaded_by=user
+        )
+        self.url = f'/attachments/{self.attachment.id}/download/'
+        self.etag = f'"{hashlib.sha256(self.content).hexdigest()}"'
+
+    def get(self, **headers):
+        return self.client.get(self.url, **headers)
+
+    def test_parse_range(self):
+        for header, expected in (
+            (None, None), ('bytes=0-99', (0, 99)), ('bytes=1000-', (1000, 1023)), ('bytes=1000-5000', (1000, 1023)),
+            ('bytes=-24', (1000, 1023)), ('bytes=-5000', (0, 1023)), ('bytes=-0', False), ('bytes=1024-', False),
+            ('bytes=5-4', False), ('bytes=0-1,5-6', None), ('items=0-1', None), ('bytes=-', None),
+        ):
+            self.assertEqual(parse_range(header, 1024), expected, header)
+        self.assertEqual(parse_range('bytes=-1', 0), False)
+        self.assertEqual(parse_range('bytes=0-', 0), False)
+
+    def test_whole_file_and_ranges(self):
+        response = self.get()
+        self.assertEqual((response.status_code, response['ETag'], response['Accept-Ranges']), (200, self.etag, 'bytes'))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 10-19/1024'))
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.get(HTTP_RANGE='bytes=2000-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */1024'))
+
+    def test_conditional_requests(self):
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=self.etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=f'"other", {self.etag}').status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=self.etag).status_code, 206)
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, response['Content-Length']), (200, '1024'))
+
+    def test_sendfile_modes_leave_the_body_to_the_server(self):
+        with mock.patch.object(downloads, 'ATTACHMENT_SENDFILE', 'x-accel-redirect'):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.attachment.file.name)
+        self.assertEqual(response.content, b'')
+        with mock.patch.object(downloads, 'ATTACHMENT_SENDFILE', 'x-sendfile'):
+            self.assertEqual(self.get()['X-Sendfile'], self.attachment.file.path)
+
+
+class UploadTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        use_temporary_media(self)
+        self.user = User.objects.create_user('tester')
+        self.user.groups.add(Group.objects.create(name='pcb_testing'))
+        self.content = b'0123456789'
+
+    def test_uncommitted_bytes_are_cut_back(self):
+        session = start_upload(self.user, 'C:\\reports\\run.bin', len(self.content))
+        self.assertEqual(session.file_name, 'run.bin')
+        self.assertEqual(write_chunk(session, 0, io.BytesIO(self.content[:4]), 4), 4)
+        # Bytes written by a request that died before its offset committed
+        with open(partial_path(session), 'ab') as partial:
+            partial.write(b'junk')
+        with self.assertRaises(UploadOffsetError) as raised:
+            write_chunk(session, 8, io.BytesIO(self.content[8:]), 2)
+        self.assertEqual(raised.exception.offset, 4)
+        self.assertEqual(write_chunk(session, 4, io.BytesIO(self.content[4:7]), 6), 7)
+        self.assertEqual(write_chunk(session, 7, io.BytesIO(self.content[7:]), 3), 10)
+        with self.assertRaises(UploadError):
+            write_chunk(session, 10, io.BytesIO(b'x'), 1)
+
+        session = finish_upload(session, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(session.status, 'complete')
+        self.assertFalse(os.path.exists(partial_path(session)))
+        pcb = PCB.objects.create(serial_number='S1', batch=Batch.objects.create(batch_number='B1'))
+        attachment = bind_upload(session, pcb.id).attachment
+        with attachment.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_a_wrong_digest_fails_the_session(self):
+        session = start_upload(self.user, 'run.bin', len(self.content), sha256='0' * 64)
+        with self.assertRaises(UploadOffsetError):
+            finish_upload(session)
+        write_chunk(session, 0, io.BytesIO(self.content), len(self.content))
+        self.assertEqual(finish_upload(session).status, 'failed')
+        with self.assertRaises(UploadError):
+            bind_upload(session, None)
+        with self.assertRaises(UploadError):
+            start_upload(self.user, 'run.bin', -1)
+
+    def test_resumable_protocol(self):
+        self.client.force_login(self.user)
+        response = self.client.post('/uploads/', {'file_name': 'run.bin', 'size': len(self.content)}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        url = response.json()['url']
+
+        def patch(offset, data):
+            return self.client.patch(url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+        self.assertEqual(patch(0, self.content[:6])['Upload-Offset'], '6')
+        response = patch(2, self.content[2:])
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '6'))
+        self.assertEqual(self.client.get(url)['Upload-Offset'], '6')
+        self.assertEqual(self.client.post(f'{url}complete/', content_type='application/json').status_code, 409)
+        patch(6, self.content[6:])
+        response = self.client.post(f'{url}complete/', {'sha256': hashlib.sha256(self.content).hexdigest()}, content_type='application/json')
+        self.assertEqual(response.json()['status'], 'complete')
+        other = User.objects.create_user('other')
+        other.groups.add(Group.objects.get(name='pcb_testing'))
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ExtractionTests(TestCase):
+    def setUp(self):
+        use_temporary_media(self)
+        spec_cache.clear()
+        pcb_type = PCBType.objects.create(name='T')
+        config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        self.voltage = TestParameter.objects.create(
+            test_config=config, parameter_type='voltage', name='Supply Voltage', unit='V', max_value=Decimal('3.6')
+        )
+        self.current = TestParameter.objects.create(
+            test_config=config, parameter_type='current', name='Icc', unit='A', max_value=Decimal('0.5'), required=False
+        )
+        self.tester = User.objects.create_user('tester')
+        batch = Batch.objects.create(batch_number='B1', pcb_type=pcb_type)
+        self.pcb = PCB.objects.create(serial_number='S1', batch=batch, test_config=config)
+        self.run = TestMeasurement.objects.create(pcb=self.pcb, test_config=config, tester=self.tester, verdict='pass')
+        ParameterMeasurement.objects.create(test_measurement=self.run, test_parameter=self.voltage, value=Decimal('3.3'), verdict='pass')
+
+    def workbook(self, *rows):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+        return content.getvalue()
+
+    def attach(self, name, content):
+        return FileAttachment.objects.create(
+            pcb=self.pcb, file_type='pcb_test', file=SimpleUploadedFile(name, content), uploaded_by=self.tester
+        )
+
+    def test_both_report_layouts_are_read(self):
+        path = os.path.join(tempfile.mkdtemp(), 'report.xlsx')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), True)
+        with open(path, 'wb') as target:
+            target.write(self.workbook(['Supply  Voltage (V):', None, '3.31', 'V'], ['Icc', 'Temp'], [0.2, 25], ['icc', 0.9]))
+        self.assertEqual(parse_report(path, ['supply voltage', 'icc', 'missing']), ({'supply voltage': '3.31', 'icc': 0.2}, None))
+        with open(path, 'wb') as target:
+            target.write(b'not a workbook')
+        found, error = parse_report(path, ['icc'])
+        self.assertEqual(found, {})
+        self.assertIn('Could not open workbook', error)
+
+    def test_values_are_added_to_the_run_without_overriding_the_tester(self):
+        report = self.attach('report.xlsx', self.workbook(['Supply Voltage', 9.9], ['Icc', 0.7]))
+        notes = self.attach('notes.txt', b'plain text')
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(extract_pending(executor), Counter({'parsed': 1, 'skipped': 1}))
+            self.assertEqual(extract_pending(executor), Counter())
+        self.assertEqual(
+            dict(self.run.parameter_measurements.values_list('test_parameter__name', 'value')),
+            {'Supply Voltage': Decimal('3.3'), 'Icc': Decimal('0.7')}
+        )
+        self.assertEqual(TestMeasurement.objects.get(id=self.run.id).verdict, 'fail')
+        report.refresh_from_db()
+        notes.refresh_from_db()
+        self.assertEqual((report.parse_status, report.parsed_values), ('parsed', 1))
+        self.assertEqual(report.parse_message, '1 value(s) added, 1 already recorded')
+        self.assertEqual(notes.parse_status, 'skipped')
+
+    def test_a_crashed_parser_fails_only_its_attachment(self):
+        report = self.attach('report.xlsx', self.workbook(['Icc', 0.2]))
+        executor = mock.Mock(submit=mock.Mock(side_effect=lambda *args: mock.Mock(result=mock.Mock(side_effect=MemoryError()))))
+        self.assertEqual(extract_pending(executor), Counter({'failed': 1}))
+        report.refresh_from_db()
+        self.assertTrue(report.parse_message.startswith('Parser crashed'))
+        self.assertEqual(self.run.parameter_measurements.count(), 1)
+
+
+class AsyncViewTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        pcb_type = PCBType.objects.create(name='T')
+        self.batch = Batch.objects.create(batch_number='LOT-9', pcb_type=pcb_type)
+        config = TestConfig.objects.create(name='C', pcb_type=pcb_type)
+        voltage = TestParameter.objects.create(test_config=config, parameter_type='voltage', name='Vcc', unit='V')
+        self.pcb = PCB.objects.create(serial_number='S1', batch=self.batch, test_config=config, status='tested')
+        PCB.objects.create(serial_number='S2', batch=self.batch)
+        self.user = User.objects.create_user('viewer')
+        run = TestMeasurement.objects.create(pcb=self.pcb, test_config=config, tester=self.user)
+        ParameterMeasurement.objects.create(test_measurement=run, test_parameter=voltage, value=Decimal('3.125'))
+        Module.objects.create(module_serial_number='M1', assembler=self.user, status='completed')
+
+    async def test_dashboard_reads_the_counters(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/')
+        self.assertEqual(response.context['pcb_count'], 0)
+        self.assertEqual(response.context['batches'], [])
+
+        await self.user.groups.aadd(await Group.objects.acreate(name='production_summary'))
+        await self.user.groups.aadd(await Group.objects.acreate(name='batch_manager'))
+        response = await self.async_client.get('/')
+        self.assertEqual((response.context['pcb_count'], response.context['pcb_pending'], response.context['pcb_tested']), (2, 1, 1))
+        self.assertEqual([batch.pcb_total for batch in response.context['batches']], [2])
+        self.assertContains(response, 'LOT-9')
+
+    async def test_pcb_detail(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(f'/pcb/{self.pcb.id}/')
+        self.assertContains(response, 'PCB Detail: S1')
+        self.assertContains(response, '<td>Vcc</td>')
+        self.assertEqual((await self.async_client.get('/pcb/999/')).status_code, 404)
+
+    async def test_restricted_views_check_the_groups(self):
+        await self.async_client.aforce_login(self.user)
+        self.assertEqual((await self.async_client.get('/production/summary/')).status_code, 302)
+        self.assertEqual((await self.async_client.get('/module/sign-off/')).status_code, 302)
+        await self.user.groups.aadd(await Group.objects.acreate(name='production_summary'))
+        await self.user.groups.aadd(await Group.objects.acreate(name='Manager_lvl1'))
+        self.assertEqual((await self.async_client.get('/production/summary/')).status_code, 200)
+        response = await self.async_client.get('/module/sign-off/')
+        self.assertEqual([module.module_serial_number for module in response.context['completed_modules']], ['M1'])
+
+
+class BenchmarkTests(ViewTestCase):
+    def report(self, **views):
+        return {'views': {name: dict({'queries': 5, 'median_ms': 20.0, 'status': 200}, **result) for name, result in views.items()}}
+
+    def test_regressions_are_reported(self):
+        baseline = self.report(a={}, b={}, c={}, d={}, e={'median_ms': 1.0}, f={})
+        current = self.report(a={'queries': 6}, b={'median_ms': 30.0}, c={'status': 500}, d={'median_ms': 23.0},
+                              e={'median_ms': 4.0}, g={})
+        current['views']['f'] = {'skipped': 'no sample'}
+        self.assertEqual(compare_reports(baseline, current), [
+            ('a', '5 -> 6 queries'), ('b', 'median 20.0 -> 30.0 ms'), ('c', 'status 200 -> 500'),
+        ])
+
+    def test_synthetic_history_is_consistent_and_every_view_renders(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        with override_settings(MEASUREMENT_SNAPSHOT_DIR=directory):
+            created, catalogue = generate('T', 40, pcb_types=2, batch_size=10, parameters=3, questions=1, runs=2, days=30, seed=1)
+            refresh_derived_data(catalogue)
+            self.assertEqual((created['PCB'], PCB.objects.count(), Batch.objects.count()), (40, 40, 4))
+            self.assertEqual(reconcile_counters(), [])
+            report = run_benchmark(benchmark_user(), repeat=1, warmup=0)
+        self.assertEqual(report['rows']['pcbs'], 40)
+        statuses = {name: result.get('status') for name, result in report['views'].items()}
+        self.assertEqual([name for name, status in statuses.items() if status and status >= 500], [])
+        for name in ('dashboard', 'pcb_detail', 'production_summary', 'traceability', 'pcb_manage'):
+            self.assertEqual(statuses[name], 200, name)
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import FileAttachment, UploadSession
+from .storage import BLOB_CHUNK_SIZE, blob_name
+
+
+# Largest attachment accepted through an upload session
+UPLOAD_MAX_SIZE = getattr(settings, 'UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+
+# Largest single chunk; a client on a poor link should send smaller ones
+UPLOAD_MAX_CHUNK_SIZE = getattr(settings, 'UPLOAD_MAX_CHUNK_SIZE', 16 * 1024 ** 2)
+
+# Sessions left untouched this long are discarded with their partial files
+UPLOAD_SESSION_TTL = timedelta(days=getattr(settings, 'UPLOAD_SESSION_TTL_DAYS', 7))
+
+# Directory (relative to the attachment storage root) of the partial files;
+# on the same file system as the blobs, so a finished upload is only renamed
+UPLOAD_PARTIAL_DIR = 'uploads'
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be applied to its session"""
+
+
+class UploadOffsetError(UploadError):
+    """Raised when a chunk does not start where the received bytes end"""
+    def __init__(self, offset):
+        super().__init__(f'Upload is at offset {offset}')
+        self.offset = offset
+
+
+def _storage():
+    return FileAttachment._meta.get_field('file').storage
+
+
+def partial_path(session):
+    return _storage().path(os.path.join(UPLOAD_PARTIAL_DIR, str(session.token)))
+
+
+def _clean_digest(digest):
+    digest = (digest or '').strip().lower()
+    if digest and not SHA256_RE.match(digest):
+        raise UploadError('sha256 must be 64 hexadecimal digits')
+    return digest
+
+
+def start_upload(user, file_name, size, sha256='', file_type='pcb_test', description=''):
+    """Open an upload session for a file of size bytes"""
+    # Browsers on Windows may send the full client path
+    file_name = os.path.basename((file_name or '').replace('\\', '/')).strip()
+    if not file_name:
+        raise UploadError('A file name is required')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be a number of bytes')
+    if size < 0 or size > UPLOAD_MAX_SIZE:
+        raise UploadError(f'size must be between 0 and {UPLOAD_MAX_SIZE} bytes')
+    if file_type not in dict(FileAttachment.FILE_TYPE_CHOICES):
+        raise UploadError(f'Unknown file type "{file_type}"')
+    session = UploadSession.objects.create(
+        created_by=user,
+        file_name=file_name[:255],
+        file_type=file_type,
+        description=description or '',
+        size=size,
+        sha256=_clean_digest(sha256),
+    )
+    os.makedirs(os.path.dirname(partial_path(session)), exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def _locked(session):
+    return UploadSession.objects.select_for_update().get(id=session.id)
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Append length bytes read from stream at offset and return the new
+    offset. The chunk goes straight to the partial file in BLOB_CHUNK_SIZE
+    pieces and is synced before the offset is committed, so after a crash
+    or a dropped connection the file is cut back to the committed offset
+    and the client resumes from there.
+    """
+    if length > UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(f'Chunks are limited to {UPLOAD_MAX_CHUNK_SIZE} bytes')
+    with transaction.atomic():
+        session = _locked(session)
+        if session.status != 'open':
+            raise UploadError(f'Upload is {session.get_status_display().lower()}')
+        path = partial_path(session)
+        received = os.path.getsize(path) if os.path.exists(path) else 0
+        if received != session.offset:
+            session.offset = min(received, session.offset)
+            with open(path, 'ab') as target:
+                target.truncate(session.offset)
+        if offset != session.offset:
+            raise UploadOffsetError(session.offset)
+        if offset + length > session.size:
+            raise UploadError('Chunk runs past the announced size')
+        remaining = length
+        with open(path, 'ab') as target:
+            while remaining:
+                data = stream.read(min(BLOB_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                target.write(data)
+                remaining -= len(data)
+            target.flush()
+            os.fsync(target.fileno())
+        session.offset += length - remaining
+        session.save(update_fields=['offset', 'updated_at'])
+    return session.offset
+
+
+def _attach(session):
+    """Create the attachment of a complete session bound to a PCB (row locked by the caller)"""
+    if session.status != 'complete' or session.pcb_id is None or session.attachment_id is not None:
+        return
+    attachment = FileAttachment(
+        pcb_id=session.pcb_id,
+        file_type=session.file_type,
+        file=blob_name(session.sha256),
+        original_name=session.file_name,
+        uploaded_by=session.created_by,
+        description=session.description,
+    )
+    attachment.save()
+    session.attachment = attachment
+    session.save(update_fields=['attachment', 'updated_at'])
+
+
+def finish_upload(session, sha256=''):
+    """
+    Check a fully received upload against its SHA-256 (announced at the
+    start or now) and move it into the blob store. A mismatch fails the
+    session and drops the partial file. If the test submission has bound
+    the session to a PCB already, the attachment is created here.
+    """
+    sha256 = _clean_digest(sha256)
+    with transaction.atomic():
+        session = _locked(session)
+        if session.status == 'complete':
+            return session
+        if session.status != 'open':
+            raise UploadError(f'Upload is {session.get_status_display().lower()}')
+        if session.offset != session.size:
+            raise UploadOffsetError(session.offset)
+        if sha256 and session.sha256 and sha256 != session.sha256:
+            raise UploadError('sha256 differs from the one announced at the start')
+        path = partial_path(session)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for data in iter(lambda: source.read(BLOB_CHUNK_SIZE), b''):
+                digest.update(data)
+        expected = sha256 or session.sha256
+        if expected and digest.hexdigest() != expected:
+            session.status = 'failed'
+            session.save(update_fields=['status', 'updated_at'])
+            os.unlink(path)
+            return session
+        _storage().place(path, digest.hexdigest())
+        session.sha256 = digest.hexdigest()
+        session.status = 'complete'
+        session.save(update_fields=['sha256', 'status', 'updated_at'])
+        _attach(session)
+    return session
+
+
+def bind_upload(session, pcb_id, description=None):
+    """
+    Tie an upload to the PCB whose test it belongs to. The attachment is
+    created now if the file has arrived, or as soon as it does, so a test
+    submission never waits for the transfer.
+    """
+    with transaction.atomic():
+        session = _locked(session)
+        if session.status == 'failed':
+            raise UploadError('Upload failed its checksum')
+        session.pcb_id = pcb_id
+        if description is not None:
+            session.description = description
+        session.save(update_fields=['pcb', 'description', 'updated_at'])
+        _attach(session)
+    return session
+
+
+def expire_upload_sessions(ttl=UPLOAD_SESSION_TTL, dry_run=False):
+    """Delete sessions idle for longer than ttl, with their partial files. Returns the number deleted."""
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - ttl)
+    expired = 0
+    for session in stale.iterator():
+        expired += 1
+        if dry_run:
+            continue
+        path = partial_path(session)
+        if os.path.exists(path):
+            os.unlink(path)
+        session.delete()
+    return expired
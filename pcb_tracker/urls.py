@@ -3,15 +3,31 @@ from . import views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('production/summary/', views.production_summary, name='production_summary'),
+    path('spc/', views.spc_overview, name='spc_overview'),
+    path('spc/parameter/<int:parameter_id>/', views.spc_chart, name='spc_chart'),
     path('pcb-type/manage/', views.pcb_type_manage, name='pcb_type_manage'),
     path('batch/manage/', views.batch_manage, name='batch_manage'),
     path('pcb/test/', views.pcb_test, name='pcb_test'),
+    path('pcb/test/form/', views.pcb_test_form, name='pcb_test_form'),
+    path('pcb/test/bulk/', views.pcb_test_bulk, name='pcb_test_bulk'),
+    path('pcb/test/import/', views.pcb_test_import, name='pcb_test_import'),
     path('pcb/manage/', views.pcb_manage, name='pcb_manage'),
     path('pcb/<int:pcb_id>/verify/', views.pcb_qa_verify, name='pcb_qa_verify'),
     path('module/assemble/', views.module_assemble, name='module_assemble'),
     path('module/functional-test/', views.module_functional_test, name='module_functional_test'),
     path('module/sign-off/', views.module_sign_off, name='module_sign_off'),
     path('pcb/<int:pcb_id>/', views.pcb_detail, name='pcb_detail'),
+    path('pcb/<int:pcb_id>/edit-form/', views.pcb_edit_form, name='pcb_edit_form'),
+    path('reference-data/', views.reference_data_json, name='reference_data'),
+    path('trace/<str:kind>/<int:object_id>/', views.traceability, name='traceability'),
+    path('trace/<str:kind>/<int:object_id>/json/', views.traceability_json, name='traceability_json'),
+    path('trace/<str:kind>/<int:object_id>/dossier.zip', views.traceability_dossier, name='traceability_dossier'),
+    path('attachments/<int:attachment_id>/download/', views.attachment_download, name='attachment_download'),
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:token>/', views.upload_session, name='upload_session'),
+    path('uploads/<uuid:token>/complete/', views.upload_complete, name='upload_complete'),
+    path('metrics', views.metrics, name='metrics'),
     
     # Test configuration management URLs
     path('test-config/manage/', views.test_config_manage, name='test_config_manage'),
@@ -1,19 +1,58 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import Group, User
 from django.contrib.auth import login
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.http import HttpResponseForbidden
-from django.core.exceptions import PermissionDenied
-from django.db import models
-from .models import PCB, Batch, TestMeasurement, FileAttachment, Module, ModuleTestRecord, PCBType, TestConfig, TestParameter, TestQuestion, ParameterMeasurement, QuestionResponse
-from .forms import PCBTestForm, FileAttachmentForm, ModuleAssemblyForm, ModuleTestForm, PCBCreateForm, BatchCreateForm, PCBTypeForm, TestConfigForm, TestParameterForm, TestQuestionForm
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, ValidationError
+from django.db import models, transaction
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils import timezone
+from datetime import timedelta
+from django.views.decorators.http import require_http_methods, require_POST
+import json
+from .models import PCB, Batch, TestMeasurement, FileAttachment, UploadSession, Module, ModuleTestRecord, PCBType, TestConfig, TestParameter, TestQuestion, ParameterMeasurement, QuestionResponse, DailyProductionRollup, DailyModuleRollup, RollupState
+from .forms import PCBTestForm, FileAttachmentForm, ModuleAssemblyForm, ModuleTestForm, PCBCreateForm, BatchCreateForm, PCBTypeForm, TestConfigForm, TestParameterForm, TestQuestionForm, TestResultImportForm, PCBTestWithConfigForm, PCBBulkCreateForm, ModuleAssemblyImportForm
+from .results import record_results
+from .importers import ImportFormatError, import_results, iter_rows
+from .assembly import assemble_modules
+from .counters import astatus_totals
+from .analytics import batch_yields
+from .spc import batch_capabilities, capabilities_by_parameter, control_chart, parameter_capability
+from .workflow import TransitionError, pcb_workflow, module_workflow
+from .search import search_pcbs
+from .pagination import paginate
+from .reference import reference_data, reference_version
+from .genealogy import genealogy
+from .dossier import dossier_filename, dossier_pcbs, stream_dossier
+from .downloads import serve_attachment, stream_response
+from .metrics import can_read_metrics, render_metrics
+from .roles import auser_groups, user_groups
+from .uploads import UploadError, UploadOffsetError, bind_upload, finish_upload, start_upload, write_chunk
+
+# Upper bound on the number of PCBs accepted by one bulk test submission
+MAX_BULK_TEST_RESULTS = 1000
+
+# Number of rejected rows listed on the import page; the rest are only counted
+MAX_IMPORT_REJECTS_SHOWN = 200
+
+# Days of history shown on the production summary page
+PRODUCTION_SUMMARY_DAYS = 365
+
+# Size of the SVG control charts, in pixels
+SPC_CHART_WIDTH = 800
+SPC_CHART_HEIGHT = 200
+
+# Browser cache lifetime of a versioned reference data response (a new version gets a new URL)
+REFERENCE_BROWSER_MAX_AGE = 365 * 24 * 60 * 60
 
 
 def user_in_group(user, group_names):
     """Check if user belongs to any of the specified groups"""
-    return user.groups.filter(name__in=group_names).exists()
+    return not user_groups(user).isdisjoint(group_names)
 
 
 def can_test_pcb(user):
@@ -54,29 +93,51 @@ def can_view_production_summary(user):
     return user_in_group(user, ['production_summary'])
 
 
+def can_download_attachment(user):
+    """Check if user can download PCB attachments (anyone who tests, verifies, assembles or manages)"""
+    return (is_manager(user) or can_test_pcb(user) or can_verify_pcb(user) or
+            can_assemble_module(user) or can_test_module(user) or can_verify_module(user))
+
+
+async def _async_user(request):
+    """
+    Resolve the user and their group names without blocking, and pin them on
+    the request so that permission checks, context processors and templates
+    of an async view never reach for the database from the event loop
+    """
+    user = await request.auser()
+    await auser_groups(user)
+    request.user = user
+    return user
+
+
 @login_required
-def dashboard(request):
+async def dashboard(request):
     """Main dashboard showing the status of PCBs and modules"""
+    user = await _async_user(request)
     # Check if user can view production summary
-    can_view_summary = can_view_production_summary(request.user)
+    can_view_summary = can_view_production_summary(user)
     
-    # Only fetch counts if user can view summary
+    # Only fetch counts if user can view summary; they all come from the counters table in one query
     if can_view_summary:
-        pcb_count = PCB.objects.count()
-        pcb_pending = PCB.objects.filter(status='pending').count()
-        pcb_tested = PCB.objects.filter(status='tested').count()
-        pcb_qa_verified = PCB.objects.filter(status='qa_verified').count()
+        totals = await astatus_totals()
+        pcb_count = sum(totals['pcb'].values())
+        pcb_pending = totals['pcb'].get('pending', 0)
+        pcb_tested = totals['pcb'].get('tested', 0)
+        pcb_qa_verified = totals['pcb'].get('qa_verified', 0)
         
-        module_count = Module.objects.count()
-        modules_assembled = Module.objects.filter(status='assembled').count()
-        modules_functional_tested = Module.objects.filter(status='functional_tested').count()
+        module_count = sum(totals['module'].values())
+        modules_assembled = totals['module'].get('assembled', 0)
+        modules_functional_tested = totals['module'].get('functional_tested', 0)
     else:
         # Set default values if user can't view summary
         pcb_count = pcb_pending = pcb_tested = pcb_qa_verified = 0
         module_count = modules_assembled = modules_functional_tested = 0
     
     # Get batches for managers or users with batch management permissions
-    batches = Batch.objects.all() if user_in_group(request.user, ['batch_manager', 'pcb_manager']) or request.user.is_staff else Batch.objects.none()
+    batches = []
+    if user_in_group(user, ['batch_manager', 'pcb_manager']) or user.is_staff:
+        batches = [batch async for batch in Batch.objects.select_related('pcb_type').annotate(pcb_total=models.Count('pcbs'))]
     
     context = {
         'pcb_count': pcb_count,
@@ -92,6 +153,128 @@ def dashboard(request):
     return render(request, 'pcb_tracker/dashboard.html', context)
 
 
+@login_required
+@user_passes_test(can_view_production_summary)
+async def production_summary(request):
+    """Daily production history for the last year, read from the rollup tables"""
+    await _async_user(request)
+    since = timezone.localdate() - timedelta(days=PRODUCTION_SUMMARY_DAYS)
+    totals = {
+        'created': Sum('created'),
+        'tested': Sum('tested'),
+        'verified': Sum('verified'),
+        'assembled': Sum('assembled'),
+        'tests': Sum('tests'),
+        'tests_failed': Sum('tests_failed'),
+    }
+    
+    rollups = DailyProductionRollup.objects.filter(day__gte=since)
+    pcb_type_id = request.GET.get('pcb_type', '')
+    if pcb_type_id.isdigit():
+        rollups = rollups.filter(pcb_type_id=pcb_type_id)
+    daily = {row['day']: row async for row in rollups.values('day').annotate(**totals).order_by()}
+    
+    # Module figures are not split by PCB type, so they are only shown unfiltered
+    if not pcb_type_id:
+        async for module_row in DailyModuleRollup.objects.filter(day__gte=since).values('day', 'assembled', 'tests_passed', 'tests_failed'):
+            row = daily.setdefault(module_row['day'], {'day': module_row['day']})
+            row['modules_assembled'] = module_row['assembled']
+            row['module_tests_passed'] = module_row['tests_passed']
+            row['module_tests_failed'] = module_row['tests_failed']
+    
+    by_type = [
+        row async for row in DailyProductionRollup.objects.filter(day__gte=since)
+        .values('pcb_type_id', 'pcb_type__name')
+        .annotate(**totals)
+        .order_by('pcb_type__name')
+    ]
+    state = await RollupState.objects.filter(name='production').afirst()
+    
+    context = {
+        'daily': [daily[day] for day in sorted(daily, reverse=True)],
+        'by_type': by_type,
+        'pcb_types': [pcb_type async for pcb_type in PCBType.objects.all()],
+        'selected_pcb_type': pcb_type_id,
+        'since': since,
+        'updated_until': state.high_water if state else None,
+    }
+    return render(request, 'pcb_tracker/production_summary.html', context)
+
+
+def can_view_spc(user):
+    """Check if user can view process capability figures and control charts"""
+    return can_view_production_summary(user) or is_manager(user) or user_in_test_config_group(user)
+
+
+def _chart_points(values, low, high, width=SPC_CHART_WIDTH, height=SPC_CHART_HEIGHT):
+    """Scale values into SVG polyline coordinates between low (bottom) and high (top)"""
+    span = (high - low) or 1.0
+    step = width / max(len(values) - 1, 1)
+    return ' '.join(f'{i * step:.1f},{height - (value - low) / span * height:.1f}' for i, value in enumerate(values))
+
+
+def _chart_y(value, low, high, height=SPC_CHART_HEIGHT):
+    return f'{height - (value - low) / ((high - low) or 1.0) * height:.1f}'
+
+
+@login_required
+@user_passes_test(can_view_spc)
+def spc_overview(request):
+    """Process capability of every test parameter, from the running aggregates"""
+    parameters = list(TestParameter.objects.select_related('test_config').order_by('test_config__name', 'order', 'name'))
+    capabilities = capabilities_by_parameter(parameters)
+    for parameter in parameters:
+        parameter.capability = capabilities[parameter.id]
+    return render(request, 'pcb_tracker/spc_overview.html', {'parameters': parameters})
+
+
+@login_required
+@user_passes_test(can_view_spc)
+def spc_chart(request, parameter_id):
+    """X-bar/R control chart and capability of one test parameter"""
+    parameter = get_object_or_404(TestParameter.objects.select_related('test_config'), id=parameter_id)
+    batch_id = request.GET.get('batch', '')
+    batch_id = int(batch_id) if batch_id.isdigit() else None
+    
+    chart = control_chart(parameter, batch_id)
+    charts = []
+    if chart['limits']:
+        limits = chart['limits']
+        means = [subgroup['mean'] for subgroup in chart['subgroups']]
+        ranges = [subgroup['range'] for subgroup in chart['subgroups']]
+        for title, values, centre, upper, lower in [
+            ('X-bar', means, limits['x_bar'], limits['x_ucl'], limits['x_lcl']),
+            ('Range', ranges, limits['r_bar'], limits['r_ucl'], limits['r_lcl']),
+        ]:
+            low = min(values + [lower])
+            high = max(values + [upper])
+            margin = (high - low) * 0.05 or 1.0
+            low, high = low - margin, high + margin
+            charts.append({
+                'title': title,
+                'points': _chart_points(values, low, high),
+                'centre': centre, 'upper': upper, 'lower': lower,
+                'centre_y': _chart_y(centre, low, high),
+                'upper_y': _chart_y(upper, low, high),
+                'lower_y': _chart_y(lower, low, high),
+            })
+    
+    batch_rows = batch_capabilities(parameter)
+    batch_numbers = dict(Batch.objects.filter(id__in=[batch for batch, stats in batch_rows]).values_list('id', 'batch_number'))
+    
+    context = {
+        'parameter': parameter,
+        'chart': chart,
+        'charts': charts,
+        'chart_width': SPC_CHART_WIDTH,
+        'chart_height': SPC_CHART_HEIGHT,
+        'overall': parameter_capability(parameter),
+        'batches': [(batch, batch_numbers.get(batch, batch), stats) for batch, stats in batch_rows],
+        'selected_batch': batch_id,
+    }
+    return render(request, 'pcb_tracker/spc_chart.html', context)
+
+
 @login_required
 @user_passes_test(is_manager)  # Only managers can create PCB types
 def pcb_type_manage(request):
@@ -150,7 +333,9 @@ def batch_manage(request):
             batch = get_object_or_404(Batch, id=batch_id)
             form = BatchCreateForm(request.POST, instance=batch)
             if form.is_valid():
-                form.save()
+                # Changing the PCB type moves the batch's status counters in the same transaction
+                with transaction.atomic():
+                    form.save()
                 messages.success(request, f'Batch {batch.batch_number} updated successfully!')
                 return redirect('batch_manage')
         elif 'delete' in request.POST:
@@ -173,10 +358,13 @@ def batch_manage(request):
     form.fields['pcb_type'].queryset = PCBType.objects.all()
     
     # Get all existing batches and paginate them
-    batches = Batch.objects.all().order_by('-production_date')
-    paginator = Paginator(batches, 10)  # Show 10 batches per page
-    page_number = request.GET.get('page')
-    batches_page = paginator.get_page(page_number)
+    batches = Batch.objects.all().order_by('-production_date', '-id')
+    batches_page = paginate(request, batches, 10)  # Show 10 batches per page
+    
+    # Yield figures come from the per-batch cache; misses are computed in one pass
+    yields = batch_yields(batches_page)
+    for batch in batches_page:
+        batch.yields = yields[batch.id]
     
     context = {
         'form': form,
@@ -201,7 +389,9 @@ def batch_manage(request):
             batch = get_object_or_404(Batch, id=batch_id)
             form = BatchCreateForm(request.POST, instance=batch)
             if form.is_valid():
-                form.save()
+                # Changing the PCB type moves the batch's status counters in the same transaction
+                with transaction.atomic():
+                    form.save()
                 messages.success(request, f'Batch {batch.batch_number} updated successfully!')
                 return redirect('batch_manage')
         elif 'delete' in request.POST:
@@ -224,10 +414,13 @@ def batch_manage(request):
     form.fields['pcb_type'].queryset = PCBType.objects.all()
     
     # Get all existing batches and paginate them
-    batches = Batch.objects.all().order_by('-production_date')
-    paginator = Paginator(batches, 10)  # Show 10 batches per page
-    page_number = request.GET.get('page')
-    batches_page = paginator.get_page(page_number)
+    batches = Batch.objects.all().order_by('-production_date', '-id')
+    batches_page = paginate(request, batches, 10)  # Show 10 batches per page
+    
+    # Yield figures come from the per-batch cache; misses are computed in one pass
+    yields = batch_yields(batches_page)
+    for batch in batches_page:
+        batch.yields = yields[batch.id]
     
     context = {
         'form': form,
@@ -245,89 +438,58 @@ def pcb_test(request):
         pcb_serial = request.POST.get('pcb_serial')
         
         if pcb_serial:
-            try:
-                pcb = PCB.objects.get(serial_number=pcb_serial, status='pending')
-                
-                # Create the main test measurement record
-                test_measurement = TestMeasurement.objects.create(
-                    pcb=pcb,
-                    test_config=pcb.test_config,
-                    tester=request.user,
-                    notes=request.POST.get('notes', '')
-                )
-                
-                # Process parameter measurements if PCB has a test config
-                if pcb.test_config:
-                    for parameter in pcb.test_config.parameters.all():
-                        param_value = request.POST.get(f'param_{parameter.id}')
-                        if param_value:
-                            try:
-                                value = float(param_value)
-                                ParameterMeasurement.objects.create(
-                                    test_measurement=test_measurement,
-                                    test_parameter=parameter,
-                                    value=value,
-                                    unit=parameter.unit
-                                )
-                            except ValueError:
-                                # Handle invalid numeric input
-                                messages.error(request, f'Invalid value for {parameter.name}')
-                                # Clean up partial data and continue
-                                test_measurement.delete()
-                                break
-                
-                # Process question responses if PCB has a test config
-                if pcb.test_config:
-                    for question in pcb.test_config.questions.all():
-                        response_value = request.POST.get(f'question_{question.id}')
-                        if response_value:
-                            try:
-                                response_bool = response_value.lower() == 'true'
-                                QuestionResponse.objects.create(
-                                    test_measurement=test_measurement,
-                                    test_question=question,
-                                    response=response_bool
-                                )
-                            except:
-                                # Handle invalid boolean input
-                                messages.error(request, f'Invalid response for question: {question.question_text}')
-                                # Clean up partial data and continue
-                                test_measurement.delete()
-                                break
-                
+            # Submit through the shared results path so the PCB's compiled test
+            # config spec is reused and rows are written with bulk inserts
+            entry = {
+                'serial_number': pcb_serial,
+                'parameters': {int(key[len('param_'):]): value for key, value in request.POST.items()
+                               if key.startswith('param_') and key[len('param_'):].isdigit()},
+                'questions': {int(key[len('question_'):]): value for key, value in request.POST.items()
+                              if key.startswith('question_') and key[len('question_'):].isdigit()},
+                'notes': request.POST.get('notes', ''),
+            }
+            result = record_results([entry], request.user)[0]
+            
+            if result['status'] == 'ok':
+                # A file sent through an upload session is attached whenever its last chunk arrives
+                upload_token = request.POST.get('upload_token')
+                if upload_token:
+                    try:
+                        session = UploadSession.objects.get(token=upload_token, created_by=request.user)
+                        bind_upload(session, result['pcb_id'], request.POST.get('file_description', ''))
+                    except (UploadSession.DoesNotExist, ValidationError):
+                        messages.error(request, f'PCB {pcb_serial}: test recorded but the uploaded file was not found.')
+                    except UploadError as error:
+                        messages.error(request, f'PCB {pcb_serial}: test recorded but the file was not attached ({error}).')
                 # Handle file attachment if provided
-                if request.FILES.get('file'):
+                elif request.FILES.get('file'):
                     attachment = FileAttachment(
-                        pcb=pcb,
+                        pcb_id=result['pcb_id'],
                         file_type='pcb_test',
                         file=request.FILES['file'],
                         uploaded_by=request.user,
                         description=request.POST.get('file_description', '')
                     )
-                    attachment.save()
+                    # The blob reference count is taken in the same transaction
+                    with transaction.atomic():
+                        attachment.save()
                 
-                # Update PCB status
-                pcb.status = 'tested'
-                pcb.save()
-                
-                messages.success(request, f'PCB {pcb.serial_number} tested successfully!')
+                messages.success(request, f'PCB {pcb_serial} tested successfully!')
                 return redirect('pcb_test')
-                
-            except PCB.DoesNotExist:
-                messages.error(request, 'PCB with this serial number does not exist or is not available for testing.')
+            
+            for error in result['errors']:
+                messages.error(request, f'PCB {pcb_serial}: {error}')
     
     # Get PCBs that are pending testing with search and pagination
     search_query = request.GET.get('search', '')
     
-    pending_pcbs = PCB.objects.filter(status='pending')
+    pending_pcbs = PCB.objects.filter(status='pending').order_by('-created_at', '-id')
     
     if search_query:
-        pending_pcbs = pending_pcbs.filter(serial_number__icontains=search_query)
+        pending_pcbs = search_pcbs(search_query, pending_pcbs)
     
     # Add pagination
-    paginator = Paginator(pending_pcbs, 10)  # 10 PCBs per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, pending_pcbs, 10)  # 10 PCBs per page
     
     context = {
         'pending_pcbs': page_obj,  # Paginated and filtered results
@@ -336,6 +498,96 @@ def pcb_test(request):
     return render(request, 'pcb_tracker/pcb_test.html', context)
 
 
+@login_required
+@user_passes_test(can_test_pcb)
+def pcb_test_form(request):
+    """Render the test config fields of a pending PCB for the test form"""
+    pcb = get_object_or_404(
+        PCB.objects.select_related('test_config'),
+        serial_number=request.GET.get('serial', ''),
+        status='pending'
+    )
+    form = PCBTestWithConfigForm(pcb=pcb)
+    config_fields = [form[name] for name in form.fields if name.startswith(('param_', 'question_'))]
+    
+    context = {
+        'pcb': pcb,
+        'config_fields': config_fields,
+    }
+    return render(request, 'pcb_tracker/pcb_test_form_fields.html', context)
+
+
+@login_required
+@user_passes_test(can_test_pcb)
+@require_POST
+def pcb_test_bulk(request):
+    """
+    JSON endpoint for automated test stations to submit results for many PCBs at once.
+
+    Expects {"results": [{"serial_number": ..., "parameters": {name: value},
+    "questions": {question_text: true/false}, "notes": ...}, ...]} and reports
+    success or failure for every serial number. Keys may also be ids, as
+    strings of digits. Like every POST view it needs a logged-in session
+    and the CSRF token (X-CSRFToken header).
+    """
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
+    
+    results = payload.get('results') if isinstance(payload, dict) else None
+    if not isinstance(results, list) or not results:
+        return JsonResponse({'error': 'Expected a non-empty "results" list.'}, status=400)
+    if len(results) > MAX_BULK_TEST_RESULTS:
+        return JsonResponse({'error': f'At most {MAX_BULK_TEST_RESULTS} results can be submitted at once.'}, status=400)
+    
+    report = record_results(results, request.user)
+    recorded = sum(1 for result in report if result['status'] == 'ok')
+    
+    return JsonResponse({
+        'recorded': recorded,
+        'failed': len(report) - recorded,
+        'results': report,
+    })
+
+
+@login_required
+@user_passes_test(can_test_pcb)
+def pcb_test_import(request):
+    """View for importing test results from a CSV/XLSX tester export"""
+    summary = None
+    rejects = []
+    
+    if request.method == 'POST':
+        form = TestResultImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            
+            def on_reject(row_number, serial, errors):
+                if len(rejects) < MAX_IMPORT_REJECTS_SHOWN:
+                    rejects.append({'row': row_number, 'serial_number': serial, 'errors': errors})
+            
+            try:
+                summary = import_results(iter_rows(upload.file, upload.name), request.user, on_reject=on_reject)
+            except ImportFormatError as e:
+                messages.error(request, str(e))
+            else:
+                if summary['rejected']:
+                    messages.warning(request, f'Imported {summary["recorded"]} of {summary["rows"]} rows; {summary["rejected"]} rows were rejected.')
+                else:
+                    messages.success(request, f'Imported {summary["recorded"]} rows successfully!')
+    else:
+        form = TestResultImportForm()
+    
+    context = {
+        'form': form,
+        'summary': summary,
+        'rejects': rejects,
+        'rejects_truncated': summary is not None and summary['rejected'] > len(rejects),
+    }
+    return render(request, 'pcb_tracker/pcb_test_import.html', context)
+
+
 @login_required
 @user_passes_test(can_verify_pcb)
 def pcb_qa_verify(request, pcb_id):
@@ -348,20 +600,23 @@ def pcb_qa_verify(request, pcb_id):
         return redirect('dashboard')
     
     if request.method == 'POST':
-        # QA approves the PCB
-        pcb.status = 'qa_verified'
-        pcb.save()
-        
-        messages.success(request, f'PCB {pcb.serial_number} verified and approved by QA!')
+        # QA approves the PCB; the conditional update fails if someone else got there first
+        if pcb_workflow.transition(pcb, 'qa_verified'):
+            messages.success(request, f'PCB {pcb.serial_number} verified and approved by QA!')
+        else:
+            messages.error(request, f'PCB {pcb.serial_number} was changed by another user and was not verified.')
         return redirect('dashboard')
     
-    measurements = pcb.measurements.all()
+    measurements = pcb.measurements.select_related('tester').prefetch_related('parameter_measurements__test_parameter')
     attachments = pcb.attachments.filter(file_type='pcb_test')
+    # Verdicts are stored at submission time, so this is an indexed lookup
+    failed_values = ParameterMeasurement.objects.filter(test_measurement__pcb=pcb, verdict='fail').count()
     
     context = {
         'pcb': pcb,
         'measurements': measurements,
         'attachments': attachments,
+        'failed_values': failed_values,
     }
     return render(request, 'pcb_tracker/pcb_qa_verify.html', context)
 
@@ -370,33 +625,43 @@ def pcb_qa_verify(request, pcb_id):
 @user_passes_test(can_assemble_module)
 def module_assemble(request):
     """View for assemblers to create modules from approved PCBs"""
-    if request.method == 'POST':
+    import_results_report = None
+    
+    if request.method == 'POST' and 'import' in request.POST:
+        # Assemble every module listed in an uploaded CSV file at once
+        form = ModuleAssemblyForm()
+        import_form = ModuleAssemblyImportForm(request.POST, request.FILES)
+        if import_form.is_valid():
+            import_results_report = assemble_modules(import_form.requests, request.user)
+            assembled = sum(1 for result in import_results_report if result['status'] == 'ok')
+            failed = len(import_results_report) - assembled
+            if failed:
+                messages.warning(request, f'{assembled} modules assembled; {failed} could not be assembled.')
+            else:
+                messages.success(request, f'{assembled} modules assembled successfully!')
+    elif request.method == 'POST':
         form = ModuleAssemblyForm(request.POST)
+        import_form = ModuleAssemblyImportForm()
         
         if form.is_valid():
-            module = form.save(commit=False)
-            module.assembler = request.user
-            module.save()
-            
-            # Add PCBs to module and update their status
-            pcbs = form.cleaned_data['pcbs']
-            for pcb in pcbs:
-                module.pcbs.add(pcb)
-                
-                # Update PCB status to assembled
-                pcb.status = 'assembled'
-                pcb.save()
-            
-            messages.success(request, f'Module {module.module_serial_number} assembled successfully!')
-            return redirect('module_assemble')
+            try:
+                module = form.save(request.user)
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(request, f'Module {module.module_serial_number} assembled successfully!')
+                return redirect('module_assemble')
     else:
         form = ModuleAssemblyForm()
+        import_form = ModuleAssemblyImportForm()
     
     # Get PCBs that have been QA verified and not yet assembled
     available_pcbs = PCB.objects.filter(status='qa_verified')
     
     context = {
         'form': form,
+        'import_form': import_form,
+        'import_results': import_results_report,
         'available_pcbs': available_pcbs,
     }
     return render(request, 'pcb_tracker/module_assemble.html', context)
@@ -413,14 +678,15 @@ def module_functional_test(request):
             module_test = form.save(commit=False)
             module_test.tester = request.user
             module_test.test_type = 'functional'
-            module_test.save()
-            
-            # Update module status
             module = module_test.module
-            module.status = 'functional_tested'
-            module.save()
             
-            messages.success(request, f'Module {module.module_serial_number} functional test recorded!')
+            # Only record the test if the module is still waiting for it
+            with transaction.atomic():
+                if module_workflow.transition(module, 'functional_tested'):
+                    module_test.save()
+                    messages.success(request, f'Module {module.module_serial_number} functional test recorded!')
+                else:
+                    messages.error(request, f'Module {module.module_serial_number} was changed by another user and was not tested.')
             return redirect('module_functional_test')
     else:
         form = ModuleTestForm()
@@ -437,10 +703,14 @@ def module_functional_test(request):
 
 @login_required
 @user_passes_test(is_manager)
-def module_sign_off(request):
+async def module_sign_off(request):
     """View for managers to sign off completed modules"""
+    await _async_user(request)
     # Get modules that have completed all required steps
-    completed_modules = Module.objects.filter(status='completed')
+    completed_modules = [
+        module async for module in Module.objects.filter(status='completed')
+        .select_related('assembler').annotate(pcb_total=models.Count('pcbs'))
+    ]
     
     context = {
         'completed_modules': completed_modules,
@@ -448,12 +718,16 @@ def module_sign_off(request):
     return render(request, 'pcb_tracker/module_sign_off.html', context)
 
 
-def pcb_detail(request, pcb_id):
+async def pcb_detail(request, pcb_id):
     """View to show detailed information about a specific PCB"""
-    pcb = get_object_or_404(PCB, id=pcb_id)
-    measurements = pcb.measurements.all()
-    attachments = pcb.attachments.all()
-    modules = pcb.modules.all()
+    await _async_user(request)
+    pcb = await aget_object_or_404(PCB.objects.select_related('batch'), id=pcb_id)
+    measurements = [
+        measurement async for measurement in pcb.measurements.select_related('tester')
+        .prefetch_related('parameter_measurements__test_parameter')
+    ]
+    attachments = [attachment async for attachment in pcb.attachments.select_related('uploaded_by')]
+    modules = [module async for module in pcb.modules.all()]
     
     context = {
         'pcb': pcb,
@@ -464,9 +738,163 @@ def pcb_detail(request, pcb_id):
     return render(request, 'pcb_tracker/pcb_detail.html', context)
 
 
+def _genealogy_or_404(kind, object_id):
+    try:
+        return genealogy(kind, object_id)
+    except (ValueError, ObjectDoesNotExist):
+        raise Http404('No such module, PCB or batch')
+
+
+@login_required
+@user_passes_test(can_download_attachment)
+def traceability(request, kind, object_id):
+    """Traceability tree of a module, PCB or batch: boards, test runs, testers and files"""
+    context = {
+        'graph': _genealogy_or_404(kind, object_id),
+    }
+    return render(request, 'pcb_tracker/traceability.html', context)
+
+
+@login_required
+@user_passes_test(can_download_attachment)
+def traceability_json(request, kind, object_id):
+    """Same traceability tree as JSON"""
+    return JsonResponse(_genealogy_or_404(kind, object_id))
+
+
+@login_required
+@user_passes_test(can_download_attachment)
+def traceability_dossier(request, kind, object_id):
+    """Stream the audit dossier (CSV tables and attached reports) of a module or batch as a ZIP"""
+    try:
+        label, pcbs, modules = dossier_pcbs(kind, object_id)
+    except (ValueError, ObjectDoesNotExist):
+        raise Http404('No such module or batch')
+    response = StreamingHttpResponse(stream_dossier(kind, object_id), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{dossier_filename(kind, label)}"'
+    return stream_response(request, response)
+
+
+@login_required
+def attachment_download(request, attachment_id):
+    """Download a PCB attachment after checking the user's permissions"""
+    if not can_download_attachment(request.user):
+        return HttpResponseForbidden("You don't have permission to download attachments.")
+    attachment = get_object_or_404(FileAttachment, id=attachment_id)
+    try:
+        return serve_attachment(request, attachment)
+    except FileNotFoundError:
+        raise Http404('Attachment file is missing')
+
+
+def metrics(request):
+    """Request metrics of all worker processes in the Prometheus text format"""
+    if not can_read_metrics(request):
+        return HttpResponseForbidden("You don't have permission to read metrics.")
+    response = HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+def _upload_json(session):
+    return {
+        'token': str(session.token),
+        'file_name': session.file_name,
+        'size': session.size,
+        'offset': session.offset,
+        'status': session.status,
+        'sha256': session.sha256,
+        'attachment_id': session.attachment_id,
+    }
+
+
+@login_required
+@user_passes_test(can_test_pcb)
+@require_POST
+def upload_start(request):
+    """
+    JSON endpoint opening a resumable upload.
+
+    Expects {"file_name": ..., "size": bytes, "sha256": optional hex digest,
+    "file_type": ..., "description": ...}; chunks are then PATCHed to the
+    returned URL with an Upload-Offset header.
+    """
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Expected a JSON object.'}, status=400)
+    try:
+        session = start_upload(request.user, payload.get('file_name'), payload.get('size'), payload.get('sha256'),
+                               payload.get('file_type') or 'pcb_test', payload.get('description'))
+    except UploadError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    data = _upload_json(session)
+    data['url'] = request.build_absolute_uri(reverse('upload_session', args=[session.token]))
+    return JsonResponse(data, status=201)
+
+
+@login_required
+@user_passes_test(can_test_pcb)
+@require_http_methods(['GET', 'HEAD', 'PATCH'])
+def upload_session(request, token):
+    """
+    GET reports how many bytes of an upload have arrived (also as an
+    Upload-Offset header); PATCH appends the raw request body at the offset
+    given in Upload-Offset. A chunk sent at the wrong offset gets 409 with
+    the offset to resume from.
+    """
+    session = get_object_or_404(UploadSession, token=token, created_by=request.user)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required.'}, status=400)
+        try:
+            session.offset = write_chunk(session, offset, request, length)
+        except UploadOffsetError as error:
+            session.offset = error.offset
+            response = JsonResponse(dict(_upload_json(session), error=str(error)), status=409)
+            response['Upload-Offset'] = str(error.offset)
+            return response
+        except UploadError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+    response = JsonResponse(_upload_json(session))
+    response['Upload-Offset'] = str(session.offset)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@login_required
+@user_passes_test(can_test_pcb)
+@require_POST
+def upload_complete(request, token):
+    """
+    Finish an upload once every byte has arrived. The body may carry
+    {"sha256": ...} when the digest was not known at the start; the file is
+    accepted only if it matches.
+    """
+    session = get_object_or_404(UploadSession, token=token, created_by=request.user)
+    try:
+        payload = json.loads(request.body or '{}')
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
+    try:
+        session = finish_upload(session, payload.get('sha256') if isinstance(payload, dict) else '')
+    except UploadOffsetError as error:
+        return JsonResponse(dict(_upload_json(session), offset=error.offset, error='Upload is not complete yet.'), status=409)
+    except UploadError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    if session.status == 'failed':
+        return JsonResponse(dict(_upload_json(session), error='The received file does not match its sha256.'), status=422)
+    return JsonResponse(_upload_json(session))
+
+
 def user_can_manage_pcb(user):
     """Check if user can manage PCBs"""
-    return user.groups.filter(name='pcb_manager').exists() or user.is_staff or is_manager(user)
+    return user_in_group(user, ['pcb_manager']) or user.is_staff or is_manager(user)
 
 
 @login_required
@@ -492,9 +920,20 @@ def pcb_manage(request):
                 pcb.test_config = None
             
             pcb.notes = request.POST.get('notes', pcb.notes)
-            pcb.status = request.POST.get('status', pcb.status)
+            new_status = request.POST.get('status', pcb.status)
             
-            pcb.save()
+            # Status is never written by save(); it only moves through the workflow
+            with transaction.atomic():
+                pcb.save(update_fields=['serial_number', 'batch', 'test_config', 'notes', 'updated_at'])
+                if new_status != pcb.status:
+                    try:
+                        changed = pcb_workflow.transition(pcb, new_status, correction=True)
+                    except TransitionError as e:
+                        messages.error(request, f'PCB {pcb.serial_number} updated, but its status was not changed: {e}')
+                        return redirect('pcb_manage')
+                    if not changed:
+                        messages.error(request, f'PCB {pcb.serial_number} updated, but its status was changed by another user first.')
+                        return redirect('pcb_manage')
             messages.success(request, f'PCB {pcb.serial_number} updated successfully!')
             return redirect('pcb_manage')
             
@@ -503,15 +942,32 @@ def pcb_manage(request):
             pcb_id = request.POST.get('pcb_id')
             pcb = get_object_or_404(PCB, id=pcb_id)
             pcb_serial = pcb.serial_number
-            pcb.delete()
+            # The post_delete signals adjust the counters; commit them with the delete
+            with transaction.atomic():
+                pcb.delete()
             messages.success(request, f'PCB {pcb_serial} deleted successfully!')
             return redirect('pcb_manage')
             
+        elif 'bulk_create' in request.POST:
+            # Handle creating a whole serial range of PCBs at once
+            form = PCBCreateForm()
+            bulk_form = PCBBulkCreateForm(request.POST)
+            if bulk_form.is_valid():
+                try:
+                    created = bulk_form.save()
+                except ValidationError as e:
+                    bulk_form.add_error(None, e)
+                else:
+                    messages.success(request, f'{created} PCBs created successfully in batch {bulk_form.cleaned_data["batch"].batch_number}!')
+                    return redirect('pcb_manage')
+            
         else:
             # Handle creating a new PCB
             form = PCBCreateForm(request.POST)
+            bulk_form = PCBBulkCreateForm()
             if form.is_valid():
-                pcb = form.save()
+                with transaction.atomic():
+                    pcb = form.save()
                 messages.success(request, f'PCB {pcb.serial_number} created successfully!')
                 return redirect('pcb_manage')
             else:
@@ -519,6 +975,7 @@ def pcb_manage(request):
                 pass
     else:
         form = PCBCreateForm()
+        bulk_form = PCBBulkCreateForm()
         # Force refresh the form's querysets to ensure dropdowns have options
         # Use unfiltered queries to bypass any potential permission filtering
         form.fields['batch'].queryset = Batch.objects.all().distinct()
@@ -528,38 +985,58 @@ def pcb_manage(request):
     search_query = request.GET.get('search', '')
     
     # Get all PCBs with optional search filtering
-    pcbs = PCB.objects.all().select_related('batch', 'batch__pcb_type', 'test_config').order_by('-created_at')
+    pcbs = PCB.objects.all().select_related('batch', 'batch__pcb_type', 'test_config').order_by('-created_at', '-id')
     
     if search_query:
-        pcbs = pcbs.filter(
-            models.Q(serial_number__icontains=search_query) |
-            models.Q(batch__batch_number__icontains=search_query) |
-            models.Q(batch__pcb_type__name__icontains=search_query) |
-            models.Q(test_config__name__icontains=search_query)
-        )
+        pcbs = search_pcbs(search_query, pcbs)
     
     # Add pagination
-    paginator = Paginator(pcbs, 20)  # Show 20 PCBs per page
-    page_number = request.GET.get('page')
-    pcbs_page = paginator.get_page(page_number)
-    
-    # Add batch and test config querysets explicitly for template use
-    all_batches = Batch.objects.all()
-    all_test_configs = TestConfig.objects.all()
+    pcbs_page = paginate(request, pcbs, 20)  # Show 20 PCBs per page
+    for pcb in pcbs_page:
+        # Managers may move a PCB one step forward or back, nothing else
+        pcb.status_options = pcb_workflow.choices_for(pcb.status, correction=True)
     
     context = {
         'form': form,
+        'bulk_form': bulk_form,
         'pcbs': pcbs_page,
         'search_query': search_query,
-        'all_batches': all_batches,
-        'all_test_configs': all_test_configs,
+        'has_batches': Batch.objects.exists(),
+        # Edit forms are fetched per PCB and fill their dropdowns from this version of the reference data
+        'reference_version': reference_version(),
     }
     return render(request, 'pcb_tracker/pcb_manage.html', context)
 
 
+@login_required
+@user_passes_test(user_can_manage_pcb)
+def pcb_edit_form(request, pcb_id):
+    """Edit form for one PCB, loaded into the pcb_manage edit dialog on demand"""
+    pcb = get_object_or_404(PCB.objects.select_related('batch', 'batch__pcb_type', 'test_config'), id=pcb_id)
+    pcb.status_options = pcb_workflow.choices_for(pcb.status, correction=True)
+    return render(request, 'pcb_tracker/pcb_edit_form.html', {'pcb': pcb})
+
+
+@login_required
+@user_passes_test(user_can_manage_pcb)
+def reference_data_json(request):
+    """
+    Batch and test config options for the PCB edit form. Requested with the
+    current version (?v=...), the response never changes and may be cached
+    by the browser for good; any other request is revalidated every time.
+    """
+    data = reference_data()
+    response = JsonResponse(data)
+    if request.GET.get('v') == data['version']:
+        patch_cache_control(response, private=True, max_age=REFERENCE_BROWSER_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 def user_in_test_config_group(user):
     """Check if user is in test_config_manager group or has equivalent permissions"""
-    return user.groups.filter(name='test_config_manager').exists() or user.is_staff
+    return user_in_group(user, ['test_config_manager']) or user.is_staff
 
 
 @login_required
@@ -567,10 +1044,8 @@ def user_in_test_config_group(user):
 def test_config_manage(request):
     """View for managing test configurations with CRUD operations"""
     # Get all test configs and paginate them
-    test_configs = TestConfig.objects.all().order_by('-created_at')
-    paginator = Paginator(test_configs, 10)  # Show 10 configs per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    test_configs = TestConfig.objects.all().order_by('-created_at', '-id')
+    page_obj = paginate(request, test_configs, 10)  # Show 10 configs per page
     
     context = {
         'test_configs': page_obj,
@@ -0,0 +1,109 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .models import PCB, Module
+from .counters import adjust_counters
+
+
+class TransitionError(Exception):
+    """Raised when a status change is not allowed by the workflow graph"""
+
+
+class Workflow:
+    """
+    Status transition engine for a model with an ordered STATUS_CHOICES list.
+
+    The graph is built from the order of the choices: every status can move
+    forward to the next one. A manager correction may also move it back one
+    step. Every transition, single or bulk, is a single conditional
+    UPDATE ... WHERE status = <from>, so two stations racing on the same
+    rows can never both succeed and no update is lost.
+
+    The status counters of the entity are moved in the same transaction.
+    When type_field is set, one UPDATE is issued per PCB type among the rows
+    so the counters know exactly how many rows of each type changed.
+    """
+    def __init__(self, model, choices, entity, type_field=None, timestamp_field=None):
+        self.model = model
+        self.entity = entity
+        self.type_field = type_field
+        self.statuses = [value for value, label in choices]
+        self.labels = dict(choices)
+        self.timestamp_field = timestamp_field
+        self.forward = {status: set() for status in self.statuses}
+        self.backward = {status: set() for status in self.statuses}
+        for previous, following in zip(self.statuses, self.statuses[1:]):
+            self.forward[previous].add(following)
+            self.backward[following].add(previous)
+
+    def allowed(self, from_status, correction=False):
+        """Return the statuses that from_status may move to"""
+        allowed = set(self.forward.get(from_status, ()))
+        if correction:
+            allowed |= self.backward.get(from_status, set())
+        return allowed
+
+    def choices_for(self, from_status, correction=False):
+        """Return (value, label) choices for the current status and its allowed targets, in workflow order"""
+        allowed = self.allowed(from_status, correction) | {from_status}
+        return [(status, self.labels[status]) for status in self.statuses if status in allowed]
+
+    def check(self, from_status, to_status, correction=False):
+        if to_status not in self.labels:
+            raise TransitionError(f'Unknown status "{to_status}".')
+        if to_status not in self.allowed(from_status, correction):
+            raise TransitionError(
+                f'Cannot change status from "{self.labels.get(from_status, from_status)}" '
+                f'to "{self.labels[to_status]}".'
+            )
+
+    def bulk_transition(self, objects, from_status, to_status, correction=False):
+        """
+        Move every row of a queryset (or iterable of primary keys) that is
+        still in from_status to to_status with one conditional UPDATE
+        (per PCB type) and move the status counters along. Returns the number of rows that actually changed.
+        """
+        self.check(from_status, to_status, correction)
+        if not isinstance(objects, QuerySet):
+            objects = self.model.objects.filter(pk__in=list(objects))
+        objects = objects.filter(status=from_status)
+        fields = {'status': to_status}
+        if self.timestamp_field:
+            # update() skips auto_now, so keep the timestamp in step by hand
+            fields[self.timestamp_field] = timezone.now()
+
+        with transaction.atomic():
+            if self.type_field is None:
+                groups = [(None, objects)]
+            else:
+                type_ids = objects.order_by().values_list(self.type_field, flat=True).distinct()
+                groups = [
+                    (type_id, objects.filter(**{self.type_field: type_id} if type_id is not None else {f'{self.type_field}__isnull': True}))
+                    for type_id in type_ids
+                ]
+            changed = 0
+            deltas = Counter()
+            for type_id, rows in groups:
+                updated = rows.update(**fields)
+                deltas[(type_id, from_status)] -= updated
+                deltas[(type_id, to_status)] += updated
+                changed += updated
+            adjust_counters(self.entity, deltas)
+        return changed
+
+    def transition(self, obj, to_status, correction=False):
+        """
+        Move a single instance from its current status to to_status.
+        Returns 1 on success, or 0 if another user changed its status first.
+        """
+        changed = self.bulk_transition(self.model.objects.filter(pk=obj.pk), obj.status, to_status, correction)
+        if changed:
+            obj.status = to_status
+        return changed
+
+
+pcb_workflow = Workflow(PCB, PCB.STATUS_CHOICES, 'pcb', type_field='batch__pcb_type', timestamp_field='updated_at')
+module_workflow = Workflow(Module, Module.STATUS_CHOICES, 'module')